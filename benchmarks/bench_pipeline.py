@@ -0,0 +1,351 @@
+"""Throughput benchmarks for the subtitle cleaning pipeline."""
+
+"""
+Subscleaner.
+Copyright (C) 2023 Roger Gonzalez
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import pathlib
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import pysrt
+
+from src.subscleaner import __version__
+from src.subscleaner.hashing import HASH_ALGORITHMS
+from src.subscleaner.subscleaner import (
+    contains_ad,
+    get_encoding,
+    get_file_hash,
+    process_subtitle_files,
+    remove_ad_lines,
+)
+
+DIALOGUE = [
+    "Where were you last night?",
+    "I told you, I was at the office.",
+    "- Are you sure about this?\n- Absolutely.",
+    "We need to leave before sunrise.",
+    "Café, crème brûlée y una canción para el camino.",
+    "Don't look back. Whatever happens, don't look back.",
+    "The meeting has been moved to Thursday.",
+    "¿Dónde está la estación de tren?",
+    "He said he'd call, but he never did.",
+    "<i>Previously on the show...</i>",
+]
+
+ADS = [
+    "Subtitles by OpenSubtitles.org",
+    "Support us and become VIP member\nto remove all ads from www.OpenSubtitles.org",
+    "Sync and corrections by n17t01\nwww.addic7ed.com",
+    "Subtítulos por aRGENTeaM",
+    "Advertise your product or brand here\ncontact www.OpenSubtitles.org today",
+]
+
+
+def parse_encoding_mix(value):
+    """
+    Parse an encoding mix such as ``utf-8:0.7,cp1252:0.3``.
+
+    Args:
+        value (str): Comma-separated ``encoding:weight`` pairs. A missing weight counts as 1.
+
+    Returns:
+        list[tuple[str, float]]: The encodings and their weights.
+    """
+    mix = []
+    for item in value.split(","):
+        encoding, _, weight = item.partition(":")
+        mix.append((encoding.strip(), float(weight) if weight else 1.0))
+    return mix
+
+
+def generate_subtitle(rng, cues, with_ads):
+    """
+    Generate the text of a synthetic SRT file.
+
+    Args:
+        rng (random.Random): The random generator.
+        cues (int): Number of cues in the file.
+        with_ads (bool): If True, an ad cue is placed at the start and at the end.
+
+    Returns:
+        str: The SRT content.
+    """
+    texts = [rng.choice(DIALOGUE) for _ in range(cues)]
+    if with_ads:
+        texts[0] = rng.choice(ADS)
+        texts[-1] = rng.choice(ADS)
+
+    blocks = []
+    for index, text in enumerate(texts):
+        start = index * 3000
+        blocks.append(f"{index + 1}\n{_timestamp(start)} --> {_timestamp(start + 2500)}\n{text}\n")
+    return "\n".join(blocks)
+
+
+def _timestamp(milliseconds):
+    """Format milliseconds as an SRT timestamp."""
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02}:{minutes:02}:{seconds:02},{milliseconds:03}"
+
+
+def generate_corpus(directory, files, cues, encoding_mix, ad_density, seed=0):
+    """
+    Write a synthetic subtitle corpus.
+
+    Args:
+        directory (pathlib.Path): Where to write the files, grouped in season-like folders.
+        files (int): Number of subtitle files.
+        cues (int): Number of cues per file.
+        encoding_mix (list[tuple[str, float]]): Encodings and their relative weights.
+        ad_density (float): Fraction of files containing ads.
+        seed (int): Seed for the random generator, so corpora are reproducible.
+
+    Returns:
+        list[str]: The paths of the generated files.
+    """
+    rng = random.Random(seed)
+    encodings = [encoding for encoding, _ in encoding_mix]
+    weights = [weight for _, weight in encoding_mix]
+
+    paths = []
+    for index in range(files):
+        folder = directory / f"Show {index // 200:04}" / f"Season {index // 20 % 10 + 1:02}"
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"episode_{index:06}.srt"
+        content = generate_subtitle(rng, cues, rng.random() < ad_density)
+        encoding = rng.choices(encodings, weights)[0]
+        path.write_bytes(content.encode(encoding, errors="replace"))
+        paths.append(str(path))
+    return paths
+
+
+def measure(function, repeat):
+    """
+    Time a function several times.
+
+    Args:
+        function (Callable[[], object]): The function to time.
+        repeat (int): Number of runs.
+
+    Returns:
+        dict: The best and median wall-clock time in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"best": min(timings), "median": statistics.median(timings), "runs": repeat}
+
+
+def _result(timing, items, unit):
+    """Attach per-item figures to a timing."""
+    timing["items"] = items
+    timing["unit"] = unit
+    timing["per_item_us"] = timing["best"] / items * 1_000_000 if items else None
+    timing["items_per_second"] = items / timing["best"] if timing["best"] else None
+    return timing
+
+
+def run_benchmarks(corpus, paths, repeat, jobs):
+    """
+    Run every benchmark against a generated corpus.
+
+    Args:
+        corpus (pathlib.Path): The directory holding the pristine corpus.
+        paths (list[str]): The subtitle files in the corpus.
+        repeat (int): Number of runs per benchmark.
+        jobs (int): Worker processes used for the end-to-end runs.
+
+    Returns:
+        dict: The timing of each benchmark, by name.
+    """
+    subtitles = [pysrt.open(path, encoding=get_encoding(pathlib.Path(path))) for path in paths]
+    cue_texts = [cue.text for subtitle in subtitles for cue in subtitle]
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        results["contains_ad"] = _result(
+            measure(lambda: [contains_ad(text) for text in cue_texts], repeat),
+            len(cue_texts),
+            "cue",
+        )
+        results["remove_ad_lines"] = _result(
+            _measure_remove_ad_lines(subtitles, repeat),
+            len(subtitles),
+            "file",
+        )
+        results["get_encoding"] = _result(
+            measure(lambda: [get_encoding(pathlib.Path(path)) for path in paths], repeat),
+            len(paths),
+            "file",
+        )
+        results["get_file_hash"] = _result(
+            measure(lambda: [get_file_hash(pathlib.Path(path)) for path in paths], repeat),
+            len(paths),
+            "file",
+        )
+        for algorithm in sorted(HASH_ALGORITHMS):
+            results[f"get_file_hash[{algorithm}]"] = _result(
+                measure(
+                    lambda algorithm=algorithm: [get_file_hash(pathlib.Path(path), algorithm) for path in paths],
+                    repeat,
+                ),
+                len(paths),
+                "file",
+            )
+        cold, warm = _measure_end_to_end(corpus, repeat, jobs)
+        results["process_subtitle_files_cold"] = _result(cold, len(paths), "file")
+        results["process_subtitle_files_warm"] = _result(warm, len(paths), "file")
+    return results
+
+
+def _measure_remove_ad_lines(sources, repeat):
+    """Time remove_ad_lines on fresh copies of the parsed subtitles, excluding the copying."""
+    timings = []
+    for _ in range(repeat):
+        copies = [pysrt.SubRipFile(items=list(source)) for source in sources]
+        start = time.perf_counter()
+        for subtitle in copies:
+            remove_ad_lines(subtitle)
+        timings.append(time.perf_counter() - start)
+    return {"best": min(timings), "median": statistics.median(timings), "runs": repeat}
+
+
+def _measure_end_to_end(corpus, repeat, jobs):
+    """Time process_subtitle_files on a copy of the corpus with an empty database, then again with a warm one."""
+    cold_timings = []
+    warm_timings = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="subscleaner-bench-") as work_dir:
+            work_corpus = pathlib.Path(work_dir) / "corpus"
+            shutil.copytree(corpus, work_corpus)
+            work_paths = sorted(str(path) for path in work_corpus.rglob("*.srt"))
+            db_path = pathlib.Path(work_dir) / "bench.db"
+
+            start = time.perf_counter()
+            process_subtitle_files(work_paths, db_path, jobs=jobs)
+            cold_timings.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            process_subtitle_files(work_paths, db_path, jobs=jobs)
+            warm_timings.append(time.perf_counter() - start)
+
+    return (
+        {"best": min(cold_timings), "median": statistics.median(cold_timings), "runs": repeat},
+        {"best": min(warm_timings), "median": statistics.median(warm_timings), "runs": repeat},
+    )
+
+
+def print_report(report, baseline=None):
+    """
+    Print the benchmark results, with the change against a baseline report if given.
+
+    Args:
+        report (dict): The benchmark report.
+        baseline (dict, optional): An earlier report to compare against.
+    """
+    header = f"{'benchmark':<30} {'best (s)':>10} {'median (s)':>11} {'per item (us)':>14}"
+    if baseline:
+        header += f" {'vs baseline':>12}"
+    print(header)
+
+    for name, result in report["results"].items():
+        line = f"{name:<30} {result['best']:>10.4f} {result['median']:>11.4f} {result['per_item_us'] or 0:>14.1f}"
+        previous = (baseline or {}).get("results", {}).get(name)
+        if previous:
+            line += f" {previous['best'] / result['best']:>11.2f}x"
+        print(line)
+
+
+def _parse_args(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark the subscleaner pipeline on a synthetic corpus.")
+    parser.add_argument("--files", type=int, default=500, help="Number of subtitle files (default: 500)")
+    parser.add_argument("--cues", type=int, default=600, help="Number of cues per file (default: 600)")
+    parser.add_argument(
+        "--encodings",
+        type=parse_encoding_mix,
+        default=parse_encoding_mix("utf-8:0.6,cp1252:0.3,utf-16:0.1"),
+        help="Encoding mix as encoding:weight pairs (default: utf-8:0.6,cp1252:0.3,utf-16:0.1)",
+    )
+    parser.add_argument(
+        "--ad-density",
+        type=float,
+        default=0.05,
+        help="Fraction of files containing ads (default: 0.05)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark (default: 3)")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes for the end-to-end runs (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the corpus generator (default: 0)")
+    parser.add_argument("--output", type=pathlib.Path, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=pathlib.Path, help="Compare against results saved by an earlier run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Generate a corpus, run the benchmarks and report the results."""
+    args = _parse_args(argv)
+    parameters = {
+        "files": args.files,
+        "cues": args.cues,
+        "encodings": dict(args.encodings),
+        "ad_density": args.ad_density,
+        "repeat": args.repeat,
+        "jobs": args.jobs,
+        "seed": args.seed,
+    }
+
+    with tempfile.TemporaryDirectory(prefix="subscleaner-corpus-") as corpus_dir:
+        corpus = pathlib.Path(corpus_dir)
+        paths = generate_corpus(corpus, args.files, args.cues, args.encodings, args.ad_density, args.seed)
+        results = run_benchmarks(corpus, paths, args.repeat, args.jobs)
+
+    report = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "parameters": parameters,
+        "results": results,
+    }
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    if baseline and baseline.get("parameters") != parameters:
+        print("Warning: the baseline was run with different parameters", file=sys.stderr)
+    print_report(report, baseline)
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
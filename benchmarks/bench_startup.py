@@ -0,0 +1,181 @@
+"""Cold-start benchmarks for the subscleaner command line entry points."""
+
+"""
+Subscleaner.
+Copyright (C) 2023 Roger Gonzalez
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.subscleaner import __version__
+
+SOURCE_DIR = pathlib.Path(__file__).resolve().parent.parent / "src"
+
+CLEAN_SRT = "1\n00:00:01,000 --> 00:00:03,000\nWhere were you last night?\n"
+
+
+def cli_paths(work_dir):
+    """
+    Get the command line invocations to time.
+
+    Args:
+        work_dir (pathlib.Path): A scratch directory for the database and the subtitle file.
+
+    Returns:
+        dict: The arguments of each entry point and the stdin fed to it, by name.
+    """
+    db = ["--db-location", str(work_dir / "bench.db")]
+    subtitle_file = work_dir / "episode.srt"
+    subtitle_file.write_text(CLEAN_SRT)
+    main = ["-m", "subscleaner.subscleaner"]
+    return {
+        "version": ([*main, "--version"], ""),
+        "help": ([*main, "--help"], ""),
+        "list_patterns": ([*main, *db, "--list-patterns"], ""),
+        "no_input": ([*main, *db], ""),
+        "one_processed_file": ([*main, *db], f"{subtitle_file}\n"),
+        "client": (["-m", "subscleaner.client", "--socket", str(work_dir / "missing.sock"), "a.srt"], ""),
+    }
+
+
+def _run(arguments, stdin, environment, import_time=False):
+    """Run an entry point in a fresh interpreter and return its stderr."""
+    command = [sys.executable, *(["-X", "importtime"] if import_time else []), *arguments]
+    return subprocess.run(command, input=stdin, capture_output=True, text=True, env=environment, check=False).stderr
+
+
+def import_seconds(stderr):
+    """
+    Sum the top-level imports reported by ``-X importtime``.
+
+    Args:
+        stderr (str): The standard error of a run with ``-X importtime``.
+
+    Returns:
+        float: The cumulative import time of the modules imported directly by the interpreter, in seconds.
+    """
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented under the module that imported them
+        if not name[1:].startswith(" ") and cumulative.strip().isdigit():
+            total += int(cumulative)
+    return total / 1_000_000
+
+
+def measure_startup(arguments, stdin, repeat, environment):
+    """
+    Time an entry point from interpreter start to exit.
+
+    Args:
+        arguments (list[str]): The interpreter arguments.
+        stdin (str): The standard input fed to the process.
+        repeat (int): Number of runs.
+        environment (dict): The environment of the process.
+
+    Returns:
+        dict: The best and median wall-clock time and the import time, in seconds.
+    """
+    # A first run writes the bytecode caches, which every real invocation but the first gets to use
+    _run(arguments, stdin, environment)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _run(arguments, stdin, environment)
+        timings.append(time.perf_counter() - start)
+    return {
+        "best": min(timings),
+        "median": statistics.median(timings),
+        "runs": repeat,
+        "import": import_seconds(_run(arguments, stdin, environment, import_time=True)),
+    }
+
+
+def print_report(report, baseline=None):
+    """
+    Print the benchmark results, with the change against a baseline report if given.
+
+    Args:
+        report (dict): The benchmark report.
+        baseline (dict, optional): An earlier report to compare against.
+    """
+    header = f"{'entry point':<20} {'best (ms)':>10} {'median (ms)':>12} {'imports (ms)':>13}"
+    if baseline:
+        header += f" {'vs baseline':>12}"
+    print(header)
+
+    for name, result in report["results"].items():
+        line = f"{name:<20} {result['best'] * 1000:>10.1f} {result['median'] * 1000:>12.1f}"
+        line += f" {result['import'] * 1000:>13.1f}"
+        previous = (baseline or {}).get("results", {}).get(name)
+        if previous:
+            line += f" {previous['best'] / result['best']:>11.2f}x"
+        print(line)
+
+
+def _parse_args(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark the start-up time of the subscleaner entry points.")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per entry point (default: 20)")
+    parser.add_argument("--output", type=pathlib.Path, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=pathlib.Path, help="Compare against results saved by an earlier run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Time every entry point and report the results."""
+    args = _parse_args(argv)
+    # Import the package the way an installed copy is imported
+    environment = dict(os.environ, PYTHONPATH=str(SOURCE_DIR))
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    with tempfile.TemporaryDirectory(prefix="subscleaner-startup-") as work_dir:
+        results = {
+            name: measure_startup(arguments, stdin, args.repeat, environment)
+            for name, (arguments, stdin) in cli_paths(pathlib.Path(work_dir)).items()
+        }
+
+    report = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "parameters": {"repeat": args.repeat},
+        "results": results,
+    }
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_report(report, baseline)
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Thin client submitting subtitle files to a running subscleaner server."""
+
+"""
+Subscleaner.
+Copyright (C) 2023 Roger Gonzalez
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Only the standard library modules needed to talk to the server are imported here,
+# so a download-manager hook pays for a bare interpreter start and nothing more.
+import argparse
+import json
+import os
+import socket
+import sys
+from typing import Iterator
+
+# tempfile.gettempdir() would pull in random and shutil, for a directory that is nearly always one of these
+DEFAULT_SOCKET_PATH = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR") or "/tmp",  # noqa: S108
+    "subscleaner.sock",
+)
+
+STATUS_MODIFIED = "modified"
+STATUS_CLEAN = "clean"
+STATUS_UNCHANGED = "unchanged"
+STATUS_MISSING = "missing"
+STATUS_FAILED = "failed"
+
+
+class ServerError(Exception):
+    """The server rejected a request."""
+
+
+def submit(paths, socket_path=DEFAULT_SOCKET_PATH, force=False) -> Iterator[dict]:
+    """
+    Have a running server clean subtitle files.
+
+    Args:
+        paths (Iterable[str]): The subtitle files. Relative paths are resolved against the current directory.
+        socket_path (str): The server's socket.
+        force (bool): If True, process the files even if they have been processed before.
+
+    Yields:
+        dict: The ``path`` and ``status`` of each file, as the server finishes it.
+
+    Raises:
+        OSError: If the server can't be reached.
+        ServerError: If the server rejected the request.
+    """
+    request = {"paths": [os.path.abspath(path) for path in paths], "force": force}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with sock.makefile("r", encoding="utf-8") as responses:
+            for line in responses:
+                response = json.loads(line)
+                if "error" in response:
+                    raise ServerError(response["error"])
+                if response.get("done"):
+                    return
+                yield response
+    raise ServerError("Connection closed before all files were processed")
+
+
+def _parse_args(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Submit subtitle files to a running subscleaner --serve process.")
+    parser.add_argument("paths", nargs="*", metavar="FILE", help="Subtitle files to clean (default: read from stdin)")
+    parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET_PATH,
+        help=f"The server's socket (default: {DEFAULT_SOCKET_PATH})",
+    )
+    parser.add_argument("--force", action="store_true", help="Process files even if they have been processed before")
+    parser.add_argument(
+        "-0",
+        "--null",
+        action="store_true",
+        help="Read NUL-separated file paths from stdin (as produced by find -print0)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Run the subscleaner-client entry point.
+
+    Prints each file's status. Exits with 1 if a file could not be processed and with 2
+    if the server could not be reached.
+    """
+    args = _parse_args(argv)
+    paths = args.paths
+    if not paths:
+        separator = b"\0" if args.null else b"\n"
+        paths = [os.fsdecode(path) for path in sys.stdin.buffer.read().split(separator) if path.strip()]
+
+    failed = False
+    try:
+        for result in submit(paths, args.socket, args.force):
+            print(f"{result['status']}: {result['path']}")
+            failed = failed or result["status"] in (STATUS_MISSING, STATUS_FAILED)
+    except (OSError, ServerError) as e:
+        print(f"Error talking to subscleaner server at {args.socket}: {e}", file=sys.stderr)
+        sys.exit(2)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
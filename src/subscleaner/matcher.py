@@ -0,0 +1,270 @@
+"""Single-pass advertisement matcher."""
+
+"""
+Subscleaner.
+Copyright (C) 2023 Roger Gonzalez
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import json
+import re
+from typing import Optional
+
+_OPTIONAL_QUANTIFIERS = "?*"
+_RUN_BREAKERS = ".^$+"
+# Escapes followed by an argument (\x41, \u00ed, \N{...}, \101), whose length is not fixed
+_ESCAPE_WITH_ARGUMENT = re.compile(r"\\[xuUN0-9]")
+# Constructs whose result depends on where the matched text sits in a larger string
+_CONTEXT_SENSITIVE = ("^", "$", "\\A", "\\Z", "(?=", "(?!", "(?<=", "(?<!")
+# Characters re.IGNORECASE matches with one that str.lower() doesn't turn them into (e.g. "ſ"
+# with "s"), folded into it on both sides of the prefilter. "İ" also lowers to two characters.
+_CASE_FOLDS = str.maketrans(
+    {
+        "\u0130": "i",  # LATIN CAPITAL LETTER I WITH DOT ABOVE
+        "\u0131": "i",  # LATIN SMALL LETTER DOTLESS I
+        "\u017f": "s",  # LATIN SMALL LETTER LONG S
+        "\u212a": "k",  # KELVIN SIGN
+        "\u00b5": "\u03bc",  # MICRO SIGN
+        "\u0345": "\u03b9",  # COMBINING GREEK YPOGEGRAMMENI
+        "\u1fbe": "\u03b9",  # GREEK PROSGEGRAMMENI
+        "\u0390": "\u1fd3",  # GREEK SMALL LETTER IOTA WITH DIALYTIKA AND TONOS
+        "\u03b0": "\u1fe3",  # GREEK SMALL LETTER UPSILON WITH DIALYTIKA AND TONOS
+        "\u03c2": "\u03c3",  # GREEK SMALL LETTER FINAL SIGMA
+        "\u03d0": "\u03b2",  # GREEK BETA SYMBOL
+        "\u03d1": "\u03b8",  # GREEK THETA SYMBOL
+        "\u03d5": "\u03c6",  # GREEK PHI SYMBOL
+        "\u03d6": "\u03c0",  # GREEK PI SYMBOL
+        "\u03f0": "\u03ba",  # GREEK KAPPA SYMBOL
+        "\u03f1": "\u03c1",  # GREEK RHO SYMBOL
+        "\u03f5": "\u03b5",  # GREEK LUNATE EPSILON SYMBOL
+        "\u1c80": "\u0432",  # CYRILLIC SMALL LETTER ROUNDED VE
+        "\u1c81": "\u0434",  # CYRILLIC SMALL LETTER LONG-LEGGED DE
+        "\u1c82": "\u043e",  # CYRILLIC SMALL LETTER NARROW O
+        "\u1c83": "\u0441",  # CYRILLIC SMALL LETTER WIDE ES
+        "\u1c84": "\u0442",  # CYRILLIC SMALL LETTER TALL TE
+        "\u1c85": "\u0442",  # CYRILLIC SMALL LETTER THREE-LEGGED TE
+        "\u1c86": "\u044a",  # CYRILLIC SMALL LETTER TALL HARD SIGN
+        "\u1c87": "\u0463",  # CYRILLIC SMALL LETTER TALL YAT
+        "\u1c88": "\ua64b",  # CYRILLIC SMALL LETTER UNBLENDED UK
+        "\u1e9b": "\u1e61",  # LATIN SMALL LETTER LONG S WITH DOT ABOVE
+        "\ufb05": "\ufb06",  # LATIN SMALL LIGATURE LONG S T
+    },
+)
+
+
+def _fold_case(text: str) -> str:
+    """Lowercase text so that characters re.IGNORECASE treats as equal come out the same."""
+    if not text.isascii():
+        text = text.translate(_CASE_FOLDS)
+    return text.lower()
+
+
+def _skip_class(source: str, index: int) -> int:
+    """Return the index just after the character class starting at ``index``."""
+    index += 1
+    if index < len(source) and source[index] == "^":
+        index += 1
+    if index < len(source) and source[index] == "]":
+        index += 1
+    while index < len(source) and source[index] != "]":
+        index += 2 if source[index] == "\\" else 1
+    return index + 1
+
+
+def _skip_group(source: str, index: int) -> int:
+    """Return the index just after the group starting at ``index``."""
+    depth = 0
+    while index < len(source):
+        char = source[index]
+        if char == "\\":
+            index += 2
+            continue
+        if char == "[":
+            index = _skip_class(source, index)
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        index += 1
+    return index
+
+
+def required_literal(pattern: re.Pattern) -> str:
+    """
+    Extract the longest literal substring every match of the pattern must contain.
+
+    The extraction is deliberately conservative: groups, character classes and
+    optional characters are never part of the literal, and patterns using
+    alternation, verbose mode or escapes taking an argument (character codes, names
+    and backreferences) yield an empty string (no prefilter).
+
+    Args:
+        pattern (re.Pattern): The compiled pattern.
+
+    Returns:
+        str: The required literal, or an empty string if none could be derived.
+    """
+    source = pattern.pattern
+    if (
+        not isinstance(source, str)
+        or pattern.flags & re.VERBOSE
+        or "|" in source
+        or _ESCAPE_WITH_ARGUMENT.search(source)
+    ):
+        return ""
+
+    best = ""
+    run = []
+    index = 0
+    while index < len(source):
+        char = source[index]
+        if char == "\\":
+            escaped = source[index + 1 : index + 2]
+            if escaped and not escaped.isalnum():
+                run.append(escaped)
+            else:
+                best = max(best, "".join(run), key=len)
+                run = []
+            index += 2
+            continue
+        if char in "[(":
+            best = max(best, "".join(run), key=len)
+            run = []
+            index = _skip_class(source, index) if char == "[" else _skip_group(source, index)
+            continue
+        if char in _OPTIONAL_QUANTIFIERS or char == "{":
+            if run:
+                run.pop()
+            best = max(best, "".join(run), key=len)
+            run = []
+            if char == "{":
+                closing = source.find("}", index)
+                index = len(source) if closing == -1 else closing
+        elif char in _RUN_BREAKERS:
+            best = max(best, "".join(run), key=len)
+            run = []
+        else:
+            run.append(char)
+        index += 1
+
+    return max(best, "".join(run), key=len)
+
+
+def pattern_key(pattern: re.Pattern) -> tuple:
+    """
+    Identify a pattern by its source and flags.
+
+    Args:
+        pattern (re.Pattern): The compiled pattern.
+
+    Returns:
+        tuple[str, int]: The pattern source and flags.
+    """
+    return pattern.pattern, int(pattern.flags)
+
+
+def pattern_set_fingerprint(patterns) -> str:
+    """
+    Compute a digest identifying a set of patterns, regardless of their order.
+
+    Args:
+        patterns (Iterable[re.Pattern]): The compiled patterns.
+
+    Returns:
+        str: The hex digest of the pattern set.
+    """
+    keys = sorted(pattern_key(pattern) for pattern in patterns)
+    return hashlib.sha256(json.dumps(keys).encode("utf-8")).hexdigest()
+
+
+def is_context_free(pattern: re.Pattern) -> bool:
+    """
+    Check if the pattern matches a line-delimited text the same way inside a larger document.
+
+    Anchors and lookarounds can see past the start or end of the text, so a pattern
+    using them might match a cue on its own but not the same cue inside the whole file.
+    Word boundaries are fine, since the text is surrounded by line breaks.
+    The check is textual and errs on the side of returning False.
+
+    Args:
+        pattern (re.Pattern): The compiled pattern.
+
+    Returns:
+        bool: True if every match in the text is also a match in the document, False otherwise.
+    """
+    source = pattern.pattern
+    return isinstance(source, str) and not any(construct in source for construct in _CONTEXT_SENSITIVE)
+
+
+class AdMatcher:
+    """
+    Match text against a whole set of ad patterns at once.
+
+    Every pattern is reduced to a literal it requires. A text is only handed to
+    a pattern's regular expression when that literal occurs in it, so the common
+    case of a clean cue costs a handful of C-level substring scans instead of one
+    regex search per pattern.
+
+    When every pattern is context free, ``context_free`` is True and a whole
+    document can be searched at once: if nothing matches it, nothing matches any
+    of its lines either.
+    """
+
+    def __init__(self, patterns):
+        """
+        Build the matcher.
+
+        Args:
+            patterns (list[re.Pattern]): The compiled ad patterns, in priority order.
+        """
+        self.patterns = list(patterns)
+        self.context_free = all(is_context_free(pattern) for pattern in self.patterns)
+        self._entries = []
+        for pattern in self.patterns:
+            ignore_case = bool(pattern.flags & re.IGNORECASE)
+            literal = required_literal(pattern)
+            self._entries.append((_fold_case(literal) if ignore_case else literal, ignore_case, pattern))
+
+    def __len__(self):
+        """Return the number of patterns in the matcher."""
+        return len(self.patterns)
+
+    def search(self, text: str) -> Optional[re.Pattern]:
+        """
+        Find the first pattern matching the text.
+
+        Args:
+            text (str): The text to be checked.
+
+        Returns:
+            re.Pattern: The first matching pattern, or None if no pattern matches.
+        """
+        folded = None
+        for literal, ignore_case, pattern in self._entries:
+            if literal:
+                if ignore_case:
+                    if folded is None:
+                        folded = _fold_case(text)
+                    if literal not in folded:
+                        continue
+                elif literal not in text:
+                    continue
+            if pattern.search(text):
+                return pattern
+        return None
@@ -0,0 +1,218 @@
+"""Buffered, level-based output of subscleaner runs."""
+
+"""
+Subscleaner.
+Copyright (C) 2023 Roger Gonzalez
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# The logging package would add about 8 ms to every start, for the few features needed here
+import atexit
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import NamedTuple
+
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {INFO: "info", WARNING: "warning", ERROR: "error"}
+
+# Messages kept before they are written, a run cleaning a large file logs one per removed cue
+DEFAULT_BUFFER_SIZE = 256
+# Seconds a message may wait for the buffer to fill up
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+class OutputSettings(NamedTuple):
+    """How messages are written, see configure_output."""
+
+    level: int = INFO
+    json_lines: bool = False
+    buffer_size: int = 1
+
+
+class _Output:
+    """The settings and kept messages of the process."""
+
+    def __init__(self):
+        self.settings = OutputSettings()
+        self.pending = []
+        self.oldest = 0.0
+        self.lock = threading.Lock()
+        # The (level, line) list of capture_output, when messages are being captured
+        self.captured = None
+
+    def add(self, level, line):
+        """Keep a formatted message and write the kept ones if it is time to, with the lock held."""
+        if not self.pending:
+            self.oldest = time.monotonic()
+        self.pending.append(line)
+        if (
+            len(self.pending) >= self.settings.buffer_size
+            or level >= WARNING
+            or time.monotonic() - self.oldest >= DEFAULT_FLUSH_INTERVAL
+        ):
+            self.write_pending()
+
+    def write_pending(self):
+        """Write the kept messages to stdout, with the lock held."""
+        if not self.pending:
+            return
+        # Looked up on every write, so a replaced sys.stdout (e.g. in tests) gets the output
+        sys.stdout.write("\n".join(self.pending) + "\n")
+        sys.stdout.flush()
+        self.pending.clear()
+
+    def discard_pending(self):
+        """Forget the messages a forked process inherited, its parent writes them."""
+        self.pending.clear()
+        self.lock = threading.Lock()
+
+
+_OUTPUT = _Output()
+
+
+def configure_output(level=INFO, json_lines=False, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    Choose which messages are written and how.
+
+    Until this is called, messages of every level are written to stdout as plain text
+    right away, the way print() would.
+
+    Args:
+        level (int): The lowest level written, one of INFO, WARNING or ERROR.
+        json_lines (bool): If True, write each message as a JSON object on its own line,
+            with its time, level, message and any extra fields.
+        buffer_size (int): Number of messages kept before they are written. Messages of
+            level WARNING or above, and messages older than DEFAULT_FLUSH_INTERVAL seconds,
+            are written along with everything kept before them right away.
+    """
+    flush_output()
+    _OUTPUT.settings = OutputSettings(level, json_lines, buffer_size)
+
+
+def output_settings():
+    """
+    Get the current settings, e.g. to apply them in a worker process.
+
+    Returns:
+        OutputSettings: The arguments of the last configure_output call.
+    """
+    return _OUTPUT.settings
+
+
+def is_enabled(level):
+    """
+    Check if messages of a level are written, to skip building the ones that are not.
+
+    Args:
+        level (int): One of INFO, WARNING or ERROR.
+
+    Returns:
+        bool: True if messages of this level are written.
+    """
+    return level >= _OUTPUT.settings.level
+
+
+def log(level, message, **fields):
+    """
+    Write a message, or keep it to be written with the next ones.
+
+    Args:
+        level (int): One of INFO, WARNING or ERROR.
+        message (str): The message.
+        **fields: Extra values included in JSON lines output, e.g. the path of the file the message is about.
+    """
+    settings = _OUTPUT.settings
+    if level < settings.level:
+        return
+
+    if settings.json_lines:
+        entry = {"time": round(time.time(), 3), "level": LEVEL_NAMES[level], "message": message, **fields}
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+    else:
+        line = message
+
+    with _OUTPUT.lock:
+        if _OUTPUT.captured is not None:
+            _OUTPUT.captured.append((level, line))
+        else:
+            _OUTPUT.add(level, line)
+
+
+def info(message, **fields):
+    """Write a message about the normal progress of a run. See log."""
+    log(INFO, message, **fields)
+
+
+def warning(message, **fields):
+    """Write a message about something that was skipped or worked around. See log."""
+    log(WARNING, message, **fields)
+
+
+def error(message, **fields):
+    """Write a message about something that failed. See log."""
+    log(ERROR, message, **fields)
+
+
+@contextlib.contextmanager
+def capture_output():
+    """
+    Capture the messages logged in a block instead of writing them.
+
+    Worker processes use it to hand the messages about a file to the parent process,
+    which writes them in order with its own. If the block raises, the captured messages
+    are written as usual.
+
+    Yields:
+        list[tuple[int, str]]: The level and formatted line of each captured message, see replay_output.
+    """
+    captured = []
+    previous, _OUTPUT.captured = _OUTPUT.captured, captured
+    try:
+        yield captured
+    except BaseException:
+        _OUTPUT.captured = previous
+        replay_output(captured)
+        raise
+    finally:
+        _OUTPUT.captured = previous
+
+
+def replay_output(messages):
+    """
+    Write messages captured by capture_output, or keep them with the next ones.
+
+    Args:
+        messages (list[tuple[int, str]]): The captured messages.
+    """
+    with _OUTPUT.lock:
+        for level, line in messages:
+            _OUTPUT.add(level, line)
+
+
+def flush_output():
+    """Write the messages kept so far."""
+    with _OUTPUT.lock:
+        _OUTPUT.write_pending()
+
+
+atexit.register(flush_output)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_OUTPUT.discard_pending)
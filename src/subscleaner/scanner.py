@@ -0,0 +1,139 @@
+"""Parallel directory scanner."""
+
+"""
+Subscleaner.
+Copyright (C) 2023 Roger Gonzalez
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Iterator
+
+from .output import error
+from .store import RACY_MTIME_WINDOW_NS
+
+DEFAULT_EXTENSIONS = (".srt",)
+DEFAULT_SCAN_THREADS = 8
+
+_DONE = object()
+
+
+class DirectoryScanner:
+    """
+    Find subtitle files by walking directories with several threads.
+
+    When ``previous_dirs`` is given, a directory whose modification time is
+    unchanged since it was recorded is not listed again: its files are assumed
+    to be already processed, and its subdirectories are taken from the record.
+    A directory's mtime only changes when entries are added, removed or renamed
+    in it, so files rewritten in place inside such a directory are not found.
+    """
+
+    def __init__(self, extensions=DEFAULT_EXTENSIONS, threads=DEFAULT_SCAN_THREADS, previous_dirs=None):
+        """
+        Configure the scanner.
+
+        Args:
+            extensions (Iterable[str]): File extensions to report, matched case-insensitively.
+            threads (int): Number of threads listing directories concurrently.
+            previous_dirs (dict, optional): Directory states recorded by an earlier scan, mapping each
+                directory path to its (mtime_ns, subdirectory names). Enables pruning when given.
+        """
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.threads = max(1, threads)
+        self.previous_dirs = previous_dirs
+        self.scanned_dirs = {}
+        self.pruned_dirs = 0
+        self._lock = threading.Lock()
+
+    def scan(self, roots) -> Iterator[str]:
+        """
+        Yield the subtitle files under the given directories as they are found.
+
+        After the iterator is exhausted, ``scanned_dirs`` holds the state of every
+        directory seen, ready to be recorded for the next scan.
+
+        Args:
+            roots (Iterable[str]): The directories to scan.
+
+        Yields:
+            str: The absolute path of each subtitle file found.
+        """
+        pending_dirs = queue.Queue()
+        found = queue.Queue()
+        for root in roots:
+            pending_dirs.put(os.path.abspath(root))
+
+        workers = [
+            threading.Thread(target=self._work, args=(pending_dirs, found), daemon=True) for _ in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        threading.Thread(target=self._finish, args=(pending_dirs, found), daemon=True).start()
+
+        while True:
+            path = found.get()
+            if path is _DONE:
+                return
+            yield path
+
+    def _finish(self, pending_dirs, found):
+        """Stop the workers and signal the end of the scan once every directory has been handled."""
+        pending_dirs.join()
+        for _ in range(self.threads):
+            pending_dirs.put(None)
+        found.put(_DONE)
+
+    def _work(self, pending_dirs, found):
+        """Handle directories from the queue until told to stop."""
+        while True:
+            directory = pending_dirs.get()
+            try:
+                if directory is None:
+                    return
+                self._scan_directory(directory, pending_dirs, found)
+            except Exception as e:
+                error(f"Error scanning {directory}: {e}")
+            finally:
+                pending_dirs.task_done()
+
+    def _scan_directory(self, directory, pending_dirs, found):
+        """List one directory, queueing its subdirectories and reporting its subtitle files."""
+        # Stat before listing, so an entry added during the scan changes the mtime seen next time
+        mtime_ns = os.stat(directory).st_mtime_ns
+        if time.time_ns() - mtime_ns < RACY_MTIME_WINDOW_NS:
+            # Entries may still be added within the same mtime tick, never prune based on it
+            mtime_ns = None
+
+        previous = None if self.previous_dirs is None else self.previous_dirs.get(directory)
+        if previous is not None and mtime_ns is not None and previous[0] == mtime_ns:
+            with self._lock:
+                self.pruned_dirs += 1
+            subdirs = previous[1]
+        else:
+            subdirs = []
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.name.lower().endswith(self.extensions):
+                        found.put(entry.path)
+
+        self.scanned_dirs[directory] = (mtime_ns, subdirs)
+        for name in subdirs:
+            pending_dirs.put(os.path.join(directory, name))
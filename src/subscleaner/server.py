@@ -0,0 +1,127 @@
+"""Resident server cleaning subtitle files submitted over a Unix socket."""
+
+"""
+Subscleaner.
+Copyright (C) 2023 Roger Gonzalez
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import contextlib
+import json
+import os
+import socket
+import socketserver
+
+from .client import STATUS_CLEAN, STATUS_FAILED, STATUS_MISSING, STATUS_MODIFIED, STATUS_UNCHANGED
+
+SOCKET_MODE = 0o660
+CONNECTION_TIMEOUT = 60.0
+
+
+def file_status(stats):
+    """
+    Summarize what happened to a file.
+
+    Args:
+        stats (RunStats): The stats collected while processing that single file.
+
+    Returns:
+        str: One of the client's STATUS_* values.
+    """
+    counters = stats.counters
+    if counters["modified"]:
+        return STATUS_MODIFIED
+    if counters["failed"]:
+        return STATUS_FAILED
+    if counters["files_missing"]:
+        return STATUS_MISSING
+    if counters["skipped_metadata"] or counters["skipped_hardlink"] or counters["skipped_hash"]:
+        return STATUS_UNCHANGED
+    return STATUS_CLEAN
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answer the JSON requests sent on one connection, one per line."""
+
+    timeout = CONNECTION_TIMEOUT
+
+    def handle(self):
+        """Process each request and stream back one result per file."""
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                paths = request["paths"]
+                force = bool(request.get("force", False))
+            except (ValueError, TypeError, KeyError) as e:
+                self._send({"error": f"Invalid request: {e}"})
+                return
+
+            for path in paths:
+                self._send({"path": path, "status": file_status(self.server.clean_file(path, force))})
+            self.server.request_done()
+            self._send({"done": True})
+
+    def _send(self, response):
+        """Write one response line."""
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class CleaningServer(socketserver.UnixStreamServer):
+    """
+    Serve cleaning requests on a Unix socket.
+
+    Requests are handled one at a time in the serving thread, so the callbacks can
+    use a database connection owned by that thread.
+    """
+
+    def __init__(self, socket_path, clean_file, request_done=None):
+        """
+        Bind the socket.
+
+        Args:
+            socket_path (str): Where to create the socket. A stale socket left by a server
+                that is no longer running is replaced.
+            clean_file (Callable[[str, bool], RunStats]): Processes one file, given its path and
+                whether to force processing, and returns the stats collected for it.
+            request_done (Callable[[], None], optional): Called after each request, e.g. to commit
+                the database.
+
+        Raises:
+            OSError: If the socket can't be created or another server is already listening on it.
+        """
+        self.clean_file = clean_file
+        self.request_done = request_done or (lambda: None)
+        super().__init__(socket_path, _RequestHandler)
+
+    def server_bind(self):
+        """Bind the socket, replacing a stale one, with access limited to the owner and group."""
+        if os.path.exists(self.server_address):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(self.server_address)
+                except OSError:
+                    os.unlink(self.server_address)
+                else:
+                    raise OSError(f"Another server is listening on {self.server_address}")
+
+        super().server_bind()
+        os.chmod(self.server_address, SOCKET_MODE)
+
+    def server_close(self):
+        """Close and remove the socket."""
+        super().server_close()
+        with contextlib.suppress(OSError):
+            os.unlink(self.server_address)
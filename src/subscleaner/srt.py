@@ -0,0 +1,199 @@
+"""Locate and remove cue blocks in SRT text without re-serializing it."""
+
+"""
+Subscleaner.
+Copyright (C) 2023 Roger Gonzalez
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+from typing import Iterator, NamedTuple, Optional
+
+TIMESTAMP_SEPARATOR = "-->"
+# Lines are split this many characters at a time, so a huge text is never held as a list of all its lines
+LINE_CHUNK_SIZE = 64 * 1024
+# A line break followed by a blank line, which only ever separates cue blocks
+_BLOCK_SEPARATOR = re.compile(r"\n[^\S\n]*\n")
+
+
+class CueBlock(NamedTuple):
+    """
+    A cue block of an SRT text, located by offsets into that text.
+
+    A block spans its own lines and the blank lines that follow it, so removing
+    the span also removes the separator before the next block.
+    """
+
+    start: int
+    end: int
+    index_start: Optional[int]
+    index_end: Optional[int]
+    text: str
+
+    def source(self, srt_text):
+        """
+        Get the block as it appears in the SRT text, without the blank lines that follow it.
+
+        Args:
+            srt_text (str): The text the block was found in.
+
+        Returns:
+            str: The lines of the block.
+        """
+        return srt_text[self.start : self.end].rstrip()
+
+
+def _iter_lines(srt_text):
+    """Yield the (offset, line) pairs of a text, split as str.splitlines(True) splits it."""
+    offset = 0
+    while offset < len(srt_text):
+        # Cutting right after a "\n" never splits a line break, so the chunks split like the whole text
+        cut = srt_text.find("\n", offset + LINE_CHUNK_SIZE) + 1 or len(srt_text)
+        for line in srt_text[offset:cut].splitlines(True):
+            yield offset, line
+            offset += len(line)
+
+
+def iter_block_chunks(srt_text) -> Iterator[str]:
+    """
+    Split an SRT text in pieces of about LINE_CHUNK_SIZE characters, cut between cue blocks.
+
+    No block is split between two pieces, so a search for the text of any cue finds it
+    in one of them, without a copy of the whole text being made. A text without blank
+    lines is yielded whole.
+
+    Args:
+        srt_text (str): The decoded SRT content.
+
+    Yields:
+        str: The consecutive pieces of the text.
+    """
+    offset = 0
+    while offset < len(srt_text):
+        separator = _BLOCK_SEPARATOR.search(srt_text, offset + LINE_CHUNK_SIZE)
+        cut = separator.start() + 1 if separator else len(srt_text)
+        yield srt_text[offset:cut]
+        offset = cut
+
+
+def _make_block(lines, start, end):
+    """Build a CueBlock from the (offset, line) pairs of a block, or return None if they don't form a cue."""
+    stripped = [line.rstrip() for _, line in lines]
+    if len(stripped) < 2:  # noqa: PLR2004
+        return None
+
+    # Same rules as pysrt: the first line is the index unless it holds the timestamps
+    has_index = TIMESTAMP_SEPARATOR not in stripped[0]
+    if has_index and TIMESTAMP_SEPARATOR not in stripped[1]:
+        return None
+
+    index_start = index_end = None
+    if has_index:
+        offset, line = lines[0]
+        index_start = offset + len(line) - len(line.lstrip())
+        index_end = offset + len(stripped[0])
+    return CueBlock(start, end, index_start, index_end, "\n".join(stripped[2 if has_index else 1 :]))
+
+
+def iter_cue_blocks(srt_text) -> Iterator[CueBlock]:
+    """
+    Locate the cue blocks of an SRT text, one at a time.
+
+    Blocks are split on blank lines and cue text is built the way pysrt builds it
+    (lines stripped of trailing whitespace, joined with newlines), so ad patterns
+    see the same text they would see on a parsed pysrt.SubRipItem. Blocks that
+    are not cues are left out, and stay untouched when blocks are removed.
+
+    Only the lines of the current block are held, so memory use does not grow with
+    the number of cues, and no timing is parsed.
+
+    Args:
+        srt_text (str): The decoded SRT content.
+
+    Yields:
+        CueBlock: Each cue block, in order.
+    """
+    lines = []
+    block_start = end = 0
+    after_block = False
+    for offset, line in _iter_lines(srt_text):
+        if not line.strip():
+            # Blank lines after a block are part of it
+            after_block = bool(lines)
+        else:
+            if after_block:
+                block = _make_block(lines, block_start, offset)
+                if block is not None:
+                    yield block
+                lines = []
+                after_block = False
+            if not lines:
+                block_start = offset
+            lines.append((offset, line))
+        end = offset + len(line)
+
+    if lines:
+        block = _make_block(lines, block_start, end)
+        if block is not None:
+            yield block
+
+
+def find_cue_blocks(srt_text):
+    """
+    Locate the cue blocks of an SRT text. See iter_cue_blocks.
+
+    Args:
+        srt_text (str): The decoded SRT content.
+
+    Returns:
+        list[CueBlock]: The cue blocks, in order.
+    """
+    return list(iter_cue_blocks(srt_text))
+
+
+def remove_cue_blocks(srt_text, blocks, removed):
+    """
+    Remove cue blocks from an SRT text and renumber the remaining cues.
+
+    Everything outside the removed blocks and the renumbered indexes is kept as is,
+    including line endings and blocks that are not cues.
+
+    Args:
+        srt_text (str): The decoded SRT content.
+        blocks (Iterable[CueBlock]): Every cue block of the text, in order, as yielded by iter_cue_blocks.
+            They are consumed one at a time.
+        removed (Iterable[CueBlock]): The blocks to remove.
+
+    Returns:
+        str: The new SRT content.
+    """
+    removed = {block.start for block in removed}
+    pieces = []
+    position = 0
+    number = 0
+    for block in blocks:
+        pieces.append(srt_text[position : block.start])
+        position = block.start
+        if block.start in removed:
+            position = block.end
+            continue
+
+        number += 1
+        if block.index_start is not None and srt_text[block.index_start : block.index_end] != str(number):
+            pieces.append(srt_text[position : block.index_start])
+            pieces.append(str(number))
+            position = block.index_end
+    pieces.append(srt_text[position:])
+    return "".join(pieces)
@@ -0,0 +1,144 @@
+"""Per-stage timers and counters for a cleaning run."""
+
+"""
+Subscleaner.
+Copyright (C) 2023 Roger Gonzalez
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import contextlib
+import json
+import time
+
+STAGES = ["stat", "db_lookup", "read", "hash", "encoding", "prefilter", "parse", "save", "db_write"]
+COUNTERS = [
+    "files_seen",
+    "files_missing",
+    "skipped_metadata",
+    "skipped_hardlink",
+    "skipped_hash",
+    "skipped_duplicate",
+    "skipped_prefilter",
+    "pattern_upgrades",
+    "rehashed",
+    "parsed",
+    "modified",
+    "failed",
+    "cues_removed",
+    "bytes_read",
+    "bytes_written",
+]
+
+
+class RunStats:
+    """
+    Accumulate how long each processing stage takes and what happened to each file.
+
+    Stage times are summed over every file, so with worker processes they add up
+    to more than the run's wall-clock time, which is tracked separately.
+    """
+
+    def __init__(self):
+        """Start with every timer and counter at zero."""
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self.stage_calls = dict.fromkeys(STAGES, 0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.wall_seconds = 0.0
+        # The files counted as failed, e.g. so a scan doesn't record their directories as done
+        self.failed_paths = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Time the enclosed block as part of a stage.
+
+        Args:
+            name (str): One of STAGES.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] += time.perf_counter() - start
+            self.stage_calls[name] += 1
+
+    def add(self, counter, amount=1):
+        """
+        Increase a counter.
+
+        Args:
+            counter (str): One of COUNTERS.
+            amount (int): How much to add.
+        """
+        self.counters[counter] += amount
+
+    def add_failure(self, path):
+        """
+        Count a file that could not be processed.
+
+        Args:
+            path (str or pathlib.Path): The path of the file.
+        """
+        self.counters["failed"] += 1
+        self.failed_paths.append(str(path))
+
+    def merge(self, other):
+        """
+        Add the timers and counters of another RunStats, e.g. one returned by a worker process.
+
+        Args:
+            other (RunStats): The stats to add.
+        """
+        for name in STAGES:
+            self.stage_seconds[name] += other.stage_seconds[name]
+            self.stage_calls[name] += other.stage_calls[name]
+        for name in COUNTERS:
+            self.counters[name] += other.counters[name]
+        self.failed_paths.extend(other.failed_paths)
+
+    def as_dict(self):
+        """
+        Get the stats as plain data.
+
+        Returns:
+            dict: The wall-clock time, the counters and, per stage, its total seconds and call count.
+        """
+        return {
+            "wall_seconds": self.wall_seconds,
+            "counters": dict(self.counters),
+            "stages": {name: {"seconds": self.stage_seconds[name], "calls": self.stage_calls[name]} for name in STAGES},
+        }
+
+    def to_json(self):
+        """Serialize the stats as JSON."""
+        return json.dumps(self.as_dict(), indent=2)
+
+    def format_table(self):
+        """
+        Format the stats as a human-readable summary.
+
+        Returns:
+            str: A table of stage times followed by the counters.
+        """
+        total = sum(self.stage_seconds.values())
+        lines = [f"{'stage':<12} {'seconds':>10} {'share':>7} {'calls':>9}"]
+        for name in STAGES:
+            seconds = self.stage_seconds[name]
+            share = seconds / total * 100 if total else 0.0
+            lines.append(f"{name:<12} {seconds:>10.3f} {share:>6.1f}% {self.stage_calls[name]:>9}")
+        lines.append(f"{'wall clock':<12} {self.wall_seconds:>10.3f}")
+        lines.append("")
+        lines.extend(f"{name:<18} {value:>12}" for name, value in self.counters.items())
+        return "\n".join(lines)
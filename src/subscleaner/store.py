@@ -0,0 +1,907 @@
+"""Persistent storage of processed subtitle files."""
+
+"""
+Subscleaner.
+Copyright (C) 2023 Roger Gonzalez
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import collections
+import contextlib
+import json
+import os
+import pathlib
+import sqlite3
+import time
+from typing import NamedTuple
+
+from .hashing import DEFAULT_HASH_ALGORITHM, LEGACY_HASH_ALGORITHM, format_hash, split_hash
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 5.0
+# Records kept in memory across the directories loaded most recently
+DEFAULT_CACHE_SIZE = 100_000
+# Seconds to wait for another process writing to the database, e.g. a run queueing files for this one
+BUSY_TIMEOUT = 30.0
+
+# Files modified this recently may still change within the same mtime tick, so their
+# mtime is not trusted for the stat-based skip (same idea as git's "racily clean" entries).
+RACY_MTIME_WINDOW_NS = 2_000_000_000
+
+# Each entry upgrades the schema by one version (tracked with PRAGMA user_version).
+MIGRATIONS = [
+    (
+        """
+        CREATE TABLE IF NOT EXISTS processed_files (
+            file_path TEXT PRIMARY KEY,
+            file_hash TEXT NOT NULL,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ),
+    (
+        "ALTER TABLE processed_files ADD COLUMN size INTEGER",
+        "ALTER TABLE processed_files ADD COLUMN mtime_ns INTEGER",
+        "ALTER TABLE processed_files ADD COLUMN inode INTEGER",
+    ),
+    (
+        """
+        CREATE TABLE scanned_dirs (
+            dir_path TEXT PRIMARY KEY,
+            mtime_ns INTEGER,
+            subdirs TEXT NOT NULL
+        )
+        """,
+    ),
+    (
+        """
+        CREATE TABLE pattern_sets (
+            id INTEGER PRIMARY KEY,
+            fingerprint TEXT NOT NULL UNIQUE,
+            patterns TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "ALTER TABLE processed_files ADD COLUMN pattern_set INTEGER",
+        "ALTER TABLE scanned_dirs ADD COLUMN pattern_set INTEGER",
+    ),
+    # Compact layout: directory prefixes are stored once, hex digests as raw bytes
+    (
+        "CREATE TABLE dirs (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE)",
+        """
+        CREATE TABLE files (
+            dir_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            file_hash BLOB NOT NULL,
+            size INTEGER,
+            mtime_ns INTEGER,
+            inode INTEGER,
+            pattern_set INTEGER,
+            processed_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            PRIMARY KEY (dir_id, name)
+        ) WITHOUT ROWID
+        """,
+        # rtrim() with every character of the path but "/" strips the path back to its last "/"
+        "INSERT INTO dirs (path) SELECT DISTINCT rtrim(file_path, replace(file_path, '/', '')) FROM processed_files",
+        """
+        INSERT INTO files
+        SELECT dirs.id, substr(file_path, length(dirs.path) + 1), pack_hash(file_hash), size, mtime_ns, inode,
+            pattern_set, CAST(strftime('%s', processed_at) AS INTEGER)
+        FROM processed_files JOIN dirs ON dirs.path = rtrim(file_path, replace(file_path, '/', ''))
+        """,
+        "DROP TABLE processed_files",
+        "ALTER TABLE files RENAME TO processed_files",
+    ),
+    # Content already known to be clean at one path, or a hardlink to it, is not cleaned again elsewhere
+    (
+        "CREATE INDEX processed_files_hash ON processed_files (file_hash)",
+        "CREATE INDEX processed_files_inode ON processed_files (inode)",
+    ),
+    # NULL for the MD5 hashes recorded before the algorithm could be chosen
+    ("ALTER TABLE processed_files ADD COLUMN hash_algorithm TEXT",),
+    # Files waiting to be processed, in the order they were queued
+    ("CREATE TABLE work_queue (id INTEGER PRIMARY KEY, path TEXT NOT NULL)",),
+    # Files with a higher priority are taken first, those without one last
+    (
+        "ALTER TABLE work_queue ADD COLUMN priority INTEGER",
+        "CREATE INDEX work_queue_order ON work_queue (priority DESC, id)",
+    ),
+    # Inode numbers are only unique within a device, NULL for the files recorded before
+    ("ALTER TABLE processed_files ADD COLUMN device INTEGER",),
+]
+
+# Every recorded hash is that of content left clean by its pattern set, NULL being the current one
+_KNOWN_CLEAN_QUERY = """
+    SELECT 1 FROM processed_files
+    WHERE file_hash = ? AND hash_algorithm IS ? AND (pattern_set IS ? OR pattern_set IS NULL)
+    LIMIT 1
+"""
+
+
+def split_path(file_path):
+    """
+    Split a file path into its directory prefix and its name.
+
+    The prefix keeps its trailing separator, so the two parts join back into the path
+    and paths without a directory get an empty prefix.
+
+    Args:
+        file_path (str): The path to the file.
+
+    Returns:
+        tuple[str, str]: The directory prefix and the file name.
+    """
+    file_path = str(file_path)
+    cut = file_path.rfind("/") + 1
+    return file_path[:cut], file_path[cut:]
+
+
+def _pack_hash(file_hash):
+    """Convert a hex digest to the bytes it encodes, leaving any other hash as is."""
+    try:
+        packed = bytes.fromhex(file_hash)
+    except (TypeError, ValueError):
+        return file_hash
+    return packed if packed.hex() == file_hash else file_hash
+
+
+def _unpack_hash(stored_hash):
+    """Convert a stored hash back to the string it was recorded as."""
+    return stored_hash.hex() if isinstance(stored_hash, bytes) else stored_hash
+
+
+def _hash_columns(file_hash):
+    """Get the (file_hash, hash_algorithm) columns a hash is stored as."""
+    algorithm, hex_digest = split_hash(file_hash)
+    return _pack_hash(hex_digest), None if algorithm == LEGACY_HASH_ALGORITHM else algorithm
+
+
+def _hash_from_columns(stored_hash, algorithm):
+    """Rebuild a hash from its (file_hash, hash_algorithm) columns."""
+    return format_hash(algorithm or LEGACY_HASH_ALGORITHM, _unpack_hash(stored_hash))
+
+
+def _file_size(db_path):
+    """Get the size of a database file and of its write-ahead log, in bytes."""
+    return sum(os.path.getsize(path) for path in (db_path, f"{db_path}-wal") if os.path.exists(path))
+
+
+class ProcessedFile(NamedTuple):
+    """A row of the processed_files table."""
+
+    file_hash: str
+    size: int
+    mtime_ns: int
+    inode: int
+    pattern_set: int = None
+    device: int = None
+
+    def matches_stat(self, stat_result):
+        """
+        Check if the file looks unchanged since it was recorded.
+
+        Args:
+            stat_result (os.stat_result): The current metadata of the file.
+
+        Returns:
+            bool: True if size, mtime and inode all match the recorded values, False otherwise.
+        """
+        return (
+            self.mtime_ns is not None
+            and self.size == stat_result.st_size
+            and self.mtime_ns == stat_result.st_mtime_ns
+            and self.inode == stat_result.st_ino
+        )
+
+
+class GarbageCollection(NamedTuple):
+    """The outcome of ProcessedFilesStore.collect_garbage."""
+
+    files_removed: int
+    dirs_removed: int
+    size_before: int
+    size_after: int
+
+
+class ProcessedFilesStore:
+    """
+    Long-lived handle on the processed files database.
+
+    A single connection is kept open for the whole run. Writes are grouped into
+    transactions that are committed every ``batch_size`` rows or every
+    ``flush_interval`` seconds, whichever comes first, and on ``close``.
+
+    Rows are tagged with the pattern set selected with ``use_pattern_set``, so
+    files cleaned with an older set of ad patterns can be told apart.
+
+    Files are keyed by the id of their directory in the ``dirs`` table and their
+    name, so each directory path is stored once, and hex digests are stored as
+    the bytes they encode. Each row records the algorithm its hash was computed with,
+    so hashes made before ``hash_algorithm`` changed stay valid until the file is read again.
+
+    The first lookup in a directory loads the records of all its files with a single
+    query, and later lookups there are answered from memory. Loaded directories are
+    evicted least recently used first once they hold more than ``cache_size`` records.
+    Input paths normally arrive grouped by directory, so each directory is loaded once.
+    """
+
+    def __init__(
+        self,
+        db_path,
+        batch_size=DEFAULT_BATCH_SIZE,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        cache_size=DEFAULT_CACHE_SIZE,
+        hash_algorithm=DEFAULT_HASH_ALGORITHM,
+    ):
+        """
+        Open the database, creating the schema if needed.
+
+        Args:
+            db_path (pathlib.Path): The path to the database file.
+            batch_size (int): Number of pending writes that triggers a commit.
+            flush_interval (float): Seconds after which pending writes are committed.
+            cache_size (int): Number of records kept in memory.
+            hash_algorithm (str): The algorithm new hashes are computed with, one of HASH_ALGORITHMS.
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self.pattern_set = None
+        self._pattern_sets = {}
+        self._dir_ids = {}
+        self.cache_size = cache_size
+        self.hash_algorithm = hash_algorithm
+        self._dir_records = collections.OrderedDict()
+        self._cached_records = 0
+        # Queue ids of the files taken from the work queue and not finished yet, by path
+        self._taken = {}
+        # Path and priority of the new files taken and not in the queue yet, see take
+        self._unqueued = {}
+
+        self.conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.create_function("pack_hash", 1, _pack_hash, deterministic=True)
+        self._migrate()
+
+    def _migrate(self):
+        """Bring the schema up to the latest version, one migration per transaction."""
+        while self._schema_version() < len(MIGRATIONS):
+            # Take the write lock before reading the version again: another process opening
+            # the database at the same time may have applied this migration in the meantime
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._schema_version()
+                if version < len(MIGRATIONS):
+                    for statement in MIGRATIONS[version]:
+                        self.conn.execute(statement)
+                    self.conn.execute(f"PRAGMA user_version = {version + 1}")
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def _schema_version(self):
+        """Get the number of migrations applied to the database."""
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def __enter__(self):
+        """Return the store itself."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Flush pending writes and close the connection."""
+        self.close()
+
+    def _get_dir_id(self, dir_prefix, create=False):
+        """
+        Get the id of a directory prefix.
+
+        Args:
+            dir_prefix (str): The directory prefix, as returned by split_path.
+            create (bool): If True, register the directory if it is not known yet.
+
+        Returns:
+            int: The id of the directory, or None if it is not known and not created.
+        """
+        dir_id = self._dir_ids.get(dir_prefix)
+        if dir_id is None:
+            row = self.conn.execute("SELECT id FROM dirs WHERE path = ?", (dir_prefix,)).fetchone()
+            if row is None:
+                if not create:
+                    return None
+                row = (self.conn.execute("INSERT INTO dirs (path) VALUES (?)", (dir_prefix,)).lastrowid,)
+            dir_id = self._dir_ids[dir_prefix] = row[0]
+        return dir_id
+
+    def get_record(self, file_path):
+        """
+        Get the stored record of a file.
+
+        Args:
+            file_path (str): The path to the file.
+
+        Returns:
+            ProcessedFile: The stored record, or None if the file has never been processed.
+        """
+        dir_prefix, name = split_path(file_path)
+        row = self._get_dir_records(dir_prefix).get(name)
+        return None if row is None else ProcessedFile(_hash_from_columns(*row[:2]), *row[2:])
+
+    def _get_dir_records(self, dir_prefix):
+        """
+        Get the records of the files of a directory, loading them if they are not in memory.
+
+        Args:
+            dir_prefix (str): The directory prefix, as returned by split_path.
+
+        Returns:
+            dict: Each file name mapped to its stored (file_hash, hash_algorithm, size, mtime_ns, inode,
+            pattern_set, device).
+        """
+        records = self._dir_records.get(dir_prefix)
+        if records is not None:
+            self._dir_records.move_to_end(dir_prefix)
+            return records
+
+        records = {}
+        dir_id = self._get_dir_id(dir_prefix)
+        if dir_id is not None:
+            rows = self.conn.execute(
+                """
+                SELECT name, file_hash, hash_algorithm, size, mtime_ns, inode, pattern_set, device
+                FROM processed_files WHERE dir_id = ?
+                """,
+                (dir_id,),
+            )
+            records = {row[0]: row[1:] for row in rows}
+
+        self._dir_records[dir_prefix] = records
+        self._cached_records += len(records)
+        while self._cached_records > self.cache_size and len(self._dir_records) > 1:
+            _, evicted = self._dir_records.popitem(last=False)
+            self._cached_records -= len(evicted)
+        return records
+
+    def _clear_cache(self):
+        """Forget the records loaded in memory."""
+        self._dir_records.clear()
+        self._cached_records = 0
+
+    def get_hash(self, file_path):
+        """
+        Get the stored hash of a file.
+
+        Args:
+            file_path (str): The path to the file.
+
+        Returns:
+            str: The stored hash, or None if the file has never been processed.
+        """
+        record = self.get_record(file_path)
+        return None if record is None else record.file_hash
+
+    def is_processed(self, file_path, file_hash):
+        """
+        Check if the file has been processed with the given content.
+
+        Args:
+            file_path (str): The path to the file.
+            file_hash (str): The hash of the file content.
+
+        Returns:
+            bool: True if the file was processed and its hash is unchanged, False otherwise.
+        """
+        return self.get_hash(file_path) == file_hash
+
+    def use_pattern_set(self, fingerprint, pattern_keys):
+        """
+        Select the pattern set that files are cleaned with from now on, registering it if it is new.
+
+        The first pattern set ever registered is assumed to be the one the files
+        recorded before pattern sets were tracked were cleaned with.
+
+        Args:
+            fingerprint (str): A digest identifying the pattern set.
+            pattern_keys (Iterable[tuple[str, int]]): The (source, flags) of each pattern in the set.
+
+        Returns:
+            int: The id of the pattern set.
+        """
+        row = self.conn.execute("SELECT id FROM pattern_sets WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        if row is None:
+            first = self.conn.execute("SELECT COUNT(*) FROM pattern_sets").fetchone()[0] == 0
+            cursor = self.conn.execute(
+                "INSERT INTO pattern_sets (fingerprint, patterns) VALUES (?, ?)",
+                (fingerprint, json.dumps(sorted(pattern_keys))),
+            )
+            row = (cursor.lastrowid,)
+            if first:
+                self.conn.execute("UPDATE processed_files SET pattern_set = ? WHERE pattern_set IS NULL", row)
+                self._clear_cache()
+            self.flush()
+
+        self.pattern_set = row[0]
+        return self.pattern_set
+
+    def get_pattern_set(self, pattern_set):
+        """
+        Get the patterns of a registered pattern set.
+
+        Args:
+            pattern_set (int): The id of the pattern set.
+
+        Returns:
+            frozenset[tuple[str, int]]: The (source, flags) of each pattern in the set.
+        """
+        if pattern_set not in self._pattern_sets:
+            row = self.conn.execute("SELECT patterns FROM pattern_sets WHERE id = ?", (pattern_set,)).fetchone()
+            self._pattern_sets[pattern_set] = frozenset(tuple(key) for key in json.loads(row[0]))
+        return self._pattern_sets[pattern_set]
+
+    def is_known_clean(self, file_hash):
+        """
+        Check if content was recorded as clean of the current ad patterns, at any path.
+
+        Args:
+            file_hash (str): The hash of the content. Only records hashed with the same algorithm can match.
+
+        Returns:
+            bool: True if a file with this content was processed with the current pattern set.
+        """
+        return (
+            self.conn.execute(_KNOWN_CLEAN_QUERY, (*_hash_columns(file_hash), self.pattern_set)).fetchone() is not None
+        )
+
+    def find_hardlink_hash(self, stat_result):
+        """
+        Get the hash recorded for another link to a file.
+
+        Hardlinks share their device, inode, size and modification time, so a record
+        matching all four was made for the same content. Inode numbers are reused across
+        devices, e.g. the disks of a mergerfs pool, so files recorded without their device
+        never match.
+
+        Args:
+            stat_result (os.stat_result): The current metadata of the file.
+
+        Returns:
+            str: The hash recorded with the current pattern set for a file with the same metadata, or None.
+        """
+        row = self.conn.execute(
+            """
+            SELECT file_hash, hash_algorithm FROM processed_files
+            WHERE inode = ? AND device = ? AND size = ? AND mtime_ns = ?
+                AND (pattern_set IS ? OR pattern_set IS NULL)
+            LIMIT 1
+            """,
+            (stat_result.st_ino, stat_result.st_dev, stat_result.st_size, stat_result.st_mtime_ns, self.pattern_set),
+        ).fetchone()
+        return None if row is None else _hash_from_columns(*row)
+
+    def mark_processed(self, file_path, file_hash, stat_result=None):
+        """
+        Record the file as processed.
+
+        The file is tagged with the current pattern set. The write becomes durable at the next flush.
+
+        Args:
+            file_path (str): The path to the file.
+            file_hash (str): The hash of the file content.
+            stat_result (os.stat_result, optional): The metadata of the file as processed,
+                used to skip it without hashing on later runs.
+        """
+        size = mtime_ns = inode = device = None
+        if stat_result is not None:
+            size = stat_result.st_size
+            inode = stat_result.st_ino
+            device = stat_result.st_dev
+            if time.time_ns() - stat_result.st_mtime_ns >= RACY_MTIME_WINDOW_NS:
+                mtime_ns = stat_result.st_mtime_ns
+
+        dir_prefix, name = split_path(file_path)
+        row = (*_hash_columns(file_hash), size, mtime_ns, inode, self.pattern_set, device)
+        self.conn.execute(
+            """
+            INSERT OR REPLACE INTO processed_files
+                (dir_id, name, file_hash, hash_algorithm, size, mtime_ns, inode, pattern_set, device)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (self._get_dir_id(dir_prefix, create=True), name, *row),
+        )
+        records = self._dir_records.get(dir_prefix)
+        if records is not None:
+            self._cached_records += name not in records
+            records[name] = row
+        # Before any commit, so a file never leaves the queue without its record, or the other way around
+        self.finish(file_path)
+        self._count_writes(1)
+
+    def _count_writes(self, count):
+        """Count pending writes, committing them once there are enough of them or they are old enough."""
+        self._pending += count
+        if self._pending >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def enqueue(self, entries):
+        """
+        Add files to the work queue. The write becomes durable at the next flush.
+
+        Args:
+            entries (Iterable[tuple[str, Optional[int]]]): The path to each file and its priority,
+                higher priorities being taken first, or None to take it after all the others.
+        """
+        self.conn.executemany("INSERT INTO work_queue (path, priority) VALUES (?, ?)", entries)
+
+    def get_queued(self, limit):
+        """
+        Get the files at the front of the work queue, leaving out those taken and not finished.
+
+        Args:
+            limit (int): The number of files to get.
+
+        Returns:
+            list[tuple[int, str]]: The id and path of each file, by decreasing priority, then in
+            the order they were queued.
+        """
+        taken = {queue_id for queue_ids in self._taken.values() for queue_id in queue_ids}
+        rows = self.conn.execute(
+            "SELECT id, path FROM work_queue ORDER BY priority DESC, id LIMIT ?",
+            (limit + len(taken),),
+        ).fetchall()
+        return [row for row in rows if row[0] not in taken][:limit]
+
+    def take(self, file_path, queue_id=None, priority=None):
+        """
+        Start processing a file of the work queue.
+
+        The file leaves the queue in the same commit as its record, see mark_processed, or
+        at finish if no record is written for it, so a run that is killed leaves it queued
+        unless its record was committed.
+
+        Args:
+            file_path (str): The path to the file.
+            queue_id (int, optional): The id of its queue entry, as returned by get_queued.
+                If None, the file is added to the queue at the next flush, unless it is
+                finished by then, as most files are.
+            priority (int, optional): The priority of a file added to the queue, see enqueue.
+        """
+        if queue_id is None:
+            self._unqueued[_taken_key(file_path)] = (file_path, priority)
+        else:
+            self._taken.setdefault(_taken_key(file_path), []).append(queue_id)
+
+    def finish(self, file_path):
+        """
+        Remove a taken file from the work queue, if its record didn't already. See take.
+
+        The write becomes durable at the next flush.
+
+        Args:
+            file_path (str): The path to the file.
+        """
+        key = _taken_key(file_path)
+        self._unqueued.pop(key, None)
+        queue_ids = self._taken.pop(key, None)
+        if queue_ids:
+            self.dequeue(queue_ids)
+
+    def dequeue(self, queue_ids):
+        """
+        Remove files from the work queue. The write becomes durable at the next flush.
+
+        Args:
+            queue_ids (Iterable[int]): The ids of the files, as returned by get_queued.
+        """
+        self.conn.executemany("DELETE FROM work_queue WHERE id = ?", ((queue_id,) for queue_id in queue_ids))
+
+    def get_scanned_dirs(self, roots):
+        """
+        Get the directory states recorded by earlier scans under the given roots.
+
+        Only directories scanned with the current pattern set are returned, since the
+        files in the others still have to be checked against the newer patterns.
+
+        Args:
+            roots (Iterable[str]): Absolute paths of the scanned directories.
+
+        Returns:
+            dict: Each directory path mapped to its (mtime_ns, subdirectory names).
+        """
+        scanned_dirs = {}
+        for root in roots:
+            # Everything under "root/" sorts between "root/" and "root0", since "0" follows "/"
+            rows = self.conn.execute(
+                """
+                SELECT dir_path, mtime_ns, subdirs FROM scanned_dirs
+                WHERE (dir_path = ? OR (dir_path >= ? AND dir_path < ?)) AND pattern_set IS ?
+                """,
+                (root, root.rstrip("/") + "/", root.rstrip("/") + "0", self.pattern_set),
+            )
+            for dir_path, mtime_ns, subdirs in rows:
+                scanned_dirs[dir_path] = (mtime_ns, json.loads(subdirs))
+        return scanned_dirs
+
+    def save_scanned_dirs(self, scanned_dirs):
+        """
+        Record directory states for the next scan.
+
+        Args:
+            scanned_dirs (dict): Each directory path mapped to its (mtime_ns, subdirectory names).
+        """
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO scanned_dirs (dir_path, mtime_ns, subdirs, pattern_set) VALUES (?, ?, ?, ?)",
+            (
+                (dir_path, mtime_ns, json.dumps(subdirs), self.pattern_set)
+                for dir_path, (mtime_ns, subdirs) in scanned_dirs.items()
+            ),
+        )
+        self.flush()
+
+    def merge(self, other_db_path):
+        """
+        Copy the records of another database into this one, e.g. one filled by another shard.
+
+        Directories and pattern sets are matched by path and fingerprint. A file recorded
+        in both databases keeps its most recent record. The directory states saved by
+        scans are copied too, but not the work queue.
+
+        Args:
+            other_db_path (pathlib.Path): The path to the other database file.
+
+        Returns:
+            int: The number of file records copied.
+        """
+        # Bring the other database to the current schema first
+        ProcessedFilesStore(other_db_path).close()
+        self.flush()
+        self.conn.execute("ATTACH DATABASE ? AS other", (str(other_db_path),))
+        try:
+            self.conn.execute(
+                """
+                INSERT OR IGNORE INTO main.pattern_sets (fingerprint, patterns, created_at)
+                SELECT fingerprint, patterns, created_at FROM other.pattern_sets ORDER BY id
+                """,
+            )
+            self.conn.execute("INSERT OR IGNORE INTO main.dirs (path) SELECT path FROM other.dirs")
+            changes = self.conn.total_changes
+            # "WHERE true" tells the parser that ON CONFLICT belongs to the INSERT, not to a join
+            self.conn.execute(
+                """
+                INSERT INTO main.processed_files
+                    (dir_id, name, file_hash, hash_algorithm, size, mtime_ns, inode, device, pattern_set, processed_at)
+                SELECT main_dirs.id, f.name, f.file_hash, f.hash_algorithm, f.size, f.mtime_ns, f.inode, f.device,
+                    main_sets.id, f.processed_at
+                FROM other.processed_files AS f
+                JOIN other.dirs AS other_dirs ON other_dirs.id = f.dir_id
+                JOIN main.dirs AS main_dirs ON main_dirs.path = other_dirs.path
+                LEFT JOIN other.pattern_sets AS other_sets ON other_sets.id = f.pattern_set
+                LEFT JOIN main.pattern_sets AS main_sets ON main_sets.fingerprint = other_sets.fingerprint
+                WHERE true
+                ON CONFLICT (dir_id, name) DO UPDATE SET
+                    file_hash = excluded.file_hash,
+                    hash_algorithm = excluded.hash_algorithm,
+                    size = excluded.size,
+                    mtime_ns = excluded.mtime_ns,
+                    inode = excluded.inode,
+                    device = excluded.device,
+                    pattern_set = excluded.pattern_set,
+                    processed_at = excluded.processed_at
+                WHERE ifnull(excluded.processed_at, 0) >= ifnull(processed_files.processed_at, 0)
+                """,
+            )
+            copied = self.conn.total_changes - changes
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO main.scanned_dirs (dir_path, mtime_ns, subdirs, pattern_set)
+                SELECT d.dir_path, d.mtime_ns, d.subdirs, main_sets.id
+                FROM other.scanned_dirs AS d
+                LEFT JOIN other.pattern_sets AS other_sets ON other_sets.id = d.pattern_set
+                LEFT JOIN main.pattern_sets AS main_sets ON main_sets.fingerprint = other_sets.fingerprint
+                """,
+            )
+            self.flush()
+        finally:
+            self.conn.rollback()
+            self.conn.execute("DETACH DATABASE other")
+        self._dir_ids.clear()
+        self._clear_cache()
+        return copied
+
+    def collect_garbage(self):
+        """
+        Remove the records of files that no longer exist, then compact the database.
+
+        Each recorded directory is listed once instead of checking its files one by one.
+        A missing directory only loses its records if its nearest existing parent is not
+        empty, so a library on an unmounted drive is not forgotten. Files recorded under
+        relative paths are kept, since they depend on the working directory of the run.
+
+        Returns:
+            GarbageCollection: The number of removed file records and directories, and the size
+                of the database before and after.
+        """
+        self.flush()
+        size_before = _file_size(self.db_path)
+        files_removed = dirs_removed = 0
+        removed_checks = {}
+
+        for dir_id, dir_prefix in self.conn.execute("SELECT id, path FROM dirs").fetchall():
+            if not os.path.isabs(dir_prefix):
+                continue
+            try:
+                names = set(os.listdir(dir_prefix))
+            except (FileNotFoundError, NotADirectoryError):
+                if not _is_removed(dir_prefix, removed_checks):
+                    continue
+                names = set()
+            except OSError:
+                continue
+
+            recorded = [
+                name for (name,) in self.conn.execute("SELECT name FROM processed_files WHERE dir_id = ?", (dir_id,))
+            ]
+            stale = [name for name in recorded if name not in names]
+            self.conn.executemany(
+                "DELETE FROM processed_files WHERE dir_id = ? AND name = ?",
+                ((dir_id, name) for name in stale),
+            )
+            files_removed += len(stale)
+            if len(stale) == len(recorded):
+                self.conn.execute("DELETE FROM dirs WHERE id = ?", (dir_id,))
+                dirs_removed += 1
+
+        stale_dirs = [
+            (dir_path,)
+            for (dir_path,) in self.conn.execute("SELECT dir_path FROM scanned_dirs").fetchall()
+            if not os.path.isdir(dir_path) and _is_removed(dir_path, removed_checks)
+        ]
+        self.conn.executemany("DELETE FROM scanned_dirs WHERE dir_path = ?", stale_dirs)
+        self.flush()
+        self._dir_ids.clear()
+        self._clear_cache()
+
+        self.conn.execute("VACUUM")
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return GarbageCollection(files_removed, dirs_removed, size_before, _file_size(self.db_path))
+
+    def flush(self):
+        """Commit pending writes, adding the new files taken and not finished yet to the work queue."""
+        for key, (file_path, priority) in self._unqueued.items():
+            queue_id = self.conn.execute(
+                "INSERT INTO work_queue (path, priority) VALUES (?, ?)",
+                (file_path, priority),
+            ).lastrowid
+            self._taken.setdefault(key, []).append(queue_id)
+        self._unqueued.clear()
+        self.conn.commit()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """Commit pending writes and close the connection."""
+        if self.conn is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+            self.conn = None
+
+
+def _taken_key(file_path):
+    """Key files taken from the work queue by their path as recorded, e.g. without a leading ``./``."""
+    return str(pathlib.PurePath(file_path))
+
+
+def _is_removed(directory, checked):
+    """
+    Tell a deleted directory from one on a drive that is not mounted.
+
+    Args:
+        directory (str): A directory that does not exist.
+        checked (dict): Answers for the parents checked so far, shared between calls.
+
+    Returns:
+        bool: True if the nearest existing parent of the directory has entries, False if it is empty.
+    """
+    parent = os.path.dirname(directory.rstrip("/"))
+    while not os.path.isdir(parent) and parent != os.path.dirname(parent):
+        parent = os.path.dirname(parent)
+    if parent not in checked:
+        try:
+            with os.scandir(parent) as entries:
+                checked[parent] = next(entries, None) is not None
+        except OSError:
+            checked[parent] = False
+    return checked[parent]
+
+
+@contextlib.contextmanager
+def run_lock(db_path):
+    """
+    Try to become the only run processing files with a database, for the duration of the block.
+
+    The lock is an flock() on a file next to the database, so it is released when the
+    process exits, however it exits. Where flock() is not available every run gets the lock.
+
+    Args:
+        db_path (pathlib.Path): The path to the database file.
+
+    Yields:
+        bool: True if the lock was acquired, False if another run holds it.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield True
+        return
+
+    with open(f"{db_path}.lock", "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class KnownContents:
+    """
+    Read-only view of the content recorded as clean in a database, for worker processes.
+
+    Workers use their own connection, so they see what the writer has committed.
+    """
+
+    def __init__(self, db_path, pattern_set):
+        """
+        Open the database for reading.
+
+        Args:
+            db_path (pathlib.Path): The path to the database file.
+            pattern_set (int): The id of the current pattern set.
+        """
+        self.pattern_set = pattern_set
+        self.conn = sqlite3.connect(f"{pathlib.Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+
+    def is_known_clean(self, file_hash):
+        """See ProcessedFilesStore.is_known_clean."""
+        return (
+            self.conn.execute(_KNOWN_CLEAN_QUERY, (*_hash_columns(file_hash), self.pattern_set)).fetchone() is not None
+        )
+
+
+@contextlib.contextmanager
+def open_store(db):
+    """
+    Use an existing store or open one for the duration of the block.
+
+    Args:
+        db (ProcessedFilesStore or pathlib.Path): An open store or the path to the database file.
+
+    Yields:
+        ProcessedFilesStore: The store to use.
+    """
+    if isinstance(db, ProcessedFilesStore):
+        yield db
+        return
+
+    with ProcessedFilesStore(db) as store:
+        yield store
@@ -19,86 +19,202 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import argparse
+import codecs
+import collections
+import contextlib
+import functools
 import hashlib
+import itertools
+import os
 import pathlib
 import re
+import signal
 import sqlite3
+import stat
 import sys
+import time
+from typing import TYPE_CHECKING, Iterable, Iterator, NamedTuple, Optional
+
+from .client import DEFAULT_SOCKET_PATH
+from .hashing import DEFAULT_HASH_ALGORITHM, HASH_ALGORITHMS, hash_algorithm_of, hash_content, hash_file
+from .matcher import AdMatcher, pattern_key, pattern_set_fingerprint
+from .output import (
+    INFO,
+    WARNING,
+    capture_output,
+    configure_output,
+    error,
+    flush_output,
+    info,
+    is_enabled,
+    output_settings,
+    replay_output,
+    warning,
+)
+from .scanner import DEFAULT_EXTENSIONS, DEFAULT_SCAN_THREADS, DirectoryScanner
+from .stats import RunStats
+from .srt import iter_block_chunks, iter_cue_blocks, remove_cue_blocks
+from .store import KnownContents, ProcessedFilesStore, open_store, run_lock
+from .watcher import DEFAULT_DEBOUNCE, DEFAULT_RECONCILE_INTERVAL, SubtitleWatcher
+
+# chardet and appdirs are imported where they are used, and the ad patterns are compiled
+# on first use, so commands that never clean a file start quickly. pysrt is not needed at
+# runtime, remove_ad_lines only works on the objects of callers that parse with it.
+if TYPE_CHECKING:
+    import pysrt
+
+# Compiled case-insensitively, see _ad_patterns
+AD_PATTERN_SOURCES = [
+    r"\bnordvpn\b",
+    r"\ba Card Shark AMERICASCARDROOM\b",
+    r"\bOpenSubtitles\b",
+    r"\bAdvertise your product or brand here\b",
+    r"\bApóyanos y conviértete en miembro VIP Para\b",
+    r"\bAddic7ed\b",
+    r"\bargenteam\b",
+    r"\bAllSubs\b",
+    r"\bCreated and Encoded by\b",
+    r"\bcorrected\s+by\b",
+    r"\bEntre a AmericasCardroom\.com Hoy\b",
+    r"\bEveryone is intimidated by a shark\. Become\b",
+    r"\bJuegue Poker en Línea por Dinero Real\b",
+    r"\bOpen Subtitles\b",
+    r"\bMKV Player\b",
+    r"\bResync\s+for\b",
+    r"\bResync\s+improved\b",
+    r"\bRipped\s+By\b",
+    r'\bSigue "Community" en\b',
+    r"\bSubtitles\s+by\b",
+    r"\bSubt[íi]tulos\s+por\b",
+    r"\bSupport us and become VIP member\b",
+    r"\bSubs\s+Team\b",
+    r"\bsubscene\b",
+    r"\bSubtitulado por\b",
+    r"\bsubtitulamos\b",
+    r"\bSynchronized\s+by\b",
+    r"\bSincronizado y corregido por\b",
+    r"\bsubdivx\b",
+    r"\bSync\s+Corrected\b",
+    r"\bSync\s+corrections\s+by\b",
+    r"\bsync and corrections by\b",
+    r"\bSync\s+by\b",
+    r"\bUna\s+traducci[óo]n\s+de\b",
+    r"\btvsubtitles\b",
+    r"\bTacho8\b",
+    r"\bfrom 3.49 USD/month ---->\b",
+    r"\bimplement REST API from",
+    r"\bSignup Here ->",
+    r"\bwww\.flixify\.app\b",
+    r"\bwww\.ADMITME\.APP\b",
+    r"\bwww\.ADMIT1\.APP\b",
+    r"\bsaveanilluminati\.com\b",
+    r"\bosdb\.link/\w+\b",
+    r"\bFilthyRichFutures\.com\b",
+    r"\bServerPartDeals\.com\b",
+    r"\bStreamingSites\.com\b",
+    r"\bSubtitles search by drag & drop\b",
+    r"\bSubtitles conformed by\b",
+    r"\bSubtitled [Bb]y\b",
+    r"\bResync by\b",
+    r"\bTRANSCRIPTED BY:\b",
+    r"\bVisiontext subtitles:\b",
+    r"\bSignup Here\b",
+    r"\bFind out @\b",
+    r"\bPublic shouldn't leave reviews for lawyers\.\b",
+    r"\bTrading can\.\b",
+    r"\bFree Browser extension:\b",
+    r"\bto get subtitles ->\b",
+    r"\bHelp other users to choose the best subtitles\b",
+    r"\bwith Subtitles for Free\b",
+    r"\bRARBG\b",
+    r"\bSerieCanal\.com\b",
+    r"\bNest0r\b",
+    r"\bikerslot\b",
+    r"\bmenoyos\b",
+    r"\bYTS.MX\b",
+    r"\bYTS.LT\b",
+]
 
-import chardet
-import pysrt
-from appdirs import user_data_dir
-
-AD_PATTERNS = [
-    re.compile(r"\bnordvpn\b", re.IGNORECASE),
-    re.compile(r"\ba Card Shark AMERICASCARDROOM\b", re.IGNORECASE),
-    re.compile(r"\bOpenSubtitles\b", re.IGNORECASE),
-    re.compile(r"\bAdvertise your product or brand here\b", re.IGNORECASE),
-    re.compile(r"\bApóyanos y conviértete en miembro VIP Para\b", re.IGNORECASE),
-    re.compile(r"\bAddic7ed\b", re.IGNORECASE),
-    re.compile(r"\bargenteam\b", re.IGNORECASE),
-    re.compile(r"\bAllSubs\b", re.IGNORECASE),
-    re.compile(r"\bCreated and Encoded by\b", re.IGNORECASE),
-    re.compile(r"\bcorrected\s+by\b", re.IGNORECASE),
-    re.compile(r"\bEntre a AmericasCardroom\.com Hoy\b", re.IGNORECASE),
-    re.compile(r"\bEveryone is intimidated by a shark\. Become\b", re.IGNORECASE),
-    re.compile(r"\bJuegue Poker en Línea por Dinero Real\b", re.IGNORECASE),
-    re.compile(r"\bOpen Subtitles\b", re.IGNORECASE),
-    re.compile(r"\bMKV Player\b", re.IGNORECASE),
-    re.compile(r"\bResync\s+for\b", re.IGNORECASE),
-    re.compile(r"\bResync\s+improved\b", re.IGNORECASE),
-    re.compile(r"\bRipped\s+By\b", re.IGNORECASE),
-    re.compile(r'\bSigue "Community" en\b', re.IGNORECASE),
-    re.compile(r"\bSubtitles\s+by\b", re.IGNORECASE),
-    re.compile(r"\bSubt[íi]tulos\s+por\b", re.IGNORECASE),
-    re.compile(r"\bSupport us and become VIP member\b", re.IGNORECASE),
-    re.compile(r"\bSubs\s+Team\b", re.IGNORECASE),
-    re.compile(r"\bsubscene\b", re.IGNORECASE),
-    re.compile(r"\bSubtitulado por\b", re.IGNORECASE),
-    re.compile(r"\bsubtitulamos\b", re.IGNORECASE),
-    re.compile(r"\bSynchronized\s+by\b", re.IGNORECASE),
-    re.compile(r"\bSincronizado y corregido por\b", re.IGNORECASE),
-    re.compile(r"\bsubdivx\b", re.IGNORECASE),
-    re.compile(r"\bSync\s+Corrected\b", re.IGNORECASE),
-    re.compile(r"\bSync\s+corrections\s+by\b", re.IGNORECASE),
-    re.compile(r"\bsync and corrections by\b", re.IGNORECASE),
-    re.compile(r"\bSync\s+by\b", re.IGNORECASE),
-    re.compile(r"\bUna\s+traducci[óo]n\s+de\b", re.IGNORECASE),
-    re.compile(r"\btvsubtitles\b", re.IGNORECASE),
-    re.compile(r"\bTacho8\b", re.IGNORECASE),
-    re.compile(r"\bfrom 3.49 USD/month ---->\b", re.IGNORECASE),
-    re.compile(r"\bimplement REST API from", re.IGNORECASE),
-    re.compile(r"\bSignup Here ->", re.IGNORECASE),
-    re.compile(r"\bwww\.flixify\.app\b", re.IGNORECASE),
-    re.compile(r"\bwww\.ADMITME\.APP\b", re.IGNORECASE),
-    re.compile(r"\bwww\.ADMIT1\.APP\b", re.IGNORECASE),
-    re.compile(r"\bsaveanilluminati\.com\b", re.IGNORECASE),
-    re.compile(r"\bosdb\.link/\w+\b", re.IGNORECASE),
-    re.compile(r"\bFilthyRichFutures\.com\b", re.IGNORECASE),
-    re.compile(r"\bServerPartDeals\.com\b", re.IGNORECASE),
-    re.compile(r"\bStreamingSites\.com\b", re.IGNORECASE),
-    re.compile(r"\bSubtitles search by drag & drop\b", re.IGNORECASE),
-    re.compile(r"\bSubtitles conformed by\b", re.IGNORECASE),
-    re.compile(r"\bSubtitled [Bb]y\b", re.IGNORECASE),
-    re.compile(r"\bResync by\b", re.IGNORECASE),
-    re.compile(r"\bTRANSCRIPTED BY:\b", re.IGNORECASE),
-    re.compile(r"\bVisiontext subtitles:\b", re.IGNORECASE),
-    re.compile(r"\bSignup Here\b", re.IGNORECASE),
-    re.compile(r"\bFind out @\b", re.IGNORECASE),
-    re.compile(r"\bPublic shouldn't leave reviews for lawyers\.\b", re.IGNORECASE),
-    re.compile(r"\bTrading can\.\b", re.IGNORECASE),
-    re.compile(r"\bFree Browser extension:\b", re.IGNORECASE),
-    re.compile(r"\bto get subtitles ->\b", re.IGNORECASE),
-    re.compile(r"\bHelp other users to choose the best subtitles\b", re.IGNORECASE),
-    re.compile(r"\bwith Subtitles for Free\b", re.IGNORECASE),
-    re.compile(r"\bRARBG\b", re.IGNORECASE),
-    re.compile(r"\bSerieCanal\.com\b", re.IGNORECASE),
-    re.compile(r"\bNest0r\b", re.IGNORECASE),
-    re.compile(r"\bikerslot\b", re.IGNORECASE),
-    re.compile(r"\bmenoyos\b", re.IGNORECASE),
-    re.compile(r"\bYTS.MX\b", re.IGNORECASE),
-    re.compile(r"\bYTS.LT\b", re.IGNORECASE),
+# Maximum bytes read from stdin at once when paths are NUL-separated
+STDIN_CHUNK_SIZE = 64 * 1024
+
+# Files queued per worker process in parallel mode, so workers never wait on the database writer
+PREFETCH_PER_JOB = 4
+# Files taken from a reconcile sweep between two checks for watched changes
+SWEEP_BATCH_SIZE = 50
+# Most files read from or added to the work queue with one query
+QUEUE_CHUNK_SIZE = 1000
+
+# Encoding detection: BOMs are checked longest first, since the UTF-32 LE BOM starts with the UTF-16 LE one
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
 ]
+# Codecs that write the byte order of each BOM without adding a BOM of their own
+BOM_BYTE_ORDER_ENCODINGS = {
+    codecs.BOM_UTF32_LE: "utf-32-le",
+    codecs.BOM_UTF32_BE: "utf-32-be",
+    codecs.BOM_UTF8: "utf-8",
+    codecs.BOM_UTF16_LE: "utf-16-le",
+    codecs.BOM_UTF16_BE: "utf-16-be",
+}
+UNICODE_ENCODINGS = {"utf-8", "utf-8-sig", "utf-16", "utf-32"}
+ENCODING_SAMPLE_SIZE = 64 * 1024
+ENCODING_CHUNK_SIZE = 4096
+
+# Last legacy encoding seen per directory, a release usually uses the same one for every file
+ENCODING_HINTS = collections.OrderedDict()
+ENCODING_HINTS_SIZE = 1024
+
+NO_INPUT_MESSAGE = "No subtitle files provided. Pipe filenames to subscleaner or use --help for more information."
+
+STATUS_UNCHANGED = "unchanged"
+STATUS_CLEAN = "clean"
+STATUS_MODIFIED = "modified"
+STATUS_FAILED = "failed"
+
+
+@functools.cache
+def _ad_patterns():
+    """Compile the ad patterns."""
+    return [re.compile(source, re.IGNORECASE) for source in AD_PATTERN_SOURCES]
+
+
+@functools.cache
+def _ad_matcher():
+    """Build the matcher searching for every ad pattern at once."""
+    return AdMatcher(_ad_patterns())
+
+
+@functools.cache
+def _ad_patterns_fingerprint():
+    """Compute the digest identifying the current set of ad patterns."""
+    return pattern_set_fingerprint(_ad_patterns())
+
+
+_LAZY_ATTRIBUTES = {
+    "AD_PATTERNS": _ad_patterns,
+    "AD_MATCHER": _ad_matcher,
+    "AD_PATTERNS_FINGERPRINT": _ad_patterns_fingerprint,
+}
+
+
+def __getattr__(name):
+    """Provide AD_PATTERNS, AD_MATCHER and AD_PATTERNS_FINGERPRINT, computed on first access."""
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class CleanResult(NamedTuple):
+    """The outcome of cleaning a single subtitle file."""
+
+    status: str
+    file_hash: Optional[str] = None
+    stat_result: Optional[os.stat_result] = None
 
 
 def get_db_path(db_location=None):
@@ -116,6 +232,8 @@ def get_db_path(db_location=None):
         db_path.parent.mkdir(parents=True, exist_ok=True)
         return db_path
 
+    from appdirs import user_data_dir
+
     app_data_dir = pathlib.Path(user_data_dir("subscleaner", "subscleaner"))
     app_data_dir.mkdir(parents=True, exist_ok=True)
     return app_data_dir / "subscleaner.db"
@@ -128,104 +246,76 @@ def init_db(db_path):
     Args:
         db_path (pathlib.Path): The path to the database file.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS processed_files (
-        file_path TEXT PRIMARY KEY,
-        file_hash TEXT NOT NULL,
-        processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-
-    conn.commit()
-    conn.close()
+    ProcessedFilesStore(db_path).close()
 
 
-def get_file_hash(file_path):
+def get_file_hash(file_path, algorithm=DEFAULT_HASH_ALGORITHM):
     """
-    Generate an MD5 hash of the file content.
+    Generate a hash of the file content.
 
     Args:
         file_path (pathlib.Path): The path to the file.
+        algorithm (str): One of HASH_ALGORITHMS.
 
     Returns:
-        str: The MD5 hash of the file content.
+        str: The hash of the file content, or None if the file can't be read.
     """
-    hash_md5 = hashlib.md5()
     try:
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+        return hash_file(file_path, algorithm)
     except Exception as e:
-        print(f"Error generating hash for {file_path}: {e}")
+        error(f"Error generating hash for {file_path}: {e}", path=str(file_path))
         return None
 
 
-def is_file_processed(db_path, file_path, file_hash):
+def get_content_hash(content: bytes, algorithm=DEFAULT_HASH_ALGORITHM) -> str:
     """
-    Check if the file has been processed before.
+    Generate a hash of file content already in memory.
 
     Args:
-        db_path (pathlib.Path): The path to the database file.
-        file_path (str): The path to the file.
-        file_hash (str): The MD5 hash of the file content.
+        content (bytes): The file content.
+        algorithm (str): One of HASH_ALGORITHMS.
 
     Returns:
-        bool: True if the file has been processed before, False otherwise.
+        str: The hash of the content, identical to get_file_hash for the same bytes.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    return hash_content(content, algorithm)
 
-    cursor.execute(
-        "SELECT file_hash FROM processed_files WHERE file_path = ?",
-        (str(file_path),),
-    )
-    result = cursor.fetchone()
-
-    conn.close()
 
-    if result is None:
-        return False
-
-    # If the hash has changed, the file has been modified
-    return result[0] == file_hash
-
-
-def mark_file_processed(db_path, file_path, file_hash):
+def contains_ad(subtitle_line: str) -> bool:
     """
-    Mark the file as processed in the database.
+    Check if the given subtitle line contains an ad.
 
     Args:
-        db_path (pathlib.Path): The path to the database file.
-        file_path (str): The path to the file.
-        file_hash (str): The MD5 hash of the file content.
-    """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "INSERT OR REPLACE INTO processed_files (file_path, file_hash) VALUES (?, ?)",
-        (str(file_path), file_hash),
-    )
+        subtitle_line (str): The subtitle line to be checked.
 
-    conn.commit()
-    conn.close()
+    Returns:
+        bool: True if the subtitle line contains an ad, False otherwise.
+    """
+    return _ad_matcher().search(subtitle_line) is not None
 
 
-def contains_ad(subtitle_line: str) -> bool:
+def may_contain_ad(subtitle_text: str, matcher: Optional[AdMatcher] = None) -> bool:
     """
-    Check if the given subtitle line contains an ad.
+    Check if any cue of a decoded subtitle file could contain an ad, without parsing it.
+
+    The text is searched a few cue blocks at a time, with lines stripped of trailing
+    whitespace the way cue lines are stripped, so a cue matching a pattern always makes
+    the piece of text it is in match, and only one piece is copied at a time.
 
     Args:
-        subtitle_line (str): The subtitle line to be checked.
+        subtitle_text (str): The decoded content of the subtitle file.
+        matcher (AdMatcher, optional): The ad patterns to look for, all of them by default.
 
     Returns:
-        bool: True if the subtitle line contains an ad, False otherwise.
+        bool: False if no cue can contain an ad, True if the file has to be parsed to find out.
     """
-    return any(pattern.search(subtitle_line) for pattern in AD_PATTERNS)
+    matcher = matcher or _ad_matcher()
+    if not matcher.context_free:
+        return True
+    return any(
+        matcher.search("\n".join(line.rstrip() for line in chunk.splitlines())) is not None
+        for chunk in iter_block_chunks(subtitle_text)
+    )
 
 
 def get_encoding(subtitle_file: pathlib.Path) -> str:
@@ -240,147 +330,915 @@ def get_encoding(subtitle_file: pathlib.Path) -> str:
     """
     try:
         with open(subtitle_file, "rb") as file:
-            return chardet.detect(file.read())["encoding"] or "utf-8"
+            return detect_encoding(file.read())
     except Exception as e:
-        print(f"Error detecting encoding: {e}")
+        error(f"Error detecting encoding: {e}", path=str(subtitle_file))
         return "utf-8"
 
 
-def remove_ad_lines(subtitle_data: pysrt.SubRipFile) -> bool:
+def detect_encoding(content: bytes, hint=None) -> str:
     """
-    Remove ad lines from the subtitle data.
+    Detect the encoding of subtitle content already in memory.
+
+    Byte order marks and valid UTF-8 are recognized without chardet. Otherwise the
+    hint is used if it is a multi-byte encoding and the content decodes with it, and
+    only then is chardet run, on at most ENCODING_SAMPLE_SIZE bytes and stopping as
+    soon as it is confident.
 
     Args:
-        subtitle_data (pysrt.SubRipFile): The subtitle data object.
+        content (bytes): The raw subtitle file content.
+        hint (str, optional): An encoding likely to be right, e.g. the one used by other
+            files in the same directory. Single-byte encodings decode almost any content,
+            so they are only used if chardet can't tell.
 
     Returns:
-        bool: True if the subtitle data was modified, False otherwise.
+        str: The detected encoding of the content.
     """
-    modified = False
-    indices_to_remove = []
+    for bom, encoding in BOM_ENCODINGS:
+        if content.startswith(bom):
+            return encoding
 
-    for index, subtitle in enumerate(subtitle_data):
-        if contains_ad(subtitle.text):
-            print(f"Removing: {subtitle}\n")
-            indices_to_remove.append(index)
-            modified = True
+    try:
+        content.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
 
-    for index in sorted(indices_to_remove, reverse=True):
-        del subtitle_data[index]
+    if hint and _rejects_invalid_input(hint):
+        try:
+            content.decode(hint)
+            return hint
+        except UnicodeDecodeError:
+            pass
 
-    return modified
+    import chardet
+
+    detector = chardet.UniversalDetector()
+    for start in range(0, min(len(content), ENCODING_SAMPLE_SIZE), ENCODING_CHUNK_SIZE):
+        detector.feed(content[start : start + ENCODING_CHUNK_SIZE])
+        if detector.done:
+            break
+    return detector.close()["encoding"] or hint or "utf-8"
 
 
-def is_already_processed(subtitle_file, db_path, file_hash, force=False, verbose=False):
+@functools.cache
+def _rejects_invalid_input(encoding):
     """
-    Check if the subtitle file has already been processed.
+    Check if decoding with an encoding tells content in another one apart.
 
-    This function checks the database to determine if a file has already been processed.
+    Multi-byte encodings such as Shift JIS or Big5 fail on most bytes above 0x7f that
+    are not part of a valid sequence, while single-byte encodings such as cp1252, cp1251
+    or latin-1 decode almost anything, e.g. a Spanish file as if it were Cyrillic.
 
     Args:
-        subtitle_file (pathlib.Path): The path to the subtitle file.
-        db_path (pathlib.Path): The path to the database file.
-        file_hash (str): The MD5 hash of the file content.
-        force (bool): If True, ignore previous processing status.
+        encoding (str): The encoding.
 
     Returns:
-        bool: True if the file has already been processed, False otherwise.
+        bool: True if most bytes above 0x7f don't decode on their own.
     """
-    if force:
+    try:
+        high_bytes = [bytes([byte]) for byte in range(0x80, 0x100)]
+        decoded = sum(1 for byte in high_bytes if _decodes(byte, encoding))
+    except LookupError:
         return False
+    return decoded < len(high_bytes) // 2
 
-    # Check if the file is in the database with the same hash
-    if is_file_processed(db_path, str(subtitle_file), file_hash):
-        if verbose:
-            print(f"Already processed {subtitle_file} (hash match)")
-        return True
 
-    return False
+def _decodes(content, encoding):
+    """Check if content decodes with an encoding."""
+    try:
+        content.decode(encoding)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _detect_subtitle_encoding(subtitle_file, content):
+    """
+    Detect the encoding of a subtitle file, using and updating the per-directory hints.
+
+    Args:
+        subtitle_file (pathlib.Path): The path to the subtitle file.
+        content (bytes): The raw subtitle file content.
+
+    Returns:
+        str: The detected encoding of the content.
+    """
+    directory = str(subtitle_file.parent)
+    encoding = detect_encoding(content, ENCODING_HINTS.get(directory))
+
+    # Only legacy encodings are worth remembering, BOMs and UTF-8 are detected without chardet anyway
+    if encoding not in UNICODE_ENCODINGS:
+        ENCODING_HINTS[directory] = encoding
+        ENCODING_HINTS.move_to_end(directory)
+        if len(ENCODING_HINTS) > ENCODING_HINTS_SIZE:
+            ENCODING_HINTS.popitem(last=False)
+
+    return encoding
 
 
-def process_subtitle_file(subtitle_file_path: str, db_path, force=False, verbose=False) -> bool:
+def remove_ad_lines(subtitle_data: "pysrt.SubRipFile") -> bool:
+    """
+    Remove ad lines from the subtitle data.
+
+    Args:
+        subtitle_data (pysrt.SubRipFile): The subtitle data object.
+
+    Returns:
+        bool: True if the subtitle data was modified, False otherwise.
+    """
+    kept = []
+    for subtitle in subtitle_data:
+        if not contains_ad(subtitle.text):
+            kept.append(subtitle)
+        elif is_enabled(INFO):
+            info(f"Removing: {subtitle}")
+
+    # One pass over the cues, where deleting them one by one would shift the rest of the list each time
+    modified = len(kept) != len(subtitle_data)
+    if modified:
+        subtitle_data[:] = kept
+    return modified
+
+
+def process_subtitle_file(subtitle_file_path: str, db, force=False, verbose=False, paranoid=False, stats=None) -> bool:
     """
     Process a subtitle file to remove ad lines.
 
     Args:
         subtitle_file_path (str): The path to the subtitle file.
-        db_path (pathlib.Path): The path to the database file.
+        db (ProcessedFilesStore or pathlib.Path): An open store, or the path to the database file.
         force (bool): If True, process the file even if it has been processed before.
         verbose (bool): If True, print detailed processing information.
+        paranoid (bool): If True, always compare content hashes instead of trusting unchanged file metadata.
+        stats (RunStats, optional): Collects stage timings and counters for the file.
 
     Returns:
         bool: True if the subtitle file was modified, False otherwise.
     """
+    stats = RunStats() if stats is None else stats
     try:
-        subtitle_file = pathlib.Path(subtitle_file_path)
-        if verbose:
-            print(f"Analyzing: {subtitle_file}")
+        with open_store(db) as store:
+            _use_ad_patterns(store)
+            return _process_subtitle_file(pathlib.Path(subtitle_file_path), store, force, verbose, paranoid, stats)
+    except Exception as e:
+        error(f"Error processing {subtitle_file_path}: {e}", path=str(subtitle_file_path))
+        stats.add_failure(subtitle_file_path)
+        return False
 
-        # Early validation checks
-        if not subtitle_file.exists():
-            print(f"File not found: {subtitle_file}")
-            return False
 
-        # Get file hash and check if already processed
-        file_hash = get_file_hash(subtitle_file)
-        if file_hash is None or is_already_processed(subtitle_file, db_path, file_hash, force):
-            return False
+def _decode_subtitle(content, encoding):
+    """
+    Decode subtitle content, falling back to chardet on the whole file if the detected encoding fails.
+
+    Args:
+        content (bytes): The raw subtitle file content.
+        encoding (str): The detected encoding of the content.
 
-        # Process the subtitle file
-        modified = False
-        encoding = get_encoding(subtitle_file)
+    Returns:
+        tuple: The decoded text and the encoding actually used, or None if the content could not be decoded.
+    """
+    try:
+        return content.decode(encoding), encoding
+    except UnicodeDecodeError:
+        # The encoding may have been guessed from a hint or a sample, give chardet the whole file
+        import chardet
 
-        # Try to open the subtitle file
-        subtitle_data = None
+        fallback = chardet.detect(content)["encoding"] or "utf-8"
+        warning(f"Failed to open with detected encoding {encoding}, trying {fallback}")
         try:
-            subtitle_data = pysrt.open(subtitle_file, encoding=encoding)
-        except UnicodeDecodeError:
-            print(f"Failed to open with detected encoding {encoding}, trying utf-8")
-            try:
-                subtitle_data = pysrt.open(subtitle_file, encoding="utf-8")
-            except Exception as e:
-                print(f"Error opening subtitle file with pysrt: {e}")
-                return False
+            return content.decode(fallback), fallback
         except Exception as e:
-            print(f"Error opening subtitle file with pysrt: {e}")
-            return False
+            error(f"Error decoding subtitle file: {e}")
+            return None
+    except Exception as e:
+        error(f"Error decoding subtitle file: {e}")
+        return None
 
-        # Remove ad lines and save if modified
-        if subtitle_data and remove_ad_lines(subtitle_data):
-            print(f"Saving {subtitle_file}")
-            subtitle_data.save(subtitle_file)
-            # Update the hash after modification
-            new_hash = get_file_hash(subtitle_file)
-            mark_file_processed(db_path, str(subtitle_file), new_hash)
-            modified = True
-        else:
-            # Mark as processed even if no changes were made
-            mark_file_processed(db_path, str(subtitle_file), file_hash)
 
-        return modified
-    except Exception as e:
-        print(f"Error processing {subtitle_file_path}: {e}")
+def _encode_subtitle(text, encoding, original):
+    """
+    Encode subtitle text the way the original content was encoded.
+
+    The byte order mark and byte order of the original are kept, so a big-endian
+    UTF-16 file is not turned into a little-endian one.
+
+    Args:
+        text (str): The subtitle text.
+        encoding (str): The encoding the original content was decoded with.
+        original (bytes): The original subtitle file content.
+
+    Returns:
+        bytes: The encoded subtitle content.
+    """
+    for bom, bom_encoding in BOM_ENCODINGS:
+        if encoding == bom_encoding and original.startswith(bom):
+            return bom + text.encode(BOM_BYTE_ORDER_ENCODINGS[bom])
+    return text.encode(encoding)
+
+
+def _rewrite_file(path, content):
+    """
+    Overwrite a file's content in place, keeping its inode and every hardlink to it.
+
+    The new content is written over the old one before the file is cut to its length,
+    so an interrupted save of a cleaned subtitle leaves at worst a stray tail of old cues.
+
+    Args:
+        path (pathlib.Path): The file to overwrite.
+        content (bytes): The new content.
+    """
+    with open(path, "r+b") as subtitle:
+        subtitle.write(content)
+        subtitle.truncate()
+        subtitle.flush()
+        os.fsync(subtitle.fileno())
+
+
+def _replace_file(subtitle_file, content):
+    """
+    Replace a file's content, atomically where possible.
+
+    The content is written to a temporary file next to the target, which then
+    replaces it, so an interrupted save never leaves a truncated subtitle. The
+    original permissions and, where allowed, ownership are carried over. A file
+    with other hardlinks (e.g. shared by the download and library folders), or in
+    a directory that can't be written to, is rewritten in place instead.
+
+    Args:
+        subtitle_file (pathlib.Path): The file to replace. Symlinks are followed.
+        content (bytes): The new content.
+    """
+    target = pathlib.Path(os.path.realpath(subtitle_file))
+    stat_result = target.stat()
+    if stat_result.st_nlink > 1:
+        _rewrite_file(target, content)
+        return
+    import tempfile
+
+    try:
+        fd, temp_path = tempfile.mkstemp(prefix=f".{target.name}.", suffix=".tmp", dir=target.parent)
+    except PermissionError:
+        _rewrite_file(target, content)
+        return
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(content)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.chmod(temp_path, stat.S_IMODE(stat_result.st_mode))
+        with contextlib.suppress(OSError):
+            os.chown(temp_path, stat_result.st_uid, stat_result.st_gid)
+        os.replace(temp_path, target)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(temp_path)
+        raise
+
+
+def clean_subtitle_file(
+    subtitle_file: pathlib.Path,
+    known_hash=None,
+    stats=None,
+    new_patterns=None,
+    is_known_clean=None,
+    hash_algorithm=DEFAULT_HASH_ALGORITHM,
+) -> CleanResult:
+    """
+    Remove ad lines from a subtitle file without touching the database.
+
+    This is the part of processing that reads, parses and rewrites the file, so it
+    can run in a worker process while the parent keeps the only database connection.
+
+    Args:
+        subtitle_file (pathlib.Path): The path to the subtitle file.
+        known_hash (str, optional): The hash stored for the file. If the content still
+            has this hash, the file is left alone.
+        stats (RunStats, optional): Collects stage timings and counters for the file.
+        new_patterns (AdMatcher, optional): The patterns added since the file was last cleaned.
+            If the content still has ``known_hash``, it is only checked against these.
+        is_known_clean (Callable[[str], bool], optional): Tells if content with a given hash was
+            already found clean at another path, in which case it is not checked again.
+        hash_algorithm (str): The algorithm of the returned hash, one of HASH_ALGORITHMS. A ``known_hash``
+            computed with another algorithm is still compared, and the new hash replaces it.
+
+    Returns:
+        CleanResult: The outcome, the hash of the content now on disk and, for modified
+            files, their metadata after saving.
+    """
+    stats = RunStats() if stats is None else stats
+
+    # Read the file once: hashing, encoding detection and parsing all work on this buffer
+    try:
+        with stats.stage("read"):
+            content = subtitle_file.read_bytes()
+    except OSError as e:
+        error(f"Error reading {subtitle_file}: {e}", path=str(subtitle_file))
+        stats.add_failure(subtitle_file)
+        return CleanResult(STATUS_FAILED)
+    stats.add("bytes_read", len(content))
+
+    # Get file hash and check if already processed
+    with stats.stage("hash"):
+        file_hash = get_content_hash(content, hash_algorithm)
+        unchanged = file_hash == known_hash
+        if known_hash is not None and hash_algorithm_of(known_hash) != hash_algorithm:
+            unchanged = get_content_hash(content, hash_algorithm_of(known_hash)) == known_hash
+            stats.add("rehashed")
+    matcher = _ad_matcher()
+    if unchanged:
+        if new_patterns is None:
+            stats.add("skipped_hash")
+            return CleanResult(STATUS_UNCHANGED, file_hash)
+        # Already clean of the older patterns, only the new ones can still match
+        stats.add("pattern_upgrades")
+        matcher = new_patterns
+    elif is_known_clean is not None:
+        with stats.stage("db_lookup"):
+            duplicate = is_known_clean(file_hash)
+        if duplicate:
+            # A copy of this content was already cleaned at another path
+            stats.add("skipped_duplicate")
+            return CleanResult(STATUS_CLEAN, file_hash)
+
+    with stats.stage("encoding"):
+        encoding = _detect_subtitle_encoding(subtitle_file, content)
+    with stats.stage("prefilter"):
+        decoded = _decode_subtitle(content, encoding)
+        worth_parsing = decoded is not None and may_contain_ad(decoded[0], matcher)
+    if decoded is None:
+        stats.add_failure(subtitle_file)
+        return CleanResult(STATUS_FAILED)
+
+    # Most files have no ads at all: only build the cue structure when the raw text has a match
+    if not worth_parsing:
+        stats.add("skipped_prefilter")
+        return CleanResult(STATUS_CLEAN, file_hash)
+
+    return _remove_ads(subtitle_file, content, decoded, file_hash, stats, matcher)
+
+
+def _remove_ads(subtitle_file, content, decoded, file_hash, stats, matcher):
+    """
+    Remove the ad cues of a subtitle file and save it if any were found.
+
+    Only the offending cue blocks are cut out of the decoded text and the remaining
+    cues are renumbered; everything else, line endings included, is written back as read.
+
+    Args:
+        subtitle_file (pathlib.Path): The path to the subtitle file.
+        content (bytes): The raw subtitle file content.
+        decoded (tuple): The decoded text and the encoding it was decoded with.
+        file_hash (str): The hash of the content as read.
+        stats (RunStats): Collects stage timings and counters for the file.
+        matcher (AdMatcher): The ad patterns to look for.
+
+    Returns:
+        CleanResult: The outcome of cleaning the file.
+    """
+    text, encoding = decoded
+    # Cues are matched as they are parsed and only the ad cues are kept, so memory use
+    # doesn't grow with the number of cues
+    with stats.stage("parse"):
+        ad_blocks = [block for block in iter_cue_blocks(text) if matcher.search(block.text) is not None]
+    stats.add("parsed")
+    if not ad_blocks:
+        return CleanResult(STATUS_CLEAN, file_hash)
+
+    if is_enabled(INFO):
+        for block in ad_blocks:
+            info(f"Removing: {block.source(text)}", path=str(subtitle_file))
+    info(f"Saving {subtitle_file}", path=str(subtitle_file))
+    with stats.stage("save"):
+        new_content = _encode_subtitle(remove_cue_blocks(text, iter_cue_blocks(text), ad_blocks), encoding, content)
+        _replace_file(subtitle_file, new_content)
+        # The new hash comes from the bytes written, not from reading the file back
+        result = CleanResult(
+            STATUS_MODIFIED,
+            get_content_hash(new_content, hash_algorithm_of(file_hash)),
+            subtitle_file.stat(),
+        )
+    stats.add("modified")
+    stats.add("cues_removed", len(ad_blocks))
+    stats.add("bytes_written", len(new_content))
+    return result
+
+
+# Per-process state of pool workers, set up by _init_worker
+_WORKER_STATE = {}
+
+
+def _init_worker(db_path, pattern_set, settings):
+    """Give a worker process its own read-only view of the known clean contents and the parent's output settings."""
+    _WORKER_STATE["known_contents"] = KnownContents(db_path, pattern_set)
+    configure_output(*settings)
+
+
+def _clean_subtitle_file_with_stats(subtitle_file, known_hash, new_patterns, hash_algorithm, dedupe=False):
+    """
+    Run clean_subtitle_file in a worker process.
+
+    Returns the result along with the worker's stats and the messages logged about the
+    file, which the parent process writes in order with its own.
+    """
+    stats = RunStats()
+    known_contents = _WORKER_STATE.get("known_contents") if dedupe else None
+    is_known_clean = None if known_contents is None else known_contents.is_known_clean
+    try:
+        with capture_output() as messages:
+            result = clean_subtitle_file(subtitle_file, known_hash, stats, new_patterns, is_known_clean, hash_algorithm)
+        return result, stats, messages
+    finally:
+        # Messages are only left pending if clean_subtitle_file raised, and workers may sit idle for the rest of the run
+        flush_output()
+
+
+def _use_ad_patterns(store):
+    """Tag the files recorded in the store with the current set of ad patterns."""
+    if store.pattern_set is None:
+        store.use_pattern_set(_ad_patterns_fingerprint(), [pattern_key(pattern) for pattern in _ad_patterns()])
+
+
+@functools.lru_cache(maxsize=16)
+def _new_patterns_matcher(previous_keys, _fingerprint):
+    """
+    Build a matcher for the ad patterns missing from a previous pattern set, or None if there are none.
+
+    The fingerprint of the current patterns is part of the cache key, so a cached matcher
+    never outlives the patterns it was built from.
+    """
+    new_patterns = [pattern for pattern in _ad_patterns() if pattern_key(pattern) not in previous_keys]
+    return AdMatcher(new_patterns) if new_patterns else None
+
+
+def _get_new_patterns(store, record):
+    """
+    Get the ad patterns added since a file was last cleaned.
+
+    Args:
+        store (ProcessedFilesStore): The processed files database.
+        record (ProcessedFile): The stored record of the file.
+
+    Returns:
+        AdMatcher: The patterns the file still has to be checked against, or None if it is up to date.
+    """
+    if record.pattern_set is None or record.pattern_set == store.pattern_set:
+        return None
+    return _new_patterns_matcher(store.get_pattern_set(record.pattern_set), _ad_patterns_fingerprint())
+
+
+def _check_processed(subtitle_file, store, force, verbose, paranoid, stats):
+    """
+    Decide whether a subtitle file has to be read.
+
+    Args:
+        subtitle_file (pathlib.Path): The path to the subtitle file.
+        store (ProcessedFilesStore): The processed files database.
+        force (bool): If True, ignore previous processing status.
+        verbose (bool): If True, print detailed processing information.
+        paranoid (bool): If True, never skip a file based on its metadata alone.
+        stats (RunStats): Collects stage timings and counters for the file.
+
+    Returns:
+        tuple: The file's (stat_result, record, new_patterns) if it has to be read, or None if it can be skipped.
+    """
+    if verbose:
+        info(f"Analyzing: {subtitle_file}", path=str(subtitle_file))
+    stats.add("files_seen")
+
+    # Early validation checks
+    try:
+        with stats.stage("stat"):
+            stat_result = subtitle_file.stat()
+    except FileNotFoundError:
+        warning(f"File not found: {subtitle_file}", path=str(subtitle_file))
+        stats.add("files_missing")
+        return None
+
+    # Skip files whose size, mtime and inode are unchanged without reading them,
+    # unless ad patterns were added since they were cleaned
+    record = new_patterns = None
+    if not force:
+        with stats.stage("db_lookup"):
+            record = store.get_record(str(subtitle_file))
+            new_patterns = None if record is None else _get_new_patterns(store, record)
+    if record is not None and new_patterns is None and not paranoid and record.matches_stat(stat_result):
+        if verbose:
+            info(f"Already processed {subtitle_file} (metadata match)", path=str(subtitle_file))
+        stats.add("skipped_metadata")
+        return None
+    if not force and not paranoid and _adopt_hardlink(subtitle_file, store, stat_result, verbose, stats):
+        return None
+    if new_patterns is not None and verbose:
+        info(f"Checking {subtitle_file} against {len(new_patterns)} new patterns", path=str(subtitle_file))
+
+    return stat_result, record, new_patterns
+
+
+def _adopt_hardlink(subtitle_file, store, stat_result, verbose, stats):
+    """
+    Record a file without reading it if it is a hardlink to a file processed with the current patterns.
+
+    Args:
+        subtitle_file (pathlib.Path): The path to the subtitle file.
+        store (ProcessedFilesStore): The processed files database.
+        stat_result (os.stat_result): The current metadata of the file.
+        verbose (bool): If True, print detailed processing information.
+        stats (RunStats): Collects stage timings and counters for the file.
+
+    Returns:
+        bool: True if the file was recorded as processed, False if it has to be read.
+    """
+    if stat_result.st_nlink < 2:  # noqa: PLR2004
         return False
+    with stats.stage("db_lookup"):
+        linked_hash = store.find_hardlink_hash(stat_result)
+    if linked_hash is None:
+        return False
+
+    if verbose:
+        info(f"Already processed {subtitle_file} (hardlink to a processed file)", path=str(subtitle_file))
+    with stats.stage("db_write"):
+        store.mark_processed(str(subtitle_file), linked_hash, stat_result)
+    stats.add("skipped_hardlink")
+    return True
 
 
-def process_subtitle_files(subtitle_files: list[str], db_path, force=False, verbose=False) -> list[str]:
+def _record_result(subtitle_file, store, pending, result, verbose, stats):
+    """
+    Store the outcome of clean_subtitle_file in the database.
+
+    Args:
+        subtitle_file (pathlib.Path): The path to the subtitle file.
+        store (ProcessedFilesStore): The processed files database.
+        pending (tuple): The (stat_result, record, new_patterns) returned by _check_processed.
+        result (CleanResult): The outcome of cleaning the file.
+        verbose (bool): If True, print detailed processing information.
+        stats (RunStats): Collects stage timings and counters for the file.
+
+    Returns:
+        bool: True if the subtitle file was modified, False otherwise.
+    """
+    stat_result, record, _ = pending
+    with stats.stage("db_write"):
+        if result.status == STATUS_UNCHANGED:
+            if verbose:
+                info(f"Already processed {subtitle_file} (hash match)", path=str(subtitle_file))
+            if not record.matches_stat(stat_result) or record.file_hash != result.file_hash:
+                # Refresh the stored metadata so the next run can skip the file with a single stat(),
+                # and the hash if it was recorded with another algorithm
+                store.mark_processed(str(subtitle_file), result.file_hash, stat_result)
+        elif result.status == STATUS_MODIFIED:
+            store.mark_processed(str(subtitle_file), result.file_hash, result.stat_result)
+        elif result.status == STATUS_CLEAN:
+            # Mark as processed even if no changes were made
+            store.mark_processed(str(subtitle_file), result.file_hash, stat_result)
+
+    return result.status == STATUS_MODIFIED
+
+
+def _process_subtitle_file(subtitle_file, store, force, verbose, paranoid, stats):
+    """Process a subtitle file against an open store. See process_subtitle_file."""
+    pending = _check_processed(subtitle_file, store, force, verbose, paranoid, stats)
+    if pending is None:
+        return False
+
+    _, record, new_patterns = pending
+    result = clean_subtitle_file(
+        subtitle_file,
+        None if record is None else record.file_hash,
+        stats,
+        new_patterns,
+        None if force or paranoid else store.is_known_clean,
+        store.hash_algorithm,
+    )
+    return _record_result(subtitle_file, store, pending, result, verbose, stats)
+
+
+def process_subtitle_files(  # noqa: PLR0913, PLR0917
+    subtitle_files: Iterable[str],
+    db,
+    force=False,
+    verbose=False,
+    paranoid=False,
+    jobs=1,
+    stats=None,
+) -> list[str]:
     """
     Process multiple subtitle files to remove ad lines.
 
     Args:
-        subtitle_files (list[str]): A list of subtitle file paths.
-        db_path (pathlib.Path): The path to the database file.
+        subtitle_files (Iterable[str]): The subtitle file paths, consumed lazily as they are processed.
+        db (ProcessedFilesStore or pathlib.Path): An open store, or the path to the database file.
         force (bool): If True, process files even if they have been processed before.
         verbose (bool): If True, print detailed processing information.
+        paranoid (bool): If True, always compare content hashes instead of trusting unchanged file metadata.
+        jobs (int): Number of worker processes used to read and clean files. 1 processes files
+            in the current process, 0 uses one worker per CPU.
+        stats (RunStats, optional): Collects stage timings and counters for the run, including
+            the time spent in worker processes.
 
     Returns:
-        list[str]: A list of modified subtitle file paths.
+        list[str]: A list of modified subtitle file paths, in input order.
     """
+    stats = RunStats() if stats is None else stats
+    start = time.perf_counter()
     modified_files = []
-    for subtitle_file in subtitle_files:
-        if process_subtitle_file(subtitle_file, db_path, force, verbose):
-            modified_files.append(subtitle_file)
-    return modified_files
+    try:
+        with open_store(db) as store:
+            _use_ad_patterns(store)
+            if jobs != 1:
+                return _process_subtitle_files_in_pool(subtitle_files, store, force, verbose, paranoid, jobs, stats)
+
+            for subtitle_file in subtitle_files:
+                if process_subtitle_file(subtitle_file, store, force, verbose, paranoid, stats):
+                    modified_files.append(subtitle_file)
+                store.finish(subtitle_file)
+        return modified_files
+    finally:
+        stats.wall_seconds += time.perf_counter() - start
+
+
+def _process_subtitle_files_in_pool(subtitle_files, store, force, verbose, paranoid, jobs, stats):  # noqa: PLR0913, PLR0917
+    """
+    Process subtitle files with a pool of worker processes. See process_subtitle_files.
+
+    Database lookups and writes stay in this process, so SQLite only ever sees one
+    writer. Workers read, parse and rewrite files, and up to PREFETCH_PER_JOB files
+    per worker are queued so the next reads are already underway while results
+    are being recorded. Each worker task returns its own RunStats, merged into ``stats``.
+    """
+    pool = _WorkerPool(store, jobs or os.cpu_count() or 1, not force and not paranoid, verbose, stats)
+    try:
+        for index, subtitle_file_path in enumerate(subtitle_files):
+            try:
+                pending = _check_processed(pathlib.Path(subtitle_file_path), store, force, verbose, paranoid, stats)
+            except Exception as e:
+                error(f"Error processing {subtitle_file_path}: {e}", path=str(subtitle_file_path))
+                stats.add_failure(subtitle_file_path)
+                pending = None
+            if pending is None:
+                store.finish(subtitle_file_path)
+                continue
+            pool.submit(index, subtitle_file_path, pending)
+
+        pool.collect_all()
+    finally:
+        pool.shutdown()
+
+    return [subtitle_file_path for _, subtitle_file_path in sorted(pool.modified_files)]
+
+
+class _WorkerPool:
+    """
+    The worker processes of _process_subtitle_files_in_pool and the files in flight.
+
+    A worker that dies (e.g. killed by the kernel when a container runs out of memory)
+    breaks the whole pool, and there is no telling which of the files in flight it was
+    working on. Those files are then retried one at a time in a new pool, so only a
+    file that kills a worker on its own is recorded as failed and the run carries on.
+    """
+
+    def __init__(self, store, jobs, dedupe, verbose, stats):  # noqa: PLR0913, PLR0917
+        """
+        Start the workers.
+
+        Args:
+            store (ProcessedFilesStore): The processed files database.
+            jobs (int): The number of worker processes.
+            dedupe (bool): If True, workers skip contents already found clean at another path.
+            verbose (bool): If True, print detailed processing information.
+            stats (RunStats): Collects stage timings and counters, including those of the workers.
+        """
+        self.store = store
+        self.jobs = jobs
+        self.dedupe = dedupe
+        self.verbose = verbose
+        self.stats = stats
+        # The modified files as (index, path), in the order their results came in
+        self.modified_files = []
+        # Each pending future mapped to the (index, path, pending) of its file
+        self.in_flight = {}
+        self.executor = self._start()
+
+    def _start(self):
+        """Start a pool of worker processes."""
+        import concurrent.futures
+
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.jobs,
+            initializer=_init_worker,
+            initargs=(self.store.db_path, self.store.pattern_set, output_settings()),
+        )
+
+    def submit(self, index, subtitle_file_path, pending):
+        """
+        Hand a file to the workers, then wait for one to finish if enough files are queued.
+
+        Args:
+            index (int): The position of the file in the input.
+            subtitle_file_path (str): The path to the subtitle file.
+            pending (tuple): The (stat_result, record, new_patterns) returned by _check_processed.
+        """
+        import concurrent.futures
+
+        task = (index, subtitle_file_path, pending)
+        future = self._submit(task)
+        if future is None:
+            self._retry_lost([task])
+            return
+        self.in_flight[future] = task
+
+        if len(self.in_flight) >= self.jobs * PREFETCH_PER_JOB:
+            done, _ = concurrent.futures.wait(self.in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            self._collect(done)
+
+    def collect_all(self):
+        """Wait for every file in flight and record its result."""
+        self._collect(list(self.in_flight))
+
+    def shutdown(self):
+        """Stop the workers."""
+        self.executor.shutdown()
+
+    def _submit(self, task):
+        """Hand a file to a worker, or return None if the pool is broken."""
+        from concurrent.futures.process import BrokenProcessPool
+
+        _, subtitle_file_path, (_, record, new_patterns) = task
+        try:
+            return self.executor.submit(
+                _clean_subtitle_file_with_stats,
+                pathlib.Path(subtitle_file_path),
+                None if record is None else record.file_hash,
+                new_patterns,
+                self.store.hash_algorithm,
+                self.dedupe,
+            )
+        except BrokenProcessPool:
+            return None
+
+    def _record(self, future, task):
+        """Record the result of a finished worker task, or return False if it was lost with a dead worker."""
+        from concurrent.futures.process import BrokenProcessPool
+
+        index, subtitle_file_path, pending = task
+        try:
+            result, worker_stats, messages = future.result()
+            replay_output(messages)
+            self.stats.merge(worker_stats)
+            if _record_result(pathlib.Path(subtitle_file_path), self.store, pending, result, self.verbose, self.stats):
+                self.modified_files.append((index, subtitle_file_path))
+        except BrokenProcessPool:
+            return False
+        except Exception as e:
+            error(f"Error processing {subtitle_file_path}: {e}", path=str(subtitle_file_path))
+            self.stats.add_failure(subtitle_file_path)
+        self.store.finish(subtitle_file_path)
+        return True
+
+    def _collect(self, done):
+        """Record the results of finished worker tasks."""
+        lost = []
+        for future in done:
+            task = self.in_flight.pop(future)
+            if not self._record(future, task):
+                lost.append(task)
+        if lost:
+            self._retry_lost(lost)
+
+    def _retry_lost(self, lost):
+        """Retry the files lost with a dead worker one at a time in a new pool, along with the rest in flight."""
+        # Every file still in flight is lost with the broken pool, except those finished before it broke
+        in_flight, self.in_flight = self.in_flight, {}
+        for future, task in in_flight.items():
+            if not self._record(future, task):
+                lost.append(task)
+        warning(f"A worker process died, retrying the {len(lost)} files in flight one at a time")
+
+        self.executor.shutdown()
+        self.executor = self._start()
+        for task in sorted(lost, key=lambda task: task[0]):
+            future = self._submit(task)
+            if future is not None and self._record(future, task):
+                continue
+            _, subtitle_file_path, _ = task
+            error(f"Error processing {subtitle_file_path}: its worker process died", path=str(subtitle_file_path))
+            self.stats.add_failure(subtitle_file_path)
+            self.store.finish(subtitle_file_path)
+            self.executor.shutdown()
+            self.executor = self._start()
+
+
+def in_shard(subtitle_file_path, shard) -> bool:
+    """
+    Check if a subtitle file belongs to a shard of the library.
+
+    Files are assigned by a hash of their path, so every run, on any host, assigns a
+    path to the same shard, as long as the library is mounted at the same path.
+
+    Args:
+        subtitle_file_path (str): The path to the subtitle file.
+        shard (tuple[int, int]): The shard number, starting from 1, and the number of shards.
+
+    Returns:
+        bool: True if the file belongs to the shard.
+    """
+    number, count = shard
+    digest = hashlib.blake2b(os.fsencode(subtitle_file_path), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count == number - 1
+
+
+def parse_shard(value) -> tuple[int, int]:
+    """
+    Parse a shard given as ``I/N``.
+
+    Args:
+        value (str): The shard number and the number of shards, e.g. ``2/3``.
+
+    Returns:
+        tuple[int, int]: The shard number and the number of shards.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not a valid shard.
+    """
+    number, _, count = value.partition("/")
+    try:
+        shard = int(number), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, got {value!r}") from None
+    if not 1 <= shard[0] <= shard[1]:
+        raise argparse.ArgumentTypeError(f"shard number must be between 1 and {shard[1]}, got {value!r}")
+    return shard
+
+
+def split_priority(line) -> tuple[str, Optional[int]]:
+    """
+    Split a line read with --order priority into the path and its priority.
+
+    Args:
+        line (str): The priority, a tab and the path.
+
+    Returns:
+        tuple[str, Optional[int]]: The path and its priority, or the whole line and None if it
+        doesn't start with a priority.
+    """
+    priority, separator, path = line.partition("\t")
+    try:
+        return (path, int(priority)) if separator else (line, None)
+    except ValueError:
+        return line, None
+
+
+def read_subtitle_paths(stream, null_delimited=False) -> Iterator[str]:
+    """
+    Yield subtitle file paths from a stream as they arrive, skipping duplicates.
+
+    Binary streams are decoded like filenames (undecodable bytes are preserved with
+    surrogateescape). Duplicates are tracked by a 64-bit digest of each path rather
+    than the path itself, to keep memory use small on very long inputs.
+
+    Args:
+        stream: The stream to read, usually sys.stdin.
+        null_delimited (bool): If True, paths are separated by NUL characters (``find -print0``)
+            and used verbatim. Otherwise they are one per line and stripped of surrounding whitespace.
+
+    Yields:
+        str: Each distinct subtitle file path.
+    """
+    source = getattr(stream, "buffer", stream)
+    seen = set()
+    for record in _split_records(source, null_delimited):
+        path = os.fsdecode(record) if isinstance(record, bytes) else record
+        if not null_delimited:
+            path = path.strip()
+        if not path:
+            continue
+
+        key = hashlib.blake2b(os.fsencode(path), digest_size=8).digest()
+        if key in seen:
+            continue
+        seen.add(key)
+        yield path
+
+
+def _split_records(source, null_delimited):
+    """Yield the raw records of a text or binary stream without waiting for it to end."""
+    if not null_delimited:
+        yield from source
+        return
+
+    # read1 returns whatever is available instead of blocking until the chunk is full
+    read = getattr(source, "read1", source.read)
+    remainder = read(0)
+    separator = b"\0" if isinstance(remainder, bytes) else "\0"
+    while True:
+        chunk = read(STDIN_CHUNK_SIZE)
+        if not chunk:
+            break
+        *records, remainder = (remainder + chunk).split(separator)
+        yield from records
+    yield remainder
 
 
 def _parse_args():
@@ -392,16 +1250,152 @@ def _parse_args():
         help="Specify a custom location for the database file",
     )
     parser.add_argument("--force", action="store_true", help="Process files even if they have been processed before")
+    parser.add_argument(
+        "-0",
+        "--null",
+        action="store_true",
+        help="Read NUL-separated file paths from stdin (as produced by find -print0)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to clean files (0 uses one per CPU, default: 1)",
+    )
+    parser.add_argument(
+        "--paranoid",
+        action="store_true",
+        help="Always hash files to detect changes instead of trusting unchanged size and modification time",
+    )
+    parser.add_argument(
+        "--hash-algorithm",
+        choices=sorted(HASH_ALGORITHMS),
+        default=DEFAULT_HASH_ALGORITHM,
+        help="Algorithm used to hash file contents. Files recorded with another one are rehashed when they are "
+        f"next read (default: {DEFAULT_HASH_ALGORITHM})",
+    )
+    parser.add_argument(
+        "--scan",
+        action="append",
+        metavar="DIR",
+        help="Find subtitle files under DIR instead of reading paths from stdin (can be repeated)",
+    )
+    parser.add_argument(
+        "--ext",
+        action="append",
+        metavar="EXT",
+        help="File extension picked up by --scan (can be repeated, default: .srt)",
+    )
+    parser.add_argument(
+        "--scan-threads",
+        type=int,
+        default=DEFAULT_SCAN_THREADS,
+        help=f"Number of threads listing directories in --scan mode (default: {DEFAULT_SCAN_THREADS})",
+    )
+    parser.add_argument(
+        "--watch",
+        action="append",
+        metavar="DIR",
+        help="Keep running and clean subtitle files under DIR as they are created or changed (Linux only, "
+        "can be repeated)",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        metavar="SECONDS",
+        help=f"In --watch mode, wait until a file has not changed for SECONDS (default: {DEFAULT_DEBOUNCE:g})",
+    )
+    parser.add_argument(
+        "--reconcile-interval",
+        type=float,
+        default=DEFAULT_RECONCILE_INTERVAL,
+        metavar="SECONDS",
+        help="In --watch mode, sweep the whole tree every SECONDS to catch changes inotify missed "
+        f"(default: {DEFAULT_RECONCILE_INTERVAL:g})",
+    )
+    parser.add_argument(
+        "--serve",
+        nargs="?",
+        const=DEFAULT_SOCKET_PATH,
+        metavar="SOCKET",
+        help="Keep running and clean the subtitle files submitted with subscleaner-client on the Unix socket "
+        f"SOCKET (default: {DEFAULT_SOCKET_PATH})",
+    )
+    parser.add_argument(
+        "--prune-unchanged",
+        action="store_true",
+        help="In --scan and --watch mode, skip directories whose modification time is unchanged since the last "
+        "completed scan",
+    )
+    parser.add_argument(
+        "--order",
+        choices=["input", "newest", "priority"],
+        default="input",
+        help="Order files are processed in: as they are read, by newest modification time, or by the priority "
+        "given before each path on stdin, as PRIORITY<TAB>PATH, highest first. Files are only processed once "
+        "all of them are read, unless this is input (default: input)",
+    )
+    parser.add_argument(
+        "--on-locked",
+        choices=["exit", "join"],
+        default="exit",
+        help="What to do when another run is already processing files with the same database: exit right away, "
+        "or queue the files for that run (default: exit)",
+    )
+    parser.add_argument("--stats", action="store_true", help="Print per-stage timings and counters after the run")
+    parser.add_argument(
+        "--stats-json",
+        type=pathlib.Path,
+        metavar="PATH",
+        help="Write per-stage timings and counters to PATH as JSON after the run",
+    )
     parser.add_argument("--version", action="store_true", help="Show version information and exit")
     parser.add_argument("--reset-db", action="store_true", help="Reset the database (remove all stored file hashes)")
-    parser.add_argument("--list-patterns", action="store_true", help="List all advertisement patterns being used")
     parser.add_argument(
+        "--gc",
+        action="store_true",
+        help="Remove the database entries of subtitle files that no longer exist, then compact the database",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="I/N",
+        help="Only process the subtitle files of shard I out of N, assigned by a hash of their path, to split a "
+        "library between several hosts",
+    )
+    parser.add_argument(
+        "--merge",
+        action="append",
+        type=pathlib.Path,
+        metavar="SHARD_DB",
+        help="Copy the entries of SHARD_DB, e.g. the database of a --shard run, into the database (can be repeated)",
+    )
+    parser.add_argument("--list-patterns", action="store_true", help="List all advertisement patterns being used")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument(
         "-v",
         "--verbose",
         action="store_true",
         help="Increase output verbosity (show analyzing/skipping messages)",
     )
-    return parser.parse_args()
+    verbosity.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="Only show warnings and errors",
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=["text", "json"],
+        default="text",
+        help="Write messages as plain text or as one JSON object per line (default: text)",
+    )
+    args = parser.parse_args()
+    if args.order == "priority" and args.scan:
+        parser.error("--order priority reads priorities from stdin, it can't be used with --scan")
+    return args
 
 
 def _print_version():
@@ -422,6 +1416,8 @@ def _reset_database(db_path):
     if db_path.exists():
         try:
             db_path.unlink()
+            for suffix in ("-wal", "-shm"):
+                pathlib.Path(f"{db_path}{suffix}").unlink(missing_ok=True)
             print(f"Database reset successfully: {db_path}")
         except Exception as e:
             print(f"Error resetting database: {e}")
@@ -429,11 +1425,343 @@ def _reset_database(db_path):
         print(f"No database found at {db_path}")
 
 
+def _collect_garbage(db_path):
+    """Drop the records of deleted subtitle files and compact the database."""
+    if not db_path.exists():
+        print(f"No database found at {db_path}")
+        return
+    # A running batch caches the ids of the directories it records files in, which this may delete
+    with run_lock(db_path) as locked:
+        if not locked:
+            error(f"Another run is processing files with {db_path}, not collecting garbage")
+            return
+        try:
+            with ProcessedFilesStore(db_path) as store:
+                result = store.collect_garbage()
+        except sqlite3.OperationalError as e:
+            error(f"Error collecting garbage in {db_path}: {e}")
+            return
+    print(f"Removed {result.files_removed} entries of missing files and {result.dirs_removed} directories")
+    print(f"Database size: {result.size_before / 1024:.0f} KiB -> {result.size_after / 1024:.0f} KiB")
+
+
+def _merge_databases(db_path, shard_db_paths):
+    """Copy the records of the shard databases into the database."""
+    with run_lock(db_path) as locked:
+        if not locked:
+            error(f"Another run is processing files with {db_path}, not merging")
+            return
+        with ProcessedFilesStore(db_path) as store:
+            for shard_db_path in shard_db_paths:
+                if not shard_db_path.exists():
+                    error(f"No database found at {shard_db_path}")
+                    continue
+                info(f"Merged {store.merge(shard_db_path)} entries from {shard_db_path}")
+
+
+def _exit_on_signal(signum, _frame):
+    """Exit the process when a termination signal is received."""
+    sys.exit(128 + signum)
+
+
 def _list_patterns():
     """List the configured ad patterns."""
     print("Advertisement patterns being used:")
-    for i, pattern in enumerate(AD_PATTERNS, 1):
-        print(f"{i}. {pattern.pattern}")
+    for i, source in enumerate(AD_PATTERN_SOURCES, 1):
+        print(f"{i}. {source}")
+
+
+def _report_run(args, modified_files, stats):
+    """Print the outcome of a run and write the requested statistics."""
+    if modified_files:
+        info(f"Modified {len(modified_files)} files")
+    if args.stats:
+        flush_output()
+        print(stats.format_table())
+    if args.stats_json:
+        args.stats_json.write_text(stats.to_json())
+    info("Done")
+
+
+def _schedule(subtitle_files, args) -> Iterator[tuple[str, Optional[int]]]:
+    """Keep the subtitle files of the --shard, if one was given, and give them their --order priority."""
+    for subtitle_file in subtitle_files:
+        path, priority = split_priority(subtitle_file) if args.order == "priority" else (subtitle_file, None)
+        if args.shard is not None and not in_shard(path, args.shard):
+            continue
+        if args.order == "newest":
+            try:
+                priority = os.stat(path).st_mtime_ns
+            except OSError:
+                # Left for last, its processing reports the error
+                priority = None
+        yield path, priority
+
+
+def _process_through_queue(subtitle_files, store, args, stats):
+    """
+    Process subtitle files by way of the work queue in the database.
+
+    The files left over by an interrupted run are processed first. Then, with --order
+    input, each file is queued as it is read and processed right away, and the files
+    queued by runs that joined this one are processed last. With another --order, every
+    file is queued before the first one is processed, and the queue is then worked
+    through by decreasing priority, so e.g. the subtitles downloaded since the last run
+    are cleaned first in a pass over a whole library.
+
+    Files still being processed when the store commits a batch of records are added to
+    the queue in that commit, and leave it in the same commit as their own record, see
+    ProcessedFilesStore.take. A run that is killed leaves the files it was working on
+    queued, and the next run processes them before its own input. Files finished since
+    the last commit are processed again too, usually skipped on their metadata, except
+    those modified in the last few seconds (see store.RACY_MTIME_WINDOW_NS), which are hashed again.
+
+    Args:
+        subtitle_files (Iterable[tuple[str, Optional[int]]]): The subtitle file paths and their
+            priority, consumed lazily.
+        store (ProcessedFilesStore): The processed files database, whose run lock is held.
+        args (argparse.Namespace): The command line options.
+        stats (RunStats): Collects stage timings and counters for the run.
+
+    Returns:
+        list[str]: The modified subtitle file paths.
+    """
+    subtitle_files = iter(subtitle_files)
+    if args.order != "input":
+        for new_files in iter(lambda: list(itertools.islice(subtitle_files, QUEUE_CHUNK_SIZE)), []):
+            store.enqueue(new_files)
+            store.flush()
+
+    # A single call, so --jobs keeps one pool of workers for the whole run
+    return process_subtitle_files(
+        itertools.chain(_take_queued(store), _take_new(store, subtitle_files), _take_queued(store)),
+        store,
+        args.force,
+        args.verbose,
+        args.paranoid,
+        args.jobs,
+        stats,
+    )
+
+
+def _take_queued(store):
+    """Yield the files of the work queue, taking each one from it as it is yielded."""
+    while queued := store.get_queued(QUEUE_CHUNK_SIZE):
+        for queue_id, subtitle_file in queued:
+            store.take(subtitle_file, queue_id)
+            yield subtitle_file
+
+
+def _take_new(store, subtitle_files):
+    """Yield the subtitle files as they are read, adding each one to the work queue as it is yielded."""
+    for subtitle_file, priority in subtitle_files:
+        store.take(subtitle_file, priority=priority)
+        yield subtitle_file
+
+
+def _join_or_exit(args, db_path, subtitle_files):
+    """
+    Handle a run started while another one holds the run lock, as chosen with --on-locked.
+
+    Joining queues the files for the running run, which processes them before it exits;
+    files queued just as it is exiting are left for the next run. Exiting doesn't open
+    the database at all.
+    """
+    if args.on_locked == "exit":
+        warning(f"Another run is processing files with {db_path}, exiting")
+        return
+
+    queued = 0
+    with ProcessedFilesStore(db_path, hash_algorithm=args.hash_algorithm) as store:
+        for new_files in iter(lambda: list(itertools.islice(subtitle_files, QUEUE_CHUNK_SIZE)), []):
+            store.enqueue(new_files)
+            store.flush()
+            queued += len(new_files)
+    info(f"Another run is processing files with {db_path}, queued {queued} files for it")
+
+
+def _save_scanned_dirs(store, scanner, failed_paths):
+    """
+    Record the directories of a completed scan, so the next one can skip those that are unchanged.
+
+    A directory holding a file that failed is recorded as if its mtime were too recent
+    to be trusted, so it is listed again until each of its files got through.
+
+    Args:
+        store (ProcessedFilesStore): The processed files database.
+        scanner (DirectoryScanner): The scanner, once its scan is exhausted.
+        failed_paths (list[str]): The paths of the files that failed since the scan started.
+    """
+    scanned_dirs = dict(scanner.scanned_dirs)
+    for directory in {os.path.dirname(path) for path in failed_paths} & scanned_dirs.keys():
+        scanned_dirs[directory] = (None, scanned_dirs[directory][1])
+    store.save_scanned_dirs(scanned_dirs)
+
+
+def _scan_and_process(args, db_path):
+    """Process the subtitle files found under the --scan directories."""
+    roots = [os.path.abspath(root) for root in args.scan]
+    if args.verbose:
+        info("Starting script")
+
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    stats = RunStats()
+    with run_lock(db_path) as locked:
+        if not locked:
+            scanner = DirectoryScanner(args.ext or DEFAULT_EXTENSIONS, args.scan_threads)
+            _join_or_exit(args, db_path, _schedule(scanner.scan(roots), args))
+            return
+
+        with ProcessedFilesStore(db_path, hash_algorithm=args.hash_algorithm) as store:
+            _use_ad_patterns(store)
+            scanner = DirectoryScanner(
+                args.ext or DEFAULT_EXTENSIONS,
+                args.scan_threads,
+                store.get_scanned_dirs(roots) if args.prune_unchanged and not args.force else None,
+            )
+            modified_files = _process_through_queue(_schedule(scanner.scan(roots), args), store, args, stats)
+            # Only a completed run may be used to prune the next one
+            _save_scanned_dirs(store, scanner, stats.failed_paths)
+
+    if args.verbose and scanner.pruned_dirs:
+        info(f"Skipped {scanner.pruned_dirs} unchanged directories")
+    _report_run(args, modified_files, stats)
+
+
+def _watch_and_process(args, db_path):
+    """
+    Clean subtitle files under the --watch directories as they are created or changed.
+
+    Changed files are handled as soon as they are ready. A reconcile sweep of the
+    whole tree runs at startup, every --reconcile-interval seconds and whenever
+    inotify loses events; its files are only taken up while no change is waiting.
+    """
+    roots = [os.path.abspath(root) for root in args.watch]
+    extensions = args.ext or DEFAULT_EXTENSIONS
+
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    stats = RunStats()
+    modified_files = []
+    start = time.perf_counter()
+    try:
+        store = ProcessedFilesStore(db_path, hash_algorithm=args.hash_algorithm)
+        with store, SubtitleWatcher(roots, extensions, args.debounce) as watcher:
+            _use_ad_patterns(store)
+            if args.verbose:
+                info(f"Watching {watcher.watched_dirs} directories")
+
+            scanner = sweep = None
+            next_sweep = time.monotonic()
+            while True:
+                if sweep is None and (watcher.overflowed or time.monotonic() >= next_sweep):
+                    watcher.overflowed = False
+                    next_sweep = time.monotonic() + args.reconcile_interval
+                    previous_dirs = store.get_scanned_dirs(roots) if args.prune_unchanged and not args.force else None
+                    # Only the files failing during this sweep keep their directories from being pruned
+                    stats.failed_paths.clear()
+                    scanner = DirectoryScanner(extensions, args.scan_threads, previous_dirs)
+                    sweep = scanner.scan(roots)
+
+                ready = watcher.poll(0 if sweep is not None else max(0.0, next_sweep - time.monotonic()))
+                if not ready and sweep is not None:
+                    ready = list(itertools.islice(sweep, SWEEP_BATCH_SIZE))
+                    if not ready:
+                        _save_scanned_dirs(store, scanner, stats.failed_paths)
+                        sweep = None
+
+                for subtitle_file in ready:
+                    if process_subtitle_file(subtitle_file, store, args.force, args.verbose, args.paranoid, stats):
+                        modified_files.append(subtitle_file)
+                # Commit and report right away instead of waiting for the next write, the next change may be hours away
+                store.flush()
+                flush_output()
+    except OSError as e:
+        error(f"Error watching {', '.join(roots)}: {e}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stats.wall_seconds = time.perf_counter() - start
+        _report_run(args, modified_files, stats)
+
+
+def _serve_and_process(args, db_path):
+    """
+    Clean the subtitle files submitted on the --serve socket.
+
+    The ad patterns stay compiled and the database stays open between requests,
+    so each file costs only its own processing.
+    """
+    from .server import CleaningServer
+
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    stats = RunStats()
+    modified_files = []
+    start = time.perf_counter()
+    try:
+        with ProcessedFilesStore(db_path, hash_algorithm=args.hash_algorithm) as store:
+            _use_ad_patterns(store)
+
+            def clean_file(subtitle_file, force):
+                file_stats = RunStats()
+                if process_subtitle_file(
+                    subtitle_file,
+                    store,
+                    args.force or force,
+                    args.verbose,
+                    args.paranoid,
+                    file_stats,
+                ):
+                    modified_files.append(subtitle_file)
+                stats.merge(file_stats)
+                return file_stats
+
+            def request_done():
+                store.flush()
+                flush_output()
+
+            with CleaningServer(args.serve, clean_file, request_done) as server:
+                if args.verbose:
+                    info(f"Listening on {args.serve}")
+                server.serve_forever()
+    except OSError as e:
+        error(f"Error serving on {args.serve}: {e}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stats.wall_seconds = time.perf_counter() - start
+        _report_run(args, modified_files, stats)
+
+
+def _read_and_process(args, db_path):
+    """
+    Process subtitle files as their paths arrive on stdin.
+
+    Without any path, the files an interrupted run left in the work queue are still processed.
+    """
+    subtitle_files = _schedule(read_subtitle_paths(sys.stdin, args.null), args)
+    first_file = next(subtitle_files, None)
+    if first_file is None and not os.path.exists(db_path):
+        info(NO_INPUT_MESSAGE)
+        return
+    if first_file is not None:
+        subtitle_files = itertools.chain([first_file], subtitle_files)
+
+    if args.verbose:
+        info("Starting script")
+
+    # Turn SIGTERM (e.g. `docker stop`) into a normal exit so pending database writes get flushed
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    stats = RunStats()
+    with run_lock(db_path) as locked:
+        if not locked:
+            _join_or_exit(args, db_path, subtitle_files)
+            return
+        with ProcessedFilesStore(db_path, hash_algorithm=args.hash_algorithm) as store:
+            if first_file is None and not store.get_queued(1):
+                info(NO_INPUT_MESSAGE)
+                return
+            modified_files = _process_through_queue(subtitle_files, store, args, stats)
+    _report_run(args, modified_files, stats)
 
 
 def main():
@@ -444,6 +1772,7 @@ def main():
     and processes subtitle files provided via stdin.
     """
     args = _parse_args()
+    configure_output(WARNING if args.quiet else INFO, args.log_format == "json")
 
     # Handle version request
     if args.version:
@@ -463,21 +1792,21 @@ def main():
         _list_patterns()
         return
 
-    # Initialize database if not resetting
-    init_db(db_path)
-
-    # Process subtitle files
-    subtitle_files = [file_path.strip() for file_path in sys.stdin]
-    if not subtitle_files:
-        print("No subtitle files provided. Pipe filenames to subscleaner or use --help for more information.")
+    if args.gc:
+        _collect_garbage(db_path)
         return
 
-    if args.verbose:
-        print("Starting script")
-    modified_files = process_subtitle_files(subtitle_files, db_path, args.force, args.verbose)
-    if modified_files:
-        print(f"Modified {len(modified_files)} files")
-    print("Done")
+    if args.merge:
+        _merge_databases(db_path, args.merge)
+    elif args.serve:
+        _serve_and_process(args, db_path)
+    elif args.watch:
+        _watch_and_process(args, db_path)
+    elif args.scan:
+        _scan_and_process(args, db_path)
+    else:
+        _read_and_process(args, db_path)
+    flush_output()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,224 @@
+"""Watch directories for new and changed subtitle files with Linux inotify."""
+
+"""
+Subscleaner.
+Copyright (C) 2023 Roger Gonzalez
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import errno
+import os
+import select
+import struct
+import time
+
+from .output import error
+from .scanner import DEFAULT_EXTENSIONS
+
+DEFAULT_DEBOUNCE = 5.0
+DEFAULT_RECONCILE_INTERVAL = 3600.0
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+READ_SIZE = 64 * 1024
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """Thin wrapper around a Linux inotify instance, called through ctypes."""
+
+    def __init__(self):
+        """
+        Create the inotify instance.
+
+        Raises:
+            OSError: If inotify is not available on this system.
+        """
+        import ctypes
+
+        # The global namespace of the process includes libc, on glibc and musl alike
+        libc = ctypes.CDLL(None, use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            init = libc.inotify_init1
+        except AttributeError:
+            raise OSError(errno.ENOSYS, "inotify is not available on this system") from None
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._get_errno = ctypes.get_errno
+
+        self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.paths = {}
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """
+        Watch a directory.
+
+        Args:
+            path (str): The directory to watch.
+            mask (int): The events to report.
+
+        Raises:
+            OSError: If the watch could not be added, e.g. because the watch limit was reached.
+        """
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = self._get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self.paths[wd] = path
+
+    def read_events(self, timeout):
+        """
+        Wait for events and read the ones available.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            list[tuple[str, str, int]]: The (watched directory, entry name, mask) of each event.
+                The directory is None for queue overflows.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+            events.append((self.paths.get(wd), name, mask))
+        return events
+
+    def close(self):
+        """Close the inotify instance, removing every watch."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class SubtitleWatcher:
+    """
+    Report subtitle files once they have been created or changed and then left alone.
+
+    Every directory under the roots is watched, including directories created
+    later. A file is reported once no event has been seen for it during
+    ``debounce`` seconds, so files still being downloaded are not picked up
+    half-written.
+    """
+
+    def __init__(self, roots, extensions=DEFAULT_EXTENSIONS, debounce=DEFAULT_DEBOUNCE):
+        """
+        Start watching.
+
+        Args:
+            roots (Iterable[str]): The directories to watch, with everything below them.
+            extensions (Iterable[str]): File extensions to report, matched case-insensitively.
+            debounce (float): Seconds without events after which a file is reported.
+
+        Raises:
+            OSError: If inotify is not available.
+        """
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.debounce = debounce
+        self.overflowed = False
+        self.pending = {}
+        self.inotify = Inotify()
+        for root in roots:
+            self._watch_tree(os.path.abspath(root), report_files=False)
+
+    def __enter__(self):
+        """Return the watcher itself."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop watching."""
+        self.inotify.close()
+
+    @property
+    def watched_dirs(self):
+        """int: The number of directories being watched."""
+        return len(self.inotify.paths)
+
+    def _watch_tree(self, directory, report_files):
+        """Watch a directory and its subdirectories, optionally reporting the files already in them."""
+        for dir_path, _, file_names in os.walk(directory):
+            try:
+                self.inotify.add_watch(dir_path)
+            except OSError as e:
+                # Typically the fs.inotify.max_user_watches limit, the reconcile sweep still covers the rest
+                error(f"Error watching {dir_path}: {e}")
+                self.overflowed = True
+                return
+            if report_files:
+                for name in file_names:
+                    self._touch(os.path.join(dir_path, name))
+
+    def _touch(self, path):
+        """Push back the time at which a file is reported."""
+        if path.lower().endswith(self.extensions):
+            self.pending[path] = time.monotonic() + self.debounce
+
+    def poll(self, timeout):
+        """
+        Wait for subtitle files to become ready.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            list[str]: The files that saw no event during the debounce delay, in the order they became ready.
+        """
+        now = time.monotonic()
+        if self.pending:
+            timeout = min(timeout, max(0.0, min(self.pending.values()) - now))
+
+        for directory, name, mask in self.inotify.read_events(timeout):
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, only a full sweep can tell what changed
+                self.overflowed = True
+            elif directory is None or not name:
+                continue
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files can land in a new directory before its watch is added
+                    self._watch_tree(os.path.join(directory, name), report_files=True)
+            else:
+                self._touch(os.path.join(directory, name))
+
+        now = time.monotonic()
+        ready = sorted((due, path) for path, due in self.pending.items() if due <= now)
+        for _, path in ready:
+            del self.pending[path]
+        return [path for _, path in ready]
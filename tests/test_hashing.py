@@ -0,0 +1,41 @@
+"""Unit tests for the hashing module."""
+
+import hashlib
+
+import pytest
+
+from src.subscleaner.hashing import (
+    HASH_ALGORITHMS,
+    READ_BUFFER_SIZE,
+    format_hash,
+    hash_algorithm_of,
+    hash_content,
+    hash_file,
+    split_hash,
+)
+
+
+def test_md5_hashes_are_bare_digests():
+    """Test that MD5 hashes keep the format recorded by older versions."""
+    assert hash_content(b"content", "md5") == hashlib.md5(b"content").hexdigest()
+    assert split_hash(hashlib.md5(b"content").hexdigest()) == ("md5", hashlib.md5(b"content").hexdigest())
+
+
+@pytest.mark.parametrize("algorithm", sorted(HASH_ALGORITHMS))
+def test_hash_round_trip(algorithm):
+    """Test that a hash tells which algorithm computed it."""
+    file_hash = hash_content(b"content", algorithm)
+    assert hash_algorithm_of(file_hash) == algorithm
+    assert format_hash(*split_hash(file_hash)) == file_hash
+
+
+@pytest.mark.parametrize("use_file_digest", [True, False])
+@pytest.mark.parametrize("algorithm", sorted(HASH_ALGORITHMS))
+def test_hash_file_matches_hash_content(tmp_path, monkeypatch, algorithm, use_file_digest):
+    """Test that hashing a file gives the hash of its content, with or without hashlib.file_digest."""
+    if not use_file_digest:
+        monkeypatch.delattr(hashlib, "file_digest", raising=False)
+    content = bytes(range(256)) * (READ_BUFFER_SIZE // 100)
+    path = tmp_path / "a.srt"
+    path.write_bytes(content)
+    assert hash_file(path, algorithm) == hash_content(content, algorithm)
@@ -0,0 +1,117 @@
+"""Unit tests for the matcher module."""
+
+import re
+
+import pytest
+
+from src.subscleaner.matcher import AdMatcher, is_context_free, required_literal
+from src.subscleaner.subscleaner import AD_PATTERNS
+
+
+@pytest.mark.parametrize(
+    "pattern, expected_literal",
+    [
+        (re.compile(r"\bnordvpn\b", re.IGNORECASE), "nordvpn"),
+        (re.compile(r"\bwww\.flixify\.app\b"), "www.flixify.app"),
+        (re.compile(r"\bSubt[íi]tulos\s+por\b"), "tulos"),
+        (re.compile(r"\bcolou?r grading\b"), "r grading"),
+        (re.compile(r"\b(optional )?prefix\b"), "prefix"),
+        (re.compile(r"\bfoo|bar\b"), ""),
+        (re.compile(r"\bfoo bar\b", re.VERBOSE), ""),
+        (re.compile(r"foo\x41bar"), ""),
+        (re.compile(r"foo\d+bar"), "foo"),
+    ],
+)
+def test_required_literal(pattern, expected_literal):
+    """
+    Test that required_literal only extracts text every match must contain.
+
+    Args:
+        pattern (re.Pattern): The pattern to analyze.
+        expected_literal (str): The expected literal.
+    """
+    assert required_literal(pattern) == expected_literal
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "This is a normal line",
+        "This line contains OpenSubtitles",
+        "OPENSUBTITLES.ORG",
+        "Subtítulos por aRGENTeaM",
+        "Subtitles\nby XYZ",
+        "Sync\tcorrections   by someone",
+        "Visit osdb.link/abc for more",
+        "osdb.link/ alone",
+        "the subscenery was lovely",
+        "YTS.MX presents",
+        "YTSxLT",
+        "Subtitled By",
+        "\u017fubscene",
+        "Subtitle\u017f by",
+        "\u0130kerslot",
+        "iker\u017flot",
+        "\u212aIKERSLOT",
+        "",
+    ],
+)
+def test_matcher_agrees_with_patterns(text):
+    """
+    Test that the matcher reports the same first hit as trying each pattern in turn.
+
+    Args:
+        text (str): The text to be checked.
+    """
+    expected = next((pattern for pattern in AD_PATTERNS if pattern.search(text)), None)
+    assert AdMatcher(AD_PATTERNS).search(text) is expected
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [r"foo\x41bar", r"foo\u0041bar", r"foo\U00000041bar", r"foo\N{LATIN CAPITAL LETTER A}bar", r"foo\101bar"],
+)
+def test_matcher_agrees_with_escapes(pattern):
+    """
+    Test that escapes taking an argument don't make the matcher miss what the pattern matches.
+
+    Args:
+        pattern (str): The pattern source.
+    """
+    compiled = re.compile(pattern)
+    for text in ("fooAbar", "foo41bar", "fooBbar"):
+        expected = compiled if compiled.search(text) else None
+        assert AdMatcher([compiled]).search(text) is expected
+
+
+def test_matcher_case_sensitive_pattern():
+    """Test that patterns without IGNORECASE keep their case sensitivity."""
+    matcher = AdMatcher([re.compile(r"\bRARBG\b")])
+    assert matcher.search("Downloaded from RARBG") is matcher.patterns[0]
+    assert matcher.search("Downloaded from rarbg") is None
+
+
+@pytest.mark.parametrize(
+    "pattern, expected",
+    [
+        (re.compile(r"\bSubtitles\s+by\b"), True),
+        (re.compile(r"^Subtitles by"), False),
+        (re.compile(r"www\.example\.com$"), False),
+        (re.compile(r"(?<!not )sponsored"), False),
+    ],
+)
+def test_is_context_free(pattern, expected):
+    """
+    Test that anchored patterns and lookarounds cannot be searched for in a whole document.
+
+    Args:
+        pattern (re.Pattern): The pattern to analyze.
+        expected (bool): Whether the pattern is context free.
+    """
+    assert is_context_free(pattern) is expected
+    assert AdMatcher([*AD_PATTERNS, pattern]).context_free is expected
+
+
+def test_default_patterns_are_context_free():
+    """Test that the built-in patterns allow searching whole documents."""
+    assert AdMatcher(AD_PATTERNS).context_free
@@ -0,0 +1,92 @@
+"""Unit tests for the output module."""
+
+import json
+
+import pytest
+
+from src.subscleaner.output import (
+    INFO,
+    WARNING,
+    capture_output,
+    configure_output,
+    error,
+    flush_output,
+    info,
+    is_enabled,
+    replay_output,
+    warning,
+)
+
+
+@pytest.fixture(autouse=True)
+def _restore_output():
+    """Go back to writing every message right away after each test."""
+    yield
+    configure_output(buffer_size=1)
+
+
+def test_messages_are_buffered(capsys):
+    """Test that messages are kept until the buffer is full, a warning arrives or the output is flushed."""
+    configure_output(buffer_size=3)
+    info("one")
+    info("two")
+    assert capsys.readouterr().out == ""
+    info("three")
+    assert capsys.readouterr().out == "one\ntwo\nthree\n"
+
+    info("four")
+    warning("five")
+    assert capsys.readouterr().out == "four\nfive\n"
+
+    info("six")
+    flush_output()
+    assert capsys.readouterr().out == "six\n"
+
+
+def test_quiet_output_keeps_warnings_and_errors(capsys):
+    """Test that messages below the configured level are dropped."""
+    configure_output(WARNING)
+    info("progress")
+    warning("skipped")
+    error("failed")
+    flush_output()
+
+    assert not is_enabled(INFO)
+    assert capsys.readouterr().out == "skipped\nfailed\n"
+
+
+def test_json_lines_output(capsys):
+    """Test that messages can be written as JSON objects with their level and extra fields."""
+    configure_output(json_lines=True)
+    info("Removing: 1\nNordVPN", path="/media/a.srt")
+    error("Error reading /media/b.srt")
+    flush_output()
+
+    entries = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(entry["level"], entry["message"], entry.get("path")) for entry in entries] == [
+        ("info", "Removing: 1\nNordVPN", "/media/a.srt"),
+        ("error", "Error reading /media/b.srt", None),
+    ]
+    assert all(isinstance(entry["time"], float) for entry in entries)
+
+
+def test_captured_messages_are_replayed_in_order(capsys):
+    """Test that captured messages are only written when replayed, after the messages kept before them."""
+    configure_output(buffer_size=10)
+    info("parent")
+    with capture_output() as messages:
+        info("worker")
+        warning("worker warning")
+    assert capsys.readouterr().out == ""
+
+    replay_output(messages)
+    assert capsys.readouterr().out == "parent\nworker\nworker warning\n"
+
+
+def test_captured_messages_are_written_on_error(capsys):
+    """Test that the messages captured before an exception are not lost."""
+    with pytest.raises(ValueError), capture_output():
+        info("before the error")
+        raise ValueError
+    flush_output()
+    assert capsys.readouterr().out == "before the error\n"
@@ -0,0 +1,71 @@
+"""Unit tests for the scanner module."""
+
+import os
+
+from src.subscleaner.scanner import DirectoryScanner
+from src.subscleaner.store import ProcessedFilesStore
+
+OLD_MTIME_NS = 1_000_000_000
+
+
+def create_library(root):
+    """Create a small media library and backdate every directory's mtime."""
+    root.mkdir(exist_ok=True)
+    season = root / "Show" / "Season 01"
+    season.mkdir(parents=True)
+    (season / "episode1.srt").write_text("subtitle")
+    (season / "episode1.mkv").write_text("video")
+    (season / "EPISODE2.SRT").write_text("subtitle")
+    movie = root / "Movie"
+    movie.mkdir()
+    (movie / "movie.en.srt").write_text("subtitle")
+    for directory in (root, root / "Show", season, movie):
+        os.utime(directory, ns=(OLD_MTIME_NS, OLD_MTIME_NS))
+    return season, movie
+
+
+def test_scan_finds_subtitles(tmp_path):
+    """Test that every subtitle file is found, with extensions matched case-insensitively."""
+    season, movie = create_library(tmp_path)
+
+    scanner = DirectoryScanner(threads=3)
+    found = sorted(scanner.scan([str(tmp_path)]))
+
+    assert found == sorted(
+        [str(season / "episode1.srt"), str(season / "EPISODE2.SRT"), str(movie / "movie.en.srt")],
+    )
+    assert len(scanner.scanned_dirs) == 4  # noqa: PLR2004
+
+
+def test_scan_prunes_unchanged_directories(tmp_path):
+    """Test that only directories whose mtime changed since the previous scan are listed again."""
+    library = tmp_path / "library"
+    season, movie = create_library(library)
+    db_path = tmp_path / "test.db"
+
+    with ProcessedFilesStore(db_path) as store:
+        scanner = DirectoryScanner()
+        assert len(list(scanner.scan([str(library)]))) == 3  # noqa: PLR2004
+        store.save_scanned_dirs(scanner.scanned_dirs)
+
+    (season / "episode3.srt").write_text("subtitle")
+    os.utime(season, ns=(OLD_MTIME_NS * 2, OLD_MTIME_NS * 2))
+
+    with ProcessedFilesStore(db_path) as store:
+        scanner = DirectoryScanner(previous_dirs=store.get_scanned_dirs([str(library)]))
+        found = sorted(scanner.scan([str(library)]))
+
+    assert found == sorted([str(season / "episode1.srt"), str(season / "EPISODE2.SRT"), str(season / "episode3.srt")])
+    assert scanner.pruned_dirs == 3  # noqa: PLR2004
+
+
+def test_scan_does_not_trust_recent_mtimes(tmp_path):
+    """Test that a directory modified just now is listed even if its mtime looks unchanged."""
+    (tmp_path / "fresh.srt").write_text("subtitle")
+
+    scanner = DirectoryScanner()
+    list(scanner.scan([str(tmp_path)]))
+    scanner = DirectoryScanner(previous_dirs=scanner.scanned_dirs)
+
+    assert list(scanner.scan([str(tmp_path)])) == [str(tmp_path / "fresh.srt")]
+    assert scanner.pruned_dirs == 0
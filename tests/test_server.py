@@ -0,0 +1,113 @@
+"""Unit tests for the server and client modules."""
+
+import os
+import socket
+import stat
+import threading
+
+import pytest
+
+from src.subscleaner.client import main, submit
+from src.subscleaner.server import CleaningServer
+from src.subscleaner.stats import RunStats
+from src.subscleaner.store import ProcessedFilesStore
+from src.subscleaner.subscleaner import process_subtitle_file
+
+AD_SRT = """1
+00:00:01,000 --> 00:00:03,000
+Hello.
+
+2
+00:00:04,000 --> 00:00:06,000
+Subtitles by OpenSubtitles
+"""
+
+
+def _clean_nothing(_subtitle_file, _force):
+    """Pretend to process a file that needed no changes."""
+    return RunStats()
+
+
+def _submit_in_thread(paths, socket_path, force=False):
+    """Submit files from a background thread, so the server can answer from the test thread."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["results"] = list(submit(paths, socket_path, force))
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def test_server_cleans_submitted_files(tmp_path):
+    """Test that the server cleans the files a client submits and reports each file's status."""
+    socket_path = str(tmp_path / "subscleaner.sock")
+    ad_file = tmp_path / "ad.srt"
+    ad_file.write_text(AD_SRT)
+    missing_file = tmp_path / "missing.srt"
+    flushes = []
+
+    with ProcessedFilesStore(tmp_path / "subscleaner.db") as store:
+
+        def clean_file(subtitle_file, force):
+            file_stats = RunStats()
+            process_subtitle_file(subtitle_file, store, force, stats=file_stats)
+            return file_stats
+
+        def request_done():
+            store.flush()
+            flushes.append(True)
+
+        with CleaningServer(socket_path, clean_file, request_done) as server:
+            assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o660  # noqa: PLR2004
+            for paths in ([ad_file, missing_file], [ad_file]):
+                thread, outcome = _submit_in_thread([str(path) for path in paths], socket_path)
+                server.handle_request()
+                thread.join()
+                assert "error" not in outcome
+                if paths == [ad_file]:
+                    assert outcome["results"] == [{"path": str(ad_file), "status": "unchanged"}]
+                else:
+                    assert outcome["results"] == [
+                        {"path": str(ad_file), "status": "modified"},
+                        {"path": str(missing_file), "status": "missing"},
+                    ]
+
+    assert "OpenSubtitles" not in ad_file.read_text()
+    assert flushes == [True, True]
+    assert not os.path.exists(socket_path)
+
+
+def test_server_rejects_invalid_requests(tmp_path):
+    """Test that a malformed request gets an error instead of crashing the server."""
+    socket_path = str(tmp_path / "subscleaner.sock")
+    with CleaningServer(socket_path, _clean_nothing) as server:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(socket_path)
+        client.sendall(b'{"files": []}\n')
+        server.handle_request()
+        with client, client.makefile("r") as responses:
+            assert "Invalid request" in responses.readline()
+
+
+def test_server_replaces_stale_socket(tmp_path):
+    """Test that a socket left by a dead server is replaced but a live server's socket is not."""
+    socket_path = str(tmp_path / "subscleaner.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+
+    with CleaningServer(socket_path, _clean_nothing), pytest.raises(OSError, match="Another server"):
+        CleaningServer(socket_path, _clean_nothing)
+
+
+def test_client_exits_when_server_unreachable(tmp_path, capsys):
+    """Test that the client exits with 2 when no server is listening."""
+    with pytest.raises(SystemExit) as excinfo:
+        main(["--socket", str(tmp_path / "missing.sock"), "a.srt"])
+    assert excinfo.value.code == 2  # noqa: PLR2004
+    assert "Error talking to subscleaner server" in capsys.readouterr().err
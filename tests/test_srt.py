@@ -0,0 +1,67 @@
+"""Unit tests for the srt module."""
+
+import pysrt
+import pytest
+
+from src.subscleaner import srt
+from src.subscleaner.srt import find_cue_blocks, iter_block_chunks, iter_cue_blocks, remove_cue_blocks
+
+SRT_TEXT = (
+    "1\r\n00:00:01,000 --> 00:00:03,000\r\nSubtitles by someone  \r\n\r\n"
+    "2\r\n00:00:04,000 --> 00:00:06,000\r\nHello,\r\nworld.\r\n\r\n\r\n"
+    "not a cue\r\n\r\n"
+    "7\r\n00:00:07,000 --> 00:00:09,000\r\nGoodbye.\r\n"
+)
+
+
+def test_find_cue_blocks_matches_pysrt():
+    """Test that cue blocks carry the same text as the cues pysrt parses."""
+    blocks = find_cue_blocks(SRT_TEXT)
+
+    assert [block.text for block in blocks] == [cue.text for cue in pysrt.from_string(SRT_TEXT)]
+    assert blocks[0].source(SRT_TEXT) == "1\r\n00:00:01,000 --> 00:00:03,000\r\nSubtitles by someone"
+
+
+def test_remove_cue_blocks_keeps_everything_else():
+    """Test that removing a block renumbers the cues and leaves the rest of the text untouched."""
+    blocks = find_cue_blocks(SRT_TEXT)
+
+    assert remove_cue_blocks(SRT_TEXT, blocks, [blocks[0]]) == (
+        "1\r\n00:00:04,000 --> 00:00:06,000\r\nHello,\r\nworld.\r\n\r\n\r\n"
+        "not a cue\r\n\r\n"
+        "2\r\n00:00:07,000 --> 00:00:09,000\r\nGoodbye.\r\n"
+    )
+
+
+def test_remove_last_cue_block():
+    """Test that the last block can be removed, with or without a trailing line break."""
+    text = "1\n00:00:01,000 --> 00:00:03,000\nHello.\n\n2\n00:00:04,000 --> 00:00:06,000\nOpenSubtitles"
+    blocks = find_cue_blocks(text)
+
+    assert remove_cue_blocks(text, blocks, blocks[1:]) == "1\n00:00:01,000 --> 00:00:03,000\nHello.\n\n"
+    assert remove_cue_blocks(text, blocks, []) == text
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 20])
+def test_iter_cue_blocks_splits_lines_in_chunks(monkeypatch, chunk_size):
+    """Test that reading lines a chunk at a time finds the same blocks, line breaks of any kind included."""
+    text = SRT_TEXT + "\r8\r00:00:10,000 --> 00:00:12,000\rOld Mac line breaks.\r"
+    expected = find_cue_blocks(text)
+    monkeypatch.setattr(srt, "LINE_CHUNK_SIZE", chunk_size)
+
+    assert list(iter_cue_blocks(text)) == expected
+    cleaned = remove_cue_blocks(text, expected, expected[:1])
+    assert remove_cue_blocks(text, iter_cue_blocks(text), expected[:1]) == cleaned
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 20])
+def test_iter_block_chunks_keeps_blocks_whole(monkeypatch, chunk_size):
+    """Test that the pieces of a text add up to it, each holding whole cue blocks."""
+    text = SRT_TEXT.replace("\n\n", "\r\n  \r\n", 1)
+    monkeypatch.setattr(srt, "LINE_CHUNK_SIZE", chunk_size)
+
+    chunks = list(iter_block_chunks(text))
+    assert "".join(chunks) == text
+    assert len(chunks) > 1
+    cue_texts = sorted(block.text for chunk in chunks for block in iter_cue_blocks(chunk))
+    assert cue_texts == sorted(block.text for block in iter_cue_blocks(text))
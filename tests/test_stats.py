@@ -0,0 +1,51 @@
+"""Unit tests for the stats module."""
+
+import json
+
+from src.subscleaner.stats import COUNTERS, STAGES, RunStats
+
+
+def test_stage_accumulates_time_and_calls():
+    """Test that each timed block adds to its stage."""
+    stats = RunStats()
+    for _ in range(3):
+        with stats.stage("parse"):
+            pass
+
+    assert stats.stage_calls["parse"] == 3  # noqa: PLR2004
+    assert stats.stage_seconds["parse"] >= 0
+    assert stats.stage_calls["read"] == 0
+
+
+def test_merge_adds_worker_stats():
+    """Test that merging adds the timers and counters of another RunStats."""
+    stats = RunStats()
+    stats.add("files_seen", 2)
+    worker_stats = RunStats()
+    worker_stats.add("files_seen")
+    worker_stats.add("cues_removed", 4)
+    worker_stats.add_failure("broken.srt")
+    with worker_stats.stage("hash"):
+        pass
+
+    stats.merge(worker_stats)
+
+    assert stats.counters["files_seen"] == 3  # noqa: PLR2004
+    assert stats.counters["cues_removed"] == 4  # noqa: PLR2004
+    assert stats.stage_calls["hash"] == 1
+    assert stats.counters["failed"] == 1
+    assert stats.failed_paths == ["broken.srt"]
+
+
+def test_json_and_table_report_every_stage_and_counter():
+    """Test that both report formats cover every stage and counter."""
+    stats = RunStats()
+    stats.add("modified")
+    data = json.loads(stats.to_json())
+    table = stats.format_table()
+
+    assert set(data["stages"]) == set(STAGES)
+    assert set(data["counters"]) == set(COUNTERS)
+    assert data["counters"]["modified"] == 1
+    for name in STAGES + COUNTERS:
+        assert name in table
@@ -0,0 +1,421 @@
+"""Unit tests for the store module."""
+
+import os
+import sqlite3
+import threading
+import types
+
+from src.subscleaner.store import MIGRATIONS, KnownContents, ProcessedFilesStore, open_store, run_lock
+
+
+def _count_committed_rows(db_path):
+    """Count the rows visible to a separate connection."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM processed_files").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _count_queued_rows(db_path):
+    """Count the work queue rows visible to a separate connection."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM work_queue").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_store_uses_wal(tmp_path):
+    """Test that the store switches the database to write-ahead logging."""
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_store_is_processed(tmp_path):
+    """Test that a file is only processed when the stored hash matches."""
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.is_processed("/media/a.srt", "hash1") is False
+        store.mark_processed("/media/a.srt", "hash1")
+        assert store.is_processed("/media/a.srt", "hash1") is True
+        assert store.is_processed("/media/a.srt", "hash2") is False
+
+
+def test_store_batches_writes(tmp_path):
+    """Test that writes are committed in batches and on close."""
+    db_path = tmp_path / "test.db"
+    store = ProcessedFilesStore(db_path, batch_size=3, flush_interval=3600)
+
+    store.mark_processed("/media/a.srt", "hash")
+    store.mark_processed("/media/b.srt", "hash")
+    assert _count_committed_rows(db_path) == 0
+
+    store.mark_processed("/media/c.srt", "hash")
+    assert _count_committed_rows(db_path) == 3  # noqa: PLR2004
+
+    store.mark_processed("/media/d.srt", "hash")
+    store.close()
+    assert _count_committed_rows(db_path) == 4  # noqa: PLR2004
+
+
+def test_store_flushes_on_interrupt(tmp_path):
+    """Test that pending writes survive a KeyboardInterrupt inside the store block."""
+    db_path = tmp_path / "test.db"
+    try:
+        with ProcessedFilesStore(db_path, flush_interval=3600) as store:
+            store.mark_processed("/media/a.srt", "hash")
+            raise KeyboardInterrupt
+    except KeyboardInterrupt:
+        pass
+
+    assert _count_committed_rows(db_path) == 1
+
+
+def test_open_store_reuses_open_store(tmp_path):
+    """Test that open_store passes an open store through without closing it."""
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        with open_store(store) as reused:
+            assert reused is store
+        assert store.conn is not None
+
+    with open_store(tmp_path / "test.db") as opened:
+        assert isinstance(opened, ProcessedFilesStore)
+    assert opened.conn is None
+
+
+def test_store_migrates_legacy_schema(tmp_path):
+    """Test that a database created before the stat columns existed is upgraded in place."""
+    db_path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+    CREATE TABLE processed_files (
+        file_path TEXT PRIMARY KEY,
+        file_hash TEXT NOT NULL,
+        processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute("INSERT INTO processed_files (file_path, file_hash) VALUES ('/media/a.srt', 'hash')")
+    conn.commit()
+    conn.close()
+
+    with ProcessedFilesStore(db_path) as store:
+        record = store.get_record("/media/a.srt")
+        assert record.file_hash == "hash"
+        assert record.mtime_ns is None
+
+
+def test_store_migrates_once_when_opened_concurrently(tmp_path):
+    """Test that connections opening a new database at the same time don't apply a migration twice."""
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def open_store_at_once():
+        barrier.wait()
+        try:
+            ProcessedFilesStore(tmp_path / "test.db").close()
+        except sqlite3.Error as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=open_store_at_once) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+
+
+def test_store_records_stat(tmp_path):
+    """Test that recorded metadata matches an unchanged file but not a modified or fresh one."""
+    subtitle_file = tmp_path / "a.srt"
+    subtitle_file.write_text("content")
+    os.utime(subtitle_file, ns=(1_000_000_000, 1_000_000_000))
+    old_stat = subtitle_file.stat()
+
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.mark_processed(str(subtitle_file), "hash", old_stat)
+        assert store.get_record(str(subtitle_file)).matches_stat(old_stat) is True
+
+        subtitle_file.write_text("other content")
+        assert store.get_record(str(subtitle_file)).matches_stat(subtitle_file.stat()) is False
+
+        # A file written just now is not trusted, its mtime may still change within the same tick
+        store.mark_processed(str(subtitle_file), "hash", subtitle_file.stat())
+        assert store.get_record(str(subtitle_file)).matches_stat(subtitle_file.stat()) is False
+
+
+def test_store_tags_rows_with_pattern_set(tmp_path):
+    """Test that legacy rows adopt the first pattern set and new rows get the current one."""
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.mark_processed("/media/legacy.srt", "hash")
+        first = store.use_pattern_set("fingerprint1", [("nordvpn", 2)])
+        store.mark_processed("/media/a.srt", "hash")
+        second = store.use_pattern_set("fingerprint2", [("nordvpn", 2), ("rarbg", 2)])
+        store.mark_processed("/media/b.srt", "hash")
+
+        assert store.use_pattern_set("fingerprint1", [("nordvpn", 2)]) == first
+        assert store.get_record("/media/legacy.srt").pattern_set == first
+        assert store.get_record("/media/a.srt").pattern_set == first
+        assert store.get_record("/media/b.srt").pattern_set == second
+        assert store.get_pattern_set(second) == {("nordvpn", 2), ("rarbg", 2)}
+
+
+def test_store_scanned_dirs_are_scoped_to_pattern_set(tmp_path):
+    """Test that directories scanned with an older pattern set are not returned for pruning."""
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.use_pattern_set("fingerprint1", [("nordvpn", 2)])
+        store.save_scanned_dirs({"/media": (1, [])})
+        assert store.get_scanned_dirs(["/media"]) == {"/media": (1, [])}
+
+        store.use_pattern_set("fingerprint2", [("nordvpn", 2), ("rarbg", 2)])
+        assert store.get_scanned_dirs(["/media"]) == {}
+
+
+def test_store_interns_dirs_and_packs_hashes(tmp_path):
+    """Test that files share their directory row and hex digests are stored as bytes."""
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.mark_processed("/media/show/a.srt", "0123456789abcdef0123456789abcdef")
+        store.mark_processed("/media/show/b.srt", "hash")
+        store.mark_processed("relative.srt", "hash")
+
+        assert store.get_hash("/media/show/a.srt") == "0123456789abcdef0123456789abcdef"
+        assert store.get_hash("/media/show/b.srt") == "hash"
+        assert store.get_hash("relative.srt") == "hash"
+        assert store.get_hash("/media/show/c.srt") is None
+        assert store.get_hash("/media/other/a.srt") is None
+        assert store.conn.execute("SELECT path FROM dirs ORDER BY path").fetchall() == [("",), ("/media/show/",)]
+        stored = store.conn.execute("SELECT file_hash FROM processed_files WHERE name = 'a.srt'").fetchone()[0]
+        assert stored == bytes.fromhex("0123456789abcdef0123456789abcdef")
+
+
+def test_store_migrates_path_keyed_schema(tmp_path):
+    """Test that rows keyed by full path are moved to the compact layout."""
+    db_path = tmp_path / "old.db"
+    conn = sqlite3.connect(db_path)
+    for statements in MIGRATIONS[:4]:
+        for statement in statements:
+            conn.execute(statement)
+    conn.execute("PRAGMA user_version = 4")
+    conn.execute(
+        """
+        INSERT INTO processed_files (file_path, file_hash, size, mtime_ns, inode, pattern_set, processed_at)
+        VALUES ('/media/a.srt', 'ffeeddccbbaa99887766554433221100', 1, 2, 3, 4, '2024-01-02 03:04:05'),
+            ('/media/b.srt', 'hash', NULL, NULL, NULL, NULL, '2024-01-02 03:04:05')
+        """,
+    )
+    conn.commit()
+    conn.close()
+
+    with ProcessedFilesStore(db_path) as store:
+        assert store.get_record("/media/a.srt") == ("ffeeddccbbaa99887766554433221100", 1, 2, 3, 4, None)
+        assert store.get_hash("/media/b.srt") == "hash"
+        processed_at = store.conn.execute("SELECT processed_at FROM processed_files WHERE name = 'a.srt'").fetchone()
+        assert processed_at == (1704164645,)
+
+
+def test_store_collect_garbage(tmp_path):
+    """Test that records of deleted files and directories are removed, but not those on an unmounted drive."""
+    library = tmp_path / "library"
+    (library / "kept").mkdir(parents=True)
+    (library / "kept" / "a.srt").write_text("subtitle")
+    unmounted = tmp_path / "mnt" / "nas"
+    unmounted.mkdir(parents=True)
+
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.mark_processed(str(library / "kept" / "a.srt"), "hash")
+        store.mark_processed(str(library / "kept" / "deleted.srt"), "hash")
+        store.mark_processed(str(library / "gone" / "b.srt"), "hash")
+        store.mark_processed(str(unmounted / "show" / "c.srt"), "hash")
+        store.mark_processed("relative.srt", "hash")
+        store.save_scanned_dirs({str(library / "gone"): (1, []), str(library / "kept"): (1, [])})
+
+        result = store.collect_garbage()
+
+        assert result.files_removed == 2  # noqa: PLR2004
+        assert result.dirs_removed == 1
+        assert store.get_hash(str(library / "kept" / "a.srt")) == "hash"
+        assert store.get_hash(str(library / "kept" / "deleted.srt")) is None
+        assert store.get_hash(str(library / "gone" / "b.srt")) is None
+        assert store.get_hash(str(unmounted / "show" / "c.srt")) == "hash"
+        assert store.get_hash("relative.srt") == "hash"
+        assert store.conn.execute("SELECT dir_path FROM scanned_dirs").fetchall() == [(str(library / "kept"),)]
+
+
+def test_store_loads_each_directory_once(tmp_path):
+    """Test that lookups in a directory are answered from memory once it has been loaded."""
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        for name in ("a.srt", "b.srt", "c.srt"):
+            store.mark_processed(f"/media/show/{name}", "hash")
+        store.flush()
+        store._clear_cache()
+
+        queries = []
+        store.conn.set_trace_callback(queries.append)
+        assert store.get_hash("/media/show/a.srt") == "hash"
+        assert store.get_hash("/media/show/b.srt") == "hash"
+        assert store.get_hash("/media/show/missing.srt") is None
+        assert store.get_hash("/media/other/a.srt") is None
+        assert store.get_hash("/media/other/b.srt") is None
+        assert len([query for query in queries if "FROM processed_files" in query]) == 1
+
+        # Writes go to the loaded records as well
+        store.mark_processed("/media/show/a.srt", "other hash")
+        store.mark_processed("/media/other/a.srt", "hash")
+        assert store.get_hash("/media/show/a.srt") == "other hash"
+        assert store.get_hash("/media/other/a.srt") == "hash"
+
+
+def test_store_cache_is_bounded(tmp_path):
+    """Test that the least recently used directories are evicted once the cache is full."""
+    with ProcessedFilesStore(tmp_path / "test.db", cache_size=3) as store:
+        for directory in ("one", "two", "three"):
+            store.mark_processed(f"/media/{directory}/a.srt", "hash")
+            store.mark_processed(f"/media/{directory}/b.srt", "hash")
+        store.flush()
+        store._clear_cache()
+
+        for directory in ("one", "two", "three"):
+            assert store.get_hash(f"/media/{directory}/a.srt") == "hash"
+        assert list(store._dir_records) == ["/media/three/"]
+        assert store._cached_records == 2  # noqa: PLR2004
+        assert store.get_hash("/media/one/b.srt") == "hash"
+
+
+def test_store_finds_known_content(tmp_path):
+    """Test that content and hardlinks are recognized across paths, only for the current pattern set."""
+    subtitle_file = tmp_path / "a.srt"
+    subtitle_file.write_text("content")
+    os.utime(subtitle_file, ns=(1_000_000_000, 1_000_000_000))
+
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.use_pattern_set("fingerprint1", [("nordvpn", 2)])
+        store.mark_processed(str(subtitle_file), "0123456789abcdef0123456789abcdef", subtitle_file.stat())
+        store.flush()
+
+        assert store.is_known_clean("0123456789abcdef0123456789abcdef")
+        assert not store.is_known_clean("ffffffffffffffffffffffffffffffff")
+        assert store.find_hardlink_hash(subtitle_file.stat()) == "0123456789abcdef0123456789abcdef"
+        stat_result = subtitle_file.stat()
+        other_device = types.SimpleNamespace(
+            st_ino=stat_result.st_ino,
+            st_dev=stat_result.st_dev + 1,
+            st_size=stat_result.st_size,
+            st_mtime_ns=stat_result.st_mtime_ns,
+        )
+        assert store.find_hardlink_hash(other_device) is None
+        known_contents = KnownContents(tmp_path / "test.db", store.pattern_set)
+        assert known_contents.is_known_clean("0123456789abcdef0123456789abcdef")
+
+        store.use_pattern_set("fingerprint2", [("nordvpn", 2), ("rarbg", 2)])
+        assert not store.is_known_clean("0123456789abcdef0123456789abcdef")
+        assert store.find_hardlink_hash(subtitle_file.stat()) is None
+
+
+def test_store_records_hash_algorithm(tmp_path):
+    """Test that each row keeps the algorithm of its hash, with MD5 stored as before."""
+    md5_hash = "0123456789abcdef0123456789abcdef"
+    sha256_hash = "sha256:" + "ab" * 32
+
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.mark_processed("/media/old.srt", md5_hash)
+        store.mark_processed("/media/new.srt", sha256_hash)
+        store.flush()
+
+        rows = dict(store.conn.execute("SELECT name, hash_algorithm FROM processed_files"))
+        assert rows == {"old.srt": None, "new.srt": "sha256"}
+        assert store.get_hash("/media/old.srt") == md5_hash
+        assert store.get_hash("/media/new.srt") == sha256_hash
+        assert store.is_known_clean(sha256_hash)
+        assert not store.is_known_clean("blake2b:" + "ab" * 32)
+
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.get_record("/media/new.srt").file_hash == sha256_hash
+
+
+def test_store_work_queue(tmp_path):
+    """Test that queued files come back in order until they are dequeued, across connections."""
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.enqueue([("/media/a.srt", None), ("/media/b.srt", None), ("/media/c.srt", None)])
+
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        queued = store.get_queued(2)
+        assert [path for _, path in queued] == ["/media/a.srt", "/media/b.srt"]
+        store.dequeue(queue_id for queue_id, _ in queued)
+        assert [path for _, path in store.get_queued(2)] == ["/media/c.srt"]
+
+
+def test_store_work_queue_priorities(tmp_path):
+    """Test that queued files come back by decreasing priority, those without one last."""
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.enqueue([("/media/a.srt", None), ("/media/b.srt", 1), ("/media/c.srt", 5), ("/media/d.srt", 1)])
+
+        queued = store.get_queued(3)
+        assert [path for _, path in queued] == ["/media/c.srt", "/media/b.srt", "/media/d.srt"]
+        store.dequeue([queued[1][0]])
+        assert [path for _, path in store.get_queued(10)] == ["/media/c.srt", "/media/d.srt", "/media/a.srt"]
+
+
+def test_store_taken_files_leave_queue_with_their_record(tmp_path):
+    """Test that a taken file leaves the queue in the same commit as its record, and is not handed out again."""
+    with ProcessedFilesStore(tmp_path / "test.db", batch_size=2) as store:
+        store.enqueue([("/media/a.srt", None), ("/media/b.srt", None)])
+        store.flush()
+        store.take("/media/a.srt", store.get_queued(1)[0][0])
+        assert [path for _, path in store.get_queued(10)] == ["/media/b.srt"]
+
+        # A new file is only queued if it is still being processed at a commit
+        store.take("/media/c.srt")
+        store.take("/media/d.srt")
+        store.finish("/media/d.srt")
+        store.mark_processed("/media/a.srt", "hash")
+        assert (_count_queued_rows(tmp_path / "test.db"), _count_committed_rows(tmp_path / "test.db")) == (2, 0)
+        store.flush()
+        assert (_count_queued_rows(tmp_path / "test.db"), _count_committed_rows(tmp_path / "test.db")) == (2, 1)
+        store.mark_processed("/media/c.srt", "hash")
+        assert (_count_queued_rows(tmp_path / "test.db"), _count_committed_rows(tmp_path / "test.db")) == (2, 1)
+        store.flush()
+        assert (_count_queued_rows(tmp_path / "test.db"), _count_committed_rows(tmp_path / "test.db")) == (1, 2)
+
+        store.take("/media/b.srt", store.get_queued(1)[0][0])
+        store.finish("/media/b.srt")
+        assert store.get_queued(10) == []
+
+
+def test_run_lock_is_exclusive(tmp_path):
+    """Test that only one run at a time gets the lock of a database."""
+    with run_lock(tmp_path / "test.db") as locked:
+        assert locked
+        with run_lock(tmp_path / "test.db") as second:
+            assert not second
+    with run_lock(tmp_path / "test.db") as locked:
+        assert locked
+
+
+def test_store_merge(tmp_path):
+    """Test that merging copies the records of another database and keeps the newest of each file."""
+    with ProcessedFilesStore(tmp_path / "shard.db") as shard:
+        shard.use_pattern_set("fingerprint2", [("rarbg", 2)])
+        shard.mark_processed("/media/a.srt", "new")
+        shard.mark_processed("/media/show/b.srt", "hash")
+        shard.conn.execute("UPDATE processed_files SET processed_at = 200")
+
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        first = store.use_pattern_set("fingerprint1", [("nordvpn", 2)])
+        store.mark_processed("/media/a.srt", "old")
+        store.mark_processed("/media/c.srt", "hash")
+        store.conn.execute("UPDATE processed_files SET processed_at = 100")
+
+        assert store.merge(tmp_path / "shard.db") == 2  # noqa: PLR2004
+        assert store.get_hash("/media/a.srt") == "new"
+        assert store.get_hash("/media/show/b.srt") == "hash"
+        assert store.get_hash("/media/c.srt") == "hash"
+        second = store.use_pattern_set("fingerprint2", [("rarbg", 2)])
+        assert second != first
+        assert store.get_record("/media/show/b.srt").pattern_set == second
+
+        store.mark_processed("/media/a.srt", "newest")
+        store.conn.execute("UPDATE processed_files SET processed_at = 300 WHERE name = 'a.srt'")
+        store.merge(tmp_path / "shard.db")
+        assert store.get_hash("/media/a.srt") == "newest"
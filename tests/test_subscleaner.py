@@ -1,23 +1,54 @@
 """Unit tests for the subscleaner module."""
 
+import argparse
+import codecs
+import json
 import os
-from io import StringIO
+import stat
+import subprocess
+import sys
+from io import BytesIO, StringIO
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 
 import pysrt
 import pytest
 
+from src.subscleaner.hashing import DEFAULT_HASH_ALGORITHM
+from src.subscleaner.matcher import pattern_key, pattern_set_fingerprint
+from src.subscleaner.output import configure_output
+from src.subscleaner.srt import iter_cue_blocks
+from src.subscleaner.stats import RunStats
+from src.subscleaner.store import ProcessedFilesStore, run_lock
 from src.subscleaner.subscleaner import (
+    _clean_subtitle_file_with_stats,
+    AD_PATTERNS,
+    AD_PATTERNS_FINGERPRINT,
+    ENCODING_SAMPLE_SIZE,
     contains_ad,
+    detect_encoding,
+    get_content_hash,
     get_encoding,
+    get_file_hash,
+    in_shard,
     main,
+    may_contain_ad,
     process_subtitle_file,
+    parse_shard,
     process_subtitle_files,
+    read_subtitle_paths,
     remove_ad_lines,
+    split_priority,
 )
 
 
+@pytest.fixture(autouse=True)
+def _restore_output():
+    """Undo the output settings main() applies."""
+    yield
+    configure_output(buffer_size=1)
+
+
 @pytest.fixture
 def sample_srt_content():
     """Return a sample SRT content."""
@@ -36,9 +67,9 @@ Another sample subtitle.
 
 
 @pytest.fixture
-def mock_db_path():
-    """Return a mock database path."""
-    return Path("/tmp/test_subscleaner.db")
+def mock_db_path(tmp_path):
+    """Return a throwaway database path."""
+    return tmp_path / "test_subscleaner.db"
 
 
 @pytest.fixture
@@ -138,10 +169,11 @@ def test_process_subtitle_file_no_modification(tmpdir, sample_srt_content, mock_
         mock_db_path (Path): A mock database path.
     """
     subtitle_file = create_sample_srt_file(tmpdir, sample_srt_content)
-    with (
-        patch("src.subscleaner.subscleaner.is_file_processed", return_value=True),
-    ):
-        assert process_subtitle_file(subtitle_file, mock_db_path) is False
+    with ProcessedFilesStore(mock_db_path) as store:
+        store.mark_processed(subtitle_file, get_file_hash(Path(subtitle_file)))
+
+    assert process_subtitle_file(subtitle_file, mock_db_path) is False
+    assert Path(subtitle_file).read_text() == sample_srt_content
 
 
 def test_process_subtitle_file_with_modification(tmpdir, sample_srt_content, mock_db_path):
@@ -155,9 +187,8 @@ def test_process_subtitle_file_with_modification(tmpdir, sample_srt_content, moc
     """
     subtitle_file = create_sample_srt_file(tmpdir, sample_srt_content)
     with (
-        patch("src.subscleaner.subscleaner.is_file_processed", return_value=False),
-        patch("src.subscleaner.subscleaner.get_file_hash", return_value="mockhash"),
-        patch("src.subscleaner.subscleaner.mark_file_processed"),
+        patch("src.subscleaner.subscleaner.get_content_hash", return_value="mockhash"),
+        patch.object(ProcessedFilesStore, "mark_processed"),
     ):
         assert process_subtitle_file(subtitle_file, mock_db_path) is True
 
@@ -186,13 +217,35 @@ def test_process_subtitle_files(tmpdir, sample_srt_content, mock_db_path):
     subtitle_file1 = create_sample_srt_file(tmpdir, sample_srt_content)
     subtitle_file2 = create_sample_srt_file(tmpdir, "1\n00:00:01,000 --> 00:00:03,000\nThis is a sample subtitle.")
 
-    with patch("src.subscleaner.subscleaner.process_subtitle_file", side_effect=[True, False]) as mock_process:
-        modified_subtitle_files = process_subtitle_files([subtitle_file1, subtitle_file2], mock_db_path)
+    with (
+        ProcessedFilesStore(mock_db_path) as store,
+        patch("src.subscleaner.subscleaner.process_subtitle_file", side_effect=[True, False]) as mock_process,
+    ):
+        modified_subtitle_files = process_subtitle_files([subtitle_file1, subtitle_file2], store)
         assert modified_subtitle_files == [subtitle_file1]
-        assert mock_process.call_count == 2  # noqa PLR2004
-        # Check that db_path was passed to process_subtitle_file
-        mock_process.assert_any_call(subtitle_file1, mock_db_path, False, False)
-        mock_process.assert_any_call(subtitle_file2, mock_db_path, False, False)
+        assert mock_process.call_count == 2  # noqa: PLR2004
+        # Check that the open store was passed to process_subtitle_file
+        mock_process.assert_any_call(subtitle_file1, store, False, False, False, ANY)
+        mock_process.assert_any_call(subtitle_file2, store, False, False, False, ANY)
+
+
+def _reading_files(read_files, modified_files):
+    """
+    Build a stand-in for process_subtitle_files that reads its lazy input while the store is still open.
+
+    Args:
+        read_files (list[str]): Receives the subtitle file paths read.
+        modified_files (list[str]): The paths returned as modified.
+
+    Returns:
+        Callable: The stand-in.
+    """
+
+    def process_subtitle_files_stub(subtitle_files, *_args):
+        read_files.extend(subtitle_files)
+        return modified_files
+
+    return process_subtitle_files_stub
 
 
 def test_main_no_modification(tmpdir, sample_srt_content):
@@ -208,12 +261,19 @@ def test_main_no_modification(tmpdir, sample_srt_content):
     with (
         patch("sys.stdin", StringIO(subtitle_file)),
         patch("sys.argv", ["subscleaner"]),
-        patch("src.subscleaner.subscleaner.get_db_path", return_value=Path("/tmp/test_db.db")),
-        patch("src.subscleaner.subscleaner.init_db"),
-        patch("src.subscleaner.subscleaner.process_subtitle_files", return_value=[]) as mock_process_subtitle_files,
+        patch("src.subscleaner.subscleaner.get_db_path", return_value=Path(tmpdir) / "test.db"),
+        patch(
+            "src.subscleaner.subscleaner.process_subtitle_files",
+            side_effect=_reading_files(read_files := [], []),
+        ) as mock_process_subtitle_files,
     ):
         main()
-        mock_process_subtitle_files.assert_called_once_with([subtitle_file], Path("/tmp/test_db.db"), False, False)
+        mock_process_subtitle_files.assert_called_once()
+        _, store, *options = mock_process_subtitle_files.call_args.args
+        assert read_files == [subtitle_file]
+        assert isinstance(store, ProcessedFilesStore)
+        assert store.hash_algorithm == DEFAULT_HASH_ALGORITHM
+        assert options == [False, False, False, 1, ANY]
 
 
 def test_main_with_modification(tmpdir, sample_srt_content):
@@ -229,15 +289,19 @@ def test_main_with_modification(tmpdir, sample_srt_content):
     with (
         patch("sys.stdin", StringIO(subtitle_file)),
         patch("sys.argv", ["subscleaner"]),
-        patch("src.subscleaner.subscleaner.get_db_path", return_value=Path("/tmp/test_db.db")),
-        patch("src.subscleaner.subscleaner.init_db"),
+        patch("src.subscleaner.subscleaner.get_db_path", return_value=Path(tmpdir) / "test.db"),
         patch(
             "src.subscleaner.subscleaner.process_subtitle_files",
-            return_value=[subtitle_file],
+            side_effect=_reading_files(read_files := [], [subtitle_file]),
         ) as mock_process_subtitle_files,
     ):
         main()
-        mock_process_subtitle_files.assert_called_once_with([subtitle_file], Path("/tmp/test_db.db"), False, False)
+        mock_process_subtitle_files.assert_called_once()
+        _, store, *options = mock_process_subtitle_files.call_args.args
+        assert read_files == [subtitle_file]
+        assert isinstance(store, ProcessedFilesStore)
+        assert store.hash_algorithm == DEFAULT_HASH_ALGORITHM
+        assert options == [False, False, False, 1, ANY]
 
 
 def test_process_files_with_special_chars(special_chars_temp_dir, sample_srt_content, mock_db_path):
@@ -252,9 +316,8 @@ def test_process_files_with_special_chars(special_chars_temp_dir, sample_srt_con
     special_files = create_special_char_files(special_chars_temp_dir, sample_srt_content)
 
     with (
-        patch("src.subscleaner.subscleaner.is_file_processed", return_value=False),
-        patch("src.subscleaner.subscleaner.get_file_hash", return_value="mockhash"),
-        patch("src.subscleaner.subscleaner.mark_file_processed"),
+        patch("src.subscleaner.subscleaner.get_content_hash", return_value="mockhash"),
+        patch.object(ProcessedFilesStore, "mark_processed"),
     ):
         modified_files = process_subtitle_files(special_files, mock_db_path)
 
@@ -298,9 +361,8 @@ def test_process_subtitle_file_with_special_chars(special_chars_temp_dir, sample
         f.write(sample_srt_content)
 
     with (
-        patch("src.subscleaner.subscleaner.is_file_processed", return_value=False),
-        patch("src.subscleaner.subscleaner.get_file_hash", return_value="mockhash"),
-        patch("src.subscleaner.subscleaner.mark_file_processed"),
+        patch("src.subscleaner.subscleaner.get_content_hash", return_value="mockhash"),
+        patch.object(ProcessedFilesStore, "mark_processed"),
     ):
         assert process_subtitle_file(str(file_path), mock_db_path) is True
 
@@ -324,9 +386,8 @@ def test_file_saving_with_special_chars(special_chars_temp_dir, sample_srt_conte
     special_files = create_special_char_files(special_chars_temp_dir, sample_srt_content)
 
     with (
-        patch("src.subscleaner.subscleaner.is_file_processed", return_value=False),
-        patch("src.subscleaner.subscleaner.get_file_hash", return_value="mockhash"),
-        patch("src.subscleaner.subscleaner.mark_file_processed"),
+        patch("src.subscleaner.subscleaner.get_content_hash", return_value="mockhash"),
+        patch.object(ProcessedFilesStore, "mark_processed"),
     ):
         modified_files = process_subtitle_files(special_files, mock_db_path)
 
@@ -358,12 +419,988 @@ def test_main_with_special_chars(special_chars_temp_dir, sample_srt_content):
     with (
         patch("sys.stdin", StringIO(stdin_content)),
         patch("sys.argv", ["subscleaner"]),
-        patch("src.subscleaner.subscleaner.get_db_path", return_value=Path("/tmp/test_db.db")),
-        patch("src.subscleaner.subscleaner.init_db"),
+        patch("src.subscleaner.subscleaner.get_db_path", return_value=special_chars_temp_dir / "test.db"),
         patch(
             "src.subscleaner.subscleaner.process_subtitle_files",
-            return_value=[str(file_path)],
+            side_effect=_reading_files(read_files := [], [str(file_path)]),
         ) as mock_process_subtitle_files,
     ):
         main()
-        mock_process_subtitle_files.assert_called_once_with([str(file_path)], Path("/tmp/test_db.db"), False, False)
+        mock_process_subtitle_files.assert_called_once()
+        _, store, *options = mock_process_subtitle_files.call_args.args
+        assert read_files == [str(file_path)]
+        assert isinstance(store, ProcessedFilesStore)
+        assert store.hash_algorithm == DEFAULT_HASH_ALGORITHM
+        assert options == [False, False, False, 1, ANY]
+
+
+def test_process_subtitle_file_skips_unchanged_metadata(tmpdir, sample_srt_content, mock_db_path):
+    """
+    Test that an unchanged file is skipped with a stat() call and only hashed in paranoid mode.
+
+    Args:
+        tmpdir (pytest.fixture): A temporary directory for creating the sample SRT file.
+        sample_srt_content (str): The sample SRT content.
+        mock_db_path (Path): A throwaway database path.
+    """
+    subtitle_file = create_sample_srt_file(tmpdir, sample_srt_content)
+    assert process_subtitle_file(subtitle_file, mock_db_path) is True
+    os.utime(subtitle_file, ns=(1_000_000_000, 1_000_000_000))
+
+    with patch("src.subscleaner.subscleaner.get_content_hash", wraps=get_content_hash) as mock_hash:
+        # The first pass refreshes the stored mtime, which was too recent to trust after saving
+        assert process_subtitle_file(subtitle_file, mock_db_path) is False
+        assert mock_hash.call_count == 1
+
+        assert process_subtitle_file(subtitle_file, mock_db_path) is False
+        assert mock_hash.call_count == 1
+
+        assert process_subtitle_file(subtitle_file, mock_db_path, paranoid=True) is False
+        assert mock_hash.call_count == 2  # noqa: PLR2004
+
+
+def test_process_subtitle_file_reads_file_once(tmpdir, sample_srt_content, mock_db_path):
+    """
+    Test that a modified file is read once and the stored hash matches what was written.
+
+    Args:
+        tmpdir (pytest.fixture): A temporary directory for creating the sample SRT file.
+        sample_srt_content (str): The sample SRT content.
+        mock_db_path (Path): A throwaway database path.
+    """
+    subtitle_file = create_sample_srt_file(tmpdir, sample_srt_content)
+
+    with patch.object(Path, "read_bytes", autospec=True, side_effect=Path.read_bytes) as mock_read:
+        assert process_subtitle_file(subtitle_file, mock_db_path) is True
+        assert mock_read.call_count == 1
+
+    with ProcessedFilesStore(mock_db_path) as store:
+        assert store.get_hash(subtitle_file) == get_file_hash(Path(subtitle_file))
+
+
+def test_process_subtitle_files_parallel_matches_serial(tmp_path, sample_srt_content):
+    """
+    Test that a worker pool modifies the same files and records the same hashes as a serial run.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and databases.
+        sample_srt_content (str): The sample SRT content.
+    """
+    clean_content = "1\n00:00:01,000 --> 00:00:03,000\nThis is a sample subtitle.\n"
+    results = {}
+    for jobs in (1, 2):
+        media_dir = tmp_path / f"media_{jobs}"
+        media_dir.mkdir()
+        subtitle_files = []
+        for index in range(10):
+            subtitle_file = media_dir / f"episode_{index}.srt"
+            subtitle_file.write_text(sample_srt_content if index % 3 == 0 else clean_content)
+            subtitle_files.append(str(subtitle_file))
+        subtitle_files.append(str(media_dir / "missing.srt"))
+
+        db_path = tmp_path / f"test_{jobs}.db"
+        modified_files = process_subtitle_files(subtitle_files, db_path, jobs=jobs)
+        with ProcessedFilesStore(db_path) as store:
+            hashes = [store.get_hash(subtitle_file) for subtitle_file in subtitle_files]
+        results[jobs] = ([Path(path).name for path in modified_files], hashes)
+
+    assert results[1] == results[2]
+    assert results[2][0] == ["episode_0.srt", "episode_3.srt", "episode_6.srt", "episode_9.srt"]
+
+
+def test_import_defers_heavy_work():
+    """Test that importing the module neither imports the heavy dependencies nor compiles the ad patterns."""
+    code = (
+        "import sys\n"
+        "from src.subscleaner import subscleaner\n"
+        "heavy = ('chardet', 'pysrt', 'appdirs', 'concurrent.futures', 'tempfile')\n"
+        "print([name for name in heavy if name in sys.modules])\n"
+        "print(subscleaner._ad_patterns.cache_info().currsize)\n"
+        "print(len(subscleaner.AD_PATTERNS) == len(subscleaner.AD_PATTERN_SOURCES))\n"
+    )
+    repo_root = Path(__file__).parent.parent
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=repo_root,
+    ).stdout
+    assert output.split("\n")[:3] == ["[]", "0", "True"]
+
+
+def test_main_jobs_output_is_in_order(tmp_path, sample_srt_content):
+    """
+    Test that with worker processes, the messages about a file come after the ones written before it was sent.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and database.
+        sample_srt_content (str): The sample SRT content.
+    """
+    subtitle_files = [tmp_path / f"episode{number}.srt" for number in range(4)]
+    for subtitle_file in subtitle_files:
+        subtitle_file.write_text(sample_srt_content)
+
+    output = subprocess.run(
+        [sys.executable, "-m", "src.subscleaner.subscleaner", "-v", "-j", "2", "--db-location", str(tmp_path / "db")],
+        input="".join(f"{subtitle_file}\n" for subtitle_file in subtitle_files),
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent.parent,
+    ).stdout.splitlines()
+
+    assert output[0] == "Starting script"
+    for subtitle_file in subtitle_files:
+        analyzing = output.index(f"Analyzing: {subtitle_file}")
+        saving = [index for index, line in enumerate(output) if line.startswith("Saving") and str(subtitle_file) in line]
+        assert analyzing < saving[0]
+
+
+@pytest.mark.parametrize(
+    "content, expected_encoding",
+    [
+        ("Plain ASCII subtitle".encode("ascii"), "utf-8"),
+        ("Subtítulos en español".encode("utf-8"), "utf-8"),
+        ("Subtítulos".encode("utf-8-sig"), "utf-8-sig"),
+        ("Subtítulos".encode("utf-16"), "utf-16"),
+        ("Subtítulos".encode("utf-32"), "utf-32"),
+    ],
+)
+def test_detect_encoding_fast_path(content, expected_encoding):
+    """
+    Test that BOMs and valid UTF-8 are recognized without running chardet.
+
+    Args:
+        content (bytes): The raw subtitle content.
+        expected_encoding (str): The expected encoding.
+    """
+    with patch("chardet.UniversalDetector") as mock_detector:
+        assert detect_encoding(content) == expected_encoding
+        mock_detector.assert_not_called()
+
+
+def test_detect_encoding_uses_hint_and_bounded_sample():
+    """Test that a working multi-byte hint skips chardet, and that chardet only sees a bounded prefix."""
+    with patch("chardet.UniversalDetector") as mock_detector:
+        assert detect_encoding("字幕の翻訳\n".encode("shift_jis") * 100, hint="shift_jis") == "shift_jis"
+        mock_detector.assert_not_called()
+
+    content = "Café crème, naïve façade. Voilà!\n".encode("cp1252") * 10_000
+    with patch("chardet.UniversalDetector.feed", autospec=True) as mock_feed:
+        detect_encoding(content, hint="utf-16")
+    assert sum(len(call.args[1]) for call in mock_feed.call_args_list) <= ENCODING_SAMPLE_SIZE
+
+
+def test_detect_encoding_checks_single_byte_hint():
+    """Test that a single-byte hint from a file in another language doesn't skip chardet."""
+    content = "¿Dónde está? Apóyanos, juegue Poker en Línea. Mañana será otro día.\n".encode("cp1252") * 50
+    assert detect_encoding(content, hint="cp1251").lower() in {"windows-1252", "iso-8859-1"}
+
+
+def test_process_subtitle_file_legacy_encoding(tmp_path, mock_db_path):
+    """
+    Test that a cp1252 file is cleaned without corrupting its non-ASCII characters.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle file.
+        mock_db_path (Path): A throwaway database path.
+    """
+    content = (
+        "1\n00:00:01,000 --> 00:00:03,000\nCafé crème, naïve façade. Voilà!\n\n"
+        "2\n00:00:04,000 --> 00:00:06,000\nSubtítulos por aRGENTeaM\n"
+    )
+    subtitle_file = tmp_path / "legacy.srt"
+    subtitle_file.write_bytes(content.encode("cp1252"))
+
+    assert process_subtitle_file(str(subtitle_file), mock_db_path) is True
+    cleaned = subtitle_file.read_bytes().decode("cp1252")
+    assert "Café crème, naïve façade. Voilà!" in cleaned
+    assert "aRGENTeaM" not in cleaned
+
+
+@pytest.mark.parametrize(
+    "stdin_content, null_delimited, expected_paths",
+    [
+        (" a.srt \nb.srt\n\na.srt\nc.srt", False, ["a.srt", "b.srt", "c.srt"]),
+        ("a.srt\0with\nnewline.srt\0a.srt\0 spaced .srt\0", True, ["a.srt", "with\nnewline.srt", " spaced .srt"]),
+        (b"a.srt\0b\xffad.srt\0", True, ["a.srt", os.fsdecode(b"b\xffad.srt")]),
+    ],
+)
+def test_read_subtitle_paths(stdin_content, null_delimited, expected_paths):
+    """
+    Test reading newline and NUL separated paths from text and binary streams, without duplicates.
+
+    Args:
+        stdin_content (str or bytes): The content of the stream.
+        null_delimited (bool): Whether paths are NUL separated.
+        expected_paths (list[str]): The expected paths.
+    """
+    stream = BytesIO(stdin_content) if isinstance(stdin_content, bytes) else StringIO(stdin_content)
+    assert list(read_subtitle_paths(stream, null_delimited)) == expected_paths
+
+
+def test_read_subtitle_paths_is_lazy():
+    """Test that paths are yielded before the stream is exhausted."""
+
+    def slow_stream():
+        yield "first.srt\n"
+        pytest.fail("The stream was read further than needed")
+
+    assert next(read_subtitle_paths(slow_stream())) == "first.srt"
+
+
+def test_shards_split_files():
+    """Test that every file belongs to exactly one shard, and that shards are of similar size."""
+    paths = [f"/media/show/episode{number}.srt" for number in range(300)]
+    shards = [[path for path in paths if in_shard(path, (number, 3))] for number in (1, 2, 3)]
+
+    assert sorted(path for shard in shards for path in shard) == sorted(paths)
+    assert all(len(shard) > 50 for shard in shards)  # noqa: PLR2004
+
+
+@pytest.mark.parametrize("value", ["2", "0/3", "4/3", "a/3", "1/0"])
+def test_parse_shard_rejects_invalid_values(value):
+    """
+    Test that malformed or out of range shards are rejected.
+
+    Args:
+        value (str): The --shard value.
+    """
+    assert parse_shard("2/3") == (2, 3)
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_shard(value)
+
+
+def test_main_shard_and_merge(tmp_path, sample_srt_content, capsys):
+    """
+    Test that shards clean their own files into their own database, and that merging them covers the library.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the library and databases.
+        sample_srt_content (str): The sample SRT content.
+        capsys (pytest.fixture): Captures the printed summary.
+    """
+    library = tmp_path / "library"
+    library.mkdir()
+    subtitle_files = [library / f"episode{number}.srt" for number in range(10)]
+    for subtitle_file in subtitle_files:
+        subtitle_file.write_text(sample_srt_content)
+
+    for number in (1, 2):
+        db_path = tmp_path / f"shard{number}.db"
+        argv = ["subscleaner", "--scan", str(library), "--shard", f"{number}/2", "--db-location", str(db_path)]
+        with patch("sys.stdin", StringIO("")), patch("sys.argv", argv):
+            main()
+        with ProcessedFilesStore(db_path) as store:
+            for subtitle_file in subtitle_files:
+                assert (store.get_hash(str(subtitle_file)) is not None) == in_shard(str(subtitle_file), (number, 2))
+
+    argv = ["subscleaner", "--db-location", str(tmp_path / "test.db")]
+    argv += ["--merge", str(tmp_path / "shard1.db"), "--merge", str(tmp_path / "shard2.db")]
+    with patch("sys.argv", argv):
+        main()
+
+    assert "Merged" in capsys.readouterr().out
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert all(store.get_hash(str(subtitle_file)) is not None for subtitle_file in subtitle_files)
+
+
+def test_main_scan(tmp_path, sample_srt_content):
+    """
+    Test that --scan finds and cleans subtitle files without reading stdin.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the library and database.
+        sample_srt_content (str): The sample SRT content.
+    """
+    library = tmp_path / "library" / "Season 01"
+    library.mkdir(parents=True)
+    subtitle_file = library / "episode.srt"
+    subtitle_file.write_text(sample_srt_content)
+
+    with (
+        patch("sys.stdin", StringIO("")),
+        patch("sys.argv", ["subscleaner", "--scan", str(tmp_path / "library"), "--prune-unchanged"]),
+        patch("src.subscleaner.subscleaner.get_db_path", return_value=tmp_path / "test.db"),
+    ):
+        main()
+
+    assert "OpenSubtitles" not in subtitle_file.read_text()
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.use_pattern_set(AD_PATTERNS_FINGERPRINT, [pattern_key(pattern) for pattern in AD_PATTERNS])
+        assert str(library) in store.get_scanned_dirs([str(tmp_path / "library")])
+
+
+def test_main_scan_lists_directories_with_failed_files_again(tmp_path, sample_srt_content):
+    """
+    Test that --prune-unchanged doesn't skip a directory whose file failed, so the file is retried.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the library and database.
+        sample_srt_content (str): The sample SRT content.
+    """
+    failing, working = tmp_path / "library" / "failing", tmp_path / "library" / "working"
+    for directory in (failing, working):
+        directory.mkdir(parents=True)
+        (directory / "episode.srt").write_text(sample_srt_content)
+        # Old enough for the directory to be pruned on its mtime
+        os.utime(directory, ns=(1_000_000_000, 1_000_000_000))
+    read_bytes = Path.read_bytes
+
+    def flaky_read_bytes(path):
+        if path.parent == failing:
+            raise OSError("Input/output error")
+        return read_bytes(path)
+
+    argv = ["subscleaner", "--scan", str(tmp_path / "library"), "--prune-unchanged", "--db-location"]
+    with patch("sys.argv", [*argv, str(tmp_path / "test.db")]), patch.object(Path, "read_bytes", flaky_read_bytes):
+        main()
+
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.use_pattern_set(AD_PATTERNS_FINGERPRINT, [pattern_key(pattern) for pattern in AD_PATTERNS])
+        scanned_dirs = store.get_scanned_dirs([str(tmp_path / "library")])
+    assert scanned_dirs[str(working)][0] == 1_000_000_000  # noqa: PLR2004
+    assert scanned_dirs[str(failing)][0] is None
+
+
+def test_main_gc(tmp_path, sample_srt_content, capsys):
+    """
+    Test that --gc forgets deleted subtitle files and keeps the others.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the library and database.
+        sample_srt_content (str): The sample SRT content.
+        capsys (pytest.fixture): Captures the printed summary.
+    """
+    kept = tmp_path / "kept.srt"
+    kept.write_text(sample_srt_content)
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.mark_processed(str(kept), "hash")
+        store.mark_processed(str(tmp_path / "deleted.srt"), "hash")
+
+    with patch("sys.argv", ["subscleaner", "--gc", "--db-location", str(tmp_path / "test.db")]):
+        main()
+
+    assert "Removed 1 entries of missing files" in capsys.readouterr().out
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.get_hash(str(kept)) == "hash"
+        assert store.get_hash(str(tmp_path / "deleted.srt")) is None
+
+
+def test_main_gc_while_another_run_holds_the_lock(tmp_path, capsys):
+    """
+    Test that --gc leaves the database alone while a run may still be recording files in it.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the database.
+        capsys (pytest.fixture): Captures the error.
+    """
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.mark_processed(str(tmp_path / "deleted.srt"), "hash")
+
+    argv = ["subscleaner", "--gc", "--db-location", str(tmp_path / "test.db")]
+    with run_lock(tmp_path / "test.db"), patch("sys.argv", argv):
+        main()
+
+    assert "not collecting garbage" in capsys.readouterr().out
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.get_hash(str(tmp_path / "deleted.srt")) == "hash"
+
+
+def test_process_subtitle_files_collects_stats(tmp_path, sample_srt_content):
+    """
+    Test that the run statistics match what happened to each file, with and without workers.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and databases.
+        sample_srt_content (str): The sample SRT content.
+    """
+    clean_content = "1\n00:00:01,000 --> 00:00:03,000\nThis is a sample subtitle.\n"
+    for jobs in (1, 2):
+        media_dir = tmp_path / f"media_{jobs}"
+        media_dir.mkdir()
+        (media_dir / "ads.srt").write_text(sample_srt_content)
+        (media_dir / "clean.srt").write_text(clean_content)
+        subtitle_files = [str(media_dir / "ads.srt"), str(media_dir / "clean.srt"), str(media_dir / "missing.srt")]
+
+        stats = RunStats()
+        process_subtitle_files(subtitle_files, tmp_path / f"test_{jobs}.db", jobs=jobs, stats=stats)
+
+        assert stats.counters["files_seen"] == 3  # noqa: PLR2004
+        assert stats.counters["files_missing"] == 1
+        assert stats.counters["skipped_prefilter"] == 1
+        assert stats.counters["parsed"] == 1
+        assert stats.counters["modified"] == 1
+        assert stats.counters["cues_removed"] == 1
+        assert stats.counters["bytes_read"] == len(sample_srt_content) + len(clean_content)
+        assert stats.counters["bytes_written"] == (media_dir / "ads.srt").stat().st_size
+        assert stats.stage_calls["parse"] == 1
+        assert stats.stage_calls["db_write"] == 2  # noqa: PLR2004
+        assert stats.wall_seconds > 0
+
+
+def test_main_writes_stats_json(tmp_path, sample_srt_content):
+    """
+    Test that --stats-json writes the run statistics.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle file, database and report.
+        sample_srt_content (str): The sample SRT content.
+    """
+    subtitle_file = tmp_path / "test.srt"
+    subtitle_file.write_text(sample_srt_content)
+    stats_file = tmp_path / "stats.json"
+    argv = ["subscleaner", "--db-location", str(tmp_path / "test.db"), "--stats", "--stats-json", str(stats_file)]
+
+    with (
+        patch("sys.argv", argv),
+        patch("sys.stdin", StringIO(f"{subtitle_file}\n")),
+        patch("sys.stdout", new_callable=StringIO) as stdout,
+    ):
+        main()
+
+    assert json.loads(stats_file.read_text())["counters"]["modified"] == 1
+    assert "cues_removed" in stdout.getvalue()
+
+
+@pytest.mark.parametrize(
+    "subtitle_text",
+    [
+        "1\r\n00:00:01,000 --> 00:00:03,000\r\nSubtitles   \r\nby someone\r\n",
+        "1\n00:00:01,000 --> 00:00:03,000\nOpenSubtitles\n",
+        "1\n00:00:01,000 --> 00:00:03,000\nNothing to see here.\n\n2\n00:00:04,000 --> 00:00:06,000\nAt all.\n",
+        "1\n00:00:01,000 --> 00:00:03,000\nThe subscenery was lovely\n",
+    ],
+)
+def test_may_contain_ad_agrees_with_cues(subtitle_text):
+    """
+    Test that the raw-text prefilter only rules out files whose cues contain no ad.
+
+    Args:
+        subtitle_text (str): The decoded subtitle file content.
+    """
+    cues_with_ads = [cue for cue in pysrt.from_string(subtitle_text) if contains_ad(cue.text)]
+    assert may_contain_ad(subtitle_text) is bool(cues_with_ads)
+
+
+def test_may_contain_ad_searches_large_files_in_pieces():
+    """Test that an ad is found in whichever piece of a large file holds its cue."""
+    cues = [f"{number}\n00:00:01,000 --> 00:00:03,000\nJust dialogue.\n" for number in range(1, 2000)]
+    ad_cue = "2000\n00:00:04,000 --> 00:00:06,000\nSubtitles   \nby someone\n"
+
+    with patch("src.subscleaner.srt.LINE_CHUNK_SIZE", 100):
+        assert may_contain_ad("\n".join(cues)) is False
+        assert may_contain_ad("\n".join([*cues, ad_cue])) is True
+        assert may_contain_ad("\n".join([*cues[:1000], ad_cue, *cues[1000:]])) is True
+
+
+def test_process_subtitle_file_skips_parsing_ad_free_files(tmpdir, mock_db_path):
+    """
+    Test that files without any ad text are recorded as processed without being parsed.
+
+    Args:
+        tmpdir (py.path.local): A temporary directory for the subtitle file.
+        mock_db_path (Path): The path to the temporary database.
+    """
+    subtitle_file = tmpdir.join("clean.srt")
+    subtitle_file.write("1\n00:00:01,000 --> 00:00:03,000\nThis is a sample subtitle.\n")
+
+    ad_file = tmpdir.join("ads.srt")
+    ad_file.write("1\n00:00:01,000 --> 00:00:03,000\nSubtitles by OpenSubtitles\n")
+
+    with patch("src.subscleaner.subscleaner.iter_cue_blocks", wraps=iter_cue_blocks) as mock_parse:
+        assert process_subtitle_file(str(subtitle_file), mock_db_path) is False
+        mock_parse.assert_not_called()
+        assert process_subtitle_file(str(ad_file), mock_db_path) is True
+        mock_parse.assert_called()
+
+    with ProcessedFilesStore(mock_db_path) as store:
+        assert store.get_hash(str(subtitle_file)) == get_file_hash(Path(subtitle_file))
+
+
+def test_process_subtitle_file_rewrites_only_ad_cues(tmp_path, mock_db_path):
+    """
+    Test that saving keeps the encoding, byte order, line endings and permissions of the original file.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle file.
+        mock_db_path (Path): The path to the temporary database.
+    """
+    text = (
+        "1\r\n00:00:01,000 --> 00:00:03,000\r\nSubtítulos por aRGENTeaM\r\n\r\n"
+        "2\r\n00:00:04,000 --> 00:00:06,000\r\n<i>Café</i>\r\n"
+    )
+    subtitle_file = tmp_path / "test.srt"
+    subtitle_file.write_bytes(codecs.BOM_UTF16_BE + text.encode("utf-16-be"))
+    mode = 0o640
+    subtitle_file.chmod(mode)
+
+    assert process_subtitle_file(str(subtitle_file), mock_db_path) is True
+
+    expected = "1\r\n00:00:04,000 --> 00:00:06,000\r\n<i>Café</i>\r\n"
+    assert subtitle_file.read_bytes() == codecs.BOM_UTF16_BE + expected.encode("utf-16-be")
+    assert stat.S_IMODE(subtitle_file.stat().st_mode) == mode
+    assert not list(tmp_path.glob(".test.srt.*"))
+
+
+def test_process_subtitle_files_keeps_hardlinks(tmp_path, sample_srt_content):
+    """
+    Test that cleaning a hardlinked file rewrites the shared inode instead of splitting the links.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and database.
+        sample_srt_content (str): The sample SRT content.
+    """
+    downloads, library = tmp_path / "downloads", tmp_path / "library"
+    downloads.mkdir()
+    library.mkdir()
+    (downloads / "episode.srt").write_text(sample_srt_content)
+    os.link(downloads / "episode.srt", library / "episode.srt")
+    inode = (downloads / "episode.srt").stat().st_ino
+
+    modified_files = process_subtitle_files(
+        [str(downloads / "episode.srt"), str(library / "episode.srt")],
+        tmp_path / "test.db",
+    )
+
+    assert modified_files == [str(downloads / "episode.srt")]
+    for subtitle_file in (downloads / "episode.srt", library / "episode.srt"):
+        assert subtitle_file.stat().st_ino == inode
+        assert subtitle_file.stat().st_nlink == 2  # noqa: PLR2004
+        assert "OpenSubtitles" not in subtitle_file.read_text()
+
+
+def test_save_in_read_only_directory_rewrites_in_place(tmp_path, sample_srt_content, mock_db_path):
+    """
+    Test that a file whose directory doesn't allow a temporary file is still cleaned, in place.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle file.
+        sample_srt_content (str): The sample SRT content.
+        mock_db_path (Path): The path to the temporary database.
+    """
+    subtitle_file = tmp_path / "test.srt"
+    subtitle_file.write_text(sample_srt_content)
+    inode = subtitle_file.stat().st_ino
+
+    with patch("tempfile.mkstemp", side_effect=PermissionError("Permission denied")):
+        assert process_subtitle_file(str(subtitle_file), mock_db_path) is True
+
+    assert subtitle_file.stat().st_ino == inode
+    assert "OpenSubtitles" not in subtitle_file.read_text()
+    assert "Another sample subtitle." in subtitle_file.read_text()
+
+
+def test_interrupted_save_keeps_original(tmp_path, sample_srt_content, mock_db_path):
+    """
+    Test that a failure while saving leaves the original file and no temporary file behind.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle file.
+        sample_srt_content (str): The sample SRT content.
+        mock_db_path (Path): The path to the temporary database.
+    """
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    subtitle_file = media_dir / "test.srt"
+    subtitle_file.write_text(sample_srt_content)
+
+    with (
+        patch("src.subscleaner.subscleaner.os.replace", side_effect=KeyboardInterrupt),
+        pytest.raises(KeyboardInterrupt),
+    ):
+        process_subtitle_file(str(subtitle_file), mock_db_path)
+
+    assert subtitle_file.read_text() == sample_srt_content
+    assert os.listdir(media_dir) == ["test.srt"]
+
+
+def test_process_subtitle_files_checks_only_new_patterns(tmp_path, sample_srt_content):
+    """
+    Test that files cleaned with an older pattern set are checked against the patterns added since.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and database.
+        sample_srt_content (str): The sample SRT content, whose ad only matches the OpenSubtitles pattern.
+    """
+    old_patterns = [pattern for pattern in AD_PATTERNS if pattern.pattern != r"\bOpenSubtitles\b"]
+    db_path = tmp_path / "test.db"
+    subtitle_files = []
+    for name in ("old_set.srt", "current_set.srt"):
+        subtitle_file = tmp_path / name
+        subtitle_file.write_text(sample_srt_content)
+        os.utime(subtitle_file, ns=(1_000_000_000, 1_000_000_000))
+        subtitle_files.append(subtitle_file)
+
+    with ProcessedFilesStore(db_path) as store:
+        store.use_pattern_set(pattern_set_fingerprint(old_patterns), [pattern_key(p) for p in old_patterns])
+        store.mark_processed(str(subtitle_files[0]), get_file_hash(subtitle_files[0]), subtitle_files[0].stat())
+        store.use_pattern_set(AD_PATTERNS_FINGERPRINT, [pattern_key(p) for p in AD_PATTERNS])
+        store.mark_processed(str(subtitle_files[1]), get_file_hash(subtitle_files[1]), subtitle_files[1].stat())
+
+    stats = RunStats()
+    modified_files = process_subtitle_files([str(path) for path in subtitle_files], db_path, stats=stats)
+
+    assert modified_files == [str(subtitle_files[0])]
+    assert stats.counters["pattern_upgrades"] == 1
+    assert stats.counters["skipped_metadata"] == 1
+    assert "OpenSubtitles" in subtitle_files[1].read_text()
+    with ProcessedFilesStore(db_path) as store:
+        current_set = store.use_pattern_set(AD_PATTERNS_FINGERPRINT, [pattern_key(p) for p in AD_PATTERNS])
+        assert store.get_record(str(subtitle_files[0])).pattern_set == current_set
+
+
+def test_process_subtitle_files_reads_hardlinks_once(tmp_path):
+    """
+    Test that a hardlink to a processed file is recorded without being read.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and database.
+    """
+    downloads = tmp_path / "downloads"
+    library = tmp_path / "library"
+    downloads.mkdir()
+    library.mkdir()
+    (downloads / "episode.srt").write_text("1\n00:00:01,000 --> 00:00:03,000\nThis is a sample subtitle.\n")
+    os.utime(downloads / "episode.srt", ns=(1_000_000_000, 1_000_000_000))
+    os.link(downloads / "episode.srt", library / "episode.srt")
+
+    stats = RunStats()
+    process_subtitle_files(
+        [str(downloads / "episode.srt"), str(library / "episode.srt")],
+        tmp_path / "test.db",
+        stats=stats,
+    )
+
+    assert stats.counters["skipped_hardlink"] == 1
+    assert stats.counters["bytes_read"] == (library / "episode.srt").stat().st_size
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.get_hash(str(library / "episode.srt")) == get_file_hash(library / "episode.srt")
+
+
+def test_process_subtitle_files_skips_known_clean_copies(tmp_path, sample_srt_content):
+    """
+    Test that a copy of content already found clean is not checked again, unless forced or paranoid.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and database.
+        sample_srt_content (str): The sample SRT content.
+    """
+    clean_content = "1\n00:00:01,000 --> 00:00:03,000\nThis is a sample subtitle.\n"
+    for collection in ("movies", "kids"):
+        (tmp_path / collection).mkdir()
+        (tmp_path / collection / "clean.srt").write_text(clean_content)
+        (tmp_path / collection / "ads.srt").write_text(sample_srt_content)
+    subtitle_files = [
+        str(tmp_path / collection / name) for collection in ("movies", "kids") for name in ("clean.srt", "ads.srt")
+    ]
+
+    stats = RunStats()
+    modified_files = process_subtitle_files(subtitle_files, tmp_path / "test.db", stats=stats)
+
+    # The cleaned copy of ads.srt is the same content as the second copy after cleaning, but not before
+    assert modified_files == [subtitle_files[1], subtitle_files[3]]
+    assert stats.counters["skipped_duplicate"] == 1
+    assert stats.counters["skipped_prefilter"] == 1
+
+    stats = RunStats()
+    process_subtitle_files(subtitle_files, tmp_path / "test.db", force=True, stats=stats)
+    assert stats.counters["skipped_duplicate"] == 0
+
+    for jobs in (1, 2):
+        stats = RunStats()
+        process_subtitle_files(subtitle_files, tmp_path / f"paranoid-{jobs}.db", paranoid=True, jobs=jobs, stats=stats)
+        assert stats.counters["skipped_duplicate"] == 0
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_process_subtitle_files_rehashes_md5_records(tmp_path, jobs):
+    """
+    Test that a file recorded with an MD5 hash is recognized and its record moved to the current algorithm.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle file and database.
+        jobs (int): Number of worker processes.
+    """
+    subtitle_file = tmp_path / "episode.srt"
+    subtitle_file.write_text("1\n00:00:01,000 --> 00:00:03,000\nThis is a sample subtitle.\n")
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.mark_processed(str(subtitle_file), get_file_hash(subtitle_file, "md5"))
+
+    stats = RunStats()
+    process_subtitle_files([str(subtitle_file)], tmp_path / "test.db", jobs=jobs, stats=stats)
+
+    assert stats.counters["skipped_hash"] == 1
+    assert stats.counters["rehashed"] == 1
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.get_hash(str(subtitle_file)) == get_file_hash(subtitle_file, DEFAULT_HASH_ALGORITHM)
+
+
+def test_main_json_log_format(tmp_path, sample_srt_content, capsys):
+    """
+    Test that --log-format json writes every message as a JSON line and --quiet keeps only problems.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and database.
+        sample_srt_content (str): The sample SRT content.
+        capsys (pytest.fixture): Captures the messages.
+    """
+    subtitle_file = tmp_path / "ads.srt"
+    subtitle_file.write_text(sample_srt_content)
+    stdin = StringIO(f"{subtitle_file}\n{tmp_path / 'missing.srt'}\n")
+    argv = ["subscleaner", "--log-format", "json", "--db-location", str(tmp_path / "test.db")]
+
+    with patch("sys.stdin", stdin), patch("sys.argv", argv):
+        main()
+
+    entries = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [entry["message"] for entry in entries if entry.get("path") == str(subtitle_file)] == [
+        "Removing: 2\n00:00:04,000 --> 00:00:06,000\nOpenSubtitles",
+        f"Saving {subtitle_file}",
+    ]
+    assert {"level": "warning", "path": str(tmp_path / "missing.srt")}.items() <= entries[2].items()
+    assert entries[-1]["message"] == "Done"
+
+    subtitle_file.write_text(sample_srt_content)
+    with patch("sys.stdin", StringIO(str(subtitle_file))), patch("sys.argv", [*argv, "--quiet", "--force"]):
+        main()
+    assert capsys.readouterr().out == ""
+
+
+def test_main_resumes_queued_files(tmp_path, sample_srt_content):
+    """
+    Test that files left in the work queue by an interrupted run are processed first, and the queue emptied.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and database.
+        sample_srt_content (str): The sample SRT content.
+    """
+    left_over, new = tmp_path / "left_over.srt", tmp_path / "new.srt"
+    for subtitle_file in (left_over, new):
+        subtitle_file.write_text(sample_srt_content)
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.enqueue([(str(left_over), None)])
+
+    with (
+        patch("sys.stdin", StringIO(f"{new}\n")),
+        patch("sys.argv", ["subscleaner", "--db-location", str(tmp_path / "test.db")]),
+        patch("src.subscleaner.subscleaner.process_subtitle_file", wraps=process_subtitle_file) as mock_process,
+    ):
+        main()
+
+    assert [call.args[0] for call in mock_process.call_args_list] == [str(left_over), str(new)]
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.get_queued(10) == []
+        assert store.get_hash(str(left_over)) is not None
+
+
+def test_main_resumes_queued_files_without_input(tmp_path, sample_srt_content):
+    """
+    Test that files left in the work queue by an interrupted run are processed even when stdin is empty.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle file and database.
+        sample_srt_content (str): The sample SRT content.
+    """
+    left_over = tmp_path / "left_over.srt"
+    left_over.write_text(sample_srt_content)
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.enqueue([(str(left_over), None)])
+
+    with (
+        patch("sys.stdin", StringIO("")),
+        patch("sys.argv", ["subscleaner", "--db-location", str(tmp_path / "test.db")]),
+    ):
+        main()
+
+    assert "OpenSubtitles" not in left_over.read_text()
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.get_queued(10) == []
+
+
+def test_main_cleans_files_as_their_paths_arrive(tmp_path, sample_srt_content):
+    """
+    Test that each file is cleaned before the next path is read, so cleaning starts while find is still running.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and database.
+        sample_srt_content (str): The sample SRT content.
+    """
+    first, second = tmp_path / "first.srt", tmp_path / "second.srt"
+    for subtitle_file in (first, second):
+        subtitle_file.write_text(sample_srt_content)
+
+    def slow_stdin():
+        yield f"{first}\n"
+        assert "OpenSubtitles" not in first.read_text()
+        yield f"{second}\n"
+
+    with (
+        patch("sys.stdin", slow_stdin()),
+        patch("sys.argv", ["subscleaner", "--db-location", str(tmp_path / "test.db")]),
+    ):
+        main()
+
+    assert "OpenSubtitles" not in second.read_text()
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.get_queued(10) == []
+
+
+def test_main_jobs_uses_one_pool(tmp_path, sample_srt_content):
+    """
+    Test that the work queue hands all the files of a run to a single pool of worker processes.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and database.
+        sample_srt_content (str): The sample SRT content.
+    """
+    import concurrent.futures
+
+    subtitle_files = [tmp_path / f"episode{number}.srt" for number in range(3)]
+    for subtitle_file in subtitle_files:
+        subtitle_file.write_text(sample_srt_content)
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        store.enqueue([(str(subtitle_files[0]), None)])
+
+    with (
+        patch("sys.stdin", StringIO("".join(f"{subtitle_file}\n" for subtitle_file in subtitle_files[1:]))),
+        patch("sys.argv", ["subscleaner", "--db-location", str(tmp_path / "test.db"), "-j", "2"]),
+        patch("src.subscleaner.subscleaner.QUEUE_CHUNK_SIZE", 1),
+        patch("concurrent.futures.ProcessPoolExecutor", wraps=concurrent.futures.ProcessPoolExecutor) as mock_pool,
+    ):
+        main()
+
+    mock_pool.assert_called_once()
+    assert all("OpenSubtitles" not in subtitle_file.read_text() for subtitle_file in subtitle_files)
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.get_queued(10) == []
+
+
+def _clean_or_die(subtitle_file, *args):
+    """Run a worker task, except on crash.srt, where the worker dies as if the kernel killed it."""
+    if subtitle_file.name == "crash.srt":
+        os._exit(1)
+    return _clean_subtitle_file_with_stats(subtitle_file, *args)
+
+
+def test_main_jobs_survives_a_dead_worker(tmp_path, sample_srt_content, capsys):
+    """
+    Test that a worker process dying only fails the file it was working on, and the run carries on.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and database.
+        sample_srt_content (str): The sample SRT content.
+        capsys (pytest.fixture): Captures the error.
+    """
+    subtitle_files = [tmp_path / f"episode{number}.srt" for number in range(30)]
+    subtitle_files.insert(5, tmp_path / "crash.srt")
+    for subtitle_file in subtitle_files:
+        subtitle_file.write_text(sample_srt_content)
+
+    with (
+        patch("sys.stdin", StringIO("".join(f"{subtitle_file}\n" for subtitle_file in subtitle_files))),
+        patch("sys.argv", ["subscleaner", "--db-location", str(tmp_path / "test.db"), "-j", "2"]),
+        patch("src.subscleaner.subscleaner._clean_subtitle_file_with_stats", _clean_or_die),
+    ):
+        main()
+
+    assert f"Error processing {tmp_path / 'crash.srt'}" in capsys.readouterr().out
+    assert "OpenSubtitles" in (tmp_path / "crash.srt").read_text()
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        assert store.get_queued(10) == []
+        assert store.get_hash(str(tmp_path / "crash.srt")) is None
+        for subtitle_file in subtitle_files:
+            if subtitle_file.name != "crash.srt":
+                assert "OpenSubtitles" not in subtitle_file.read_text()
+                assert store.get_hash(str(subtitle_file)) is not None
+
+
+@pytest.mark.parametrize(
+    ("line", "expected"),
+    [
+        ("10\t/media/a.srt", ("/media/a.srt", 10)),
+        ("-1\t/media/tab\tin name.srt", ("/media/tab\tin name.srt", -1)),
+        ("/media/a.srt", ("/media/a.srt", None)),
+        ("high\t/media/a.srt", ("high\t/media/a.srt", None)),
+    ],
+)
+def test_split_priority(line, expected):
+    """
+    Test that lines starting with a priority are split, and other lines kept whole without one.
+
+    Args:
+        line (str): The line read from stdin.
+        expected (tuple[str, Optional[int]]): The expected path and priority.
+    """
+    assert split_priority(line) == expected
+
+
+@pytest.mark.parametrize("order", ["newest", "priority"])
+def test_main_order(tmp_path, sample_srt_content, order):
+    """
+    Test that every file is queued before the first one is processed, then processed by decreasing priority.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle files and database.
+        sample_srt_content (str): The sample SRT content.
+        order (str): The --order choice.
+    """
+    subtitle_files = [tmp_path / f"episode{number}.srt" for number in range(3)]
+    for age, subtitle_file in zip((300, 100, 200), subtitle_files):
+        subtitle_file.write_text(sample_srt_content)
+        os.utime(subtitle_file, (1_700_000_000 - age, 1_700_000_000 - age))
+    stdin = "".join(f"{1000 - age}\t{path}\n" for age, path in zip((300, 100, 200), subtitle_files))
+    if order == "newest":
+        stdin = "".join(f"{path}\n" for path in subtitle_files)
+
+    with (
+        patch("sys.stdin", StringIO(stdin)),
+        patch("sys.argv", ["subscleaner", "--db-location", str(tmp_path / "test.db"), "--order", order]),
+        patch("src.subscleaner.subscleaner.QUEUE_CHUNK_SIZE", 1),
+        patch("src.subscleaner.subscleaner.process_subtitle_file", wraps=process_subtitle_file) as mock_process,
+    ):
+        main()
+
+    processed = [call.args[0] for call in mock_process.call_args_list]
+    assert processed == [str(subtitle_files[1]), str(subtitle_files[2]), str(subtitle_files[0])]
+
+
+def test_main_order_priority_needs_stdin(tmp_path):
+    """
+    Test that --order priority is rejected with --scan, which has no priorities to read.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory to scan.
+    """
+    with (
+        patch("sys.argv", ["subscleaner", "--scan", str(tmp_path), "--order", "priority"]),
+        pytest.raises(SystemExit),
+    ):
+        main()
+
+
+@pytest.mark.parametrize("on_locked", ["exit", "join"])
+def test_main_while_another_run_holds_the_lock(tmp_path, sample_srt_content, on_locked):
+    """
+    Test that a run started during another one leaves the files alone, only queueing them when joining.
+
+    Exiting doesn't even open the database, so it can't write to it while the running run uses it.
+
+    Args:
+        tmp_path (pytest.fixture): A temporary directory for the subtitle file and database.
+        sample_srt_content (str): The sample SRT content.
+        on_locked (str): The --on-locked choice.
+    """
+    subtitle_file = tmp_path / "ads.srt"
+    subtitle_file.write_text(sample_srt_content)
+    argv = ["subscleaner", "--db-location", str(tmp_path / "test.db"), "--on-locked", on_locked]
+
+    with run_lock(tmp_path / "test.db"), patch("sys.stdin", StringIO(str(subtitle_file))), patch("sys.argv", argv):
+        main()
+
+    assert subtitle_file.read_text() == sample_srt_content
+    assert (tmp_path / "test.db").exists() == (on_locked == "join")
+    with ProcessedFilesStore(tmp_path / "test.db") as store:
+        queued = [path for _, path in store.get_queued(10)]
+    assert queued == ([str(subtitle_file)] if on_locked == "join" else [])
@@ -0,0 +1,64 @@
+"""Unit tests for the watcher module."""
+
+import os
+import sys
+import time
+
+import pytest
+
+from src.subscleaner.watcher import SubtitleWatcher
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+
+DEBOUNCE = 0.2
+
+
+def _wait_for_files(watcher, timeout=5.0):
+    """Poll the watcher until it reports files or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ready = watcher.poll(0.05)
+        if ready:
+            return ready
+    return []
+
+
+def test_watcher_reports_written_subtitle_files(tmp_path):
+    """Test that new subtitle files are reported once, after the debounce delay, and other files are ignored."""
+    with SubtitleWatcher([str(tmp_path)], debounce=DEBOUNCE) as watcher:
+        (tmp_path / "notes.txt").write_text("not a subtitle")
+        written_at = time.monotonic()
+        (tmp_path / "episode.SRT").write_text("subtitle")
+
+        assert _wait_for_files(watcher) == [str(tmp_path / "episode.SRT")]
+        assert time.monotonic() - written_at >= DEBOUNCE
+        assert watcher.poll(DEBOUNCE * 2) == []
+
+
+def test_watcher_debounces_files_being_written(tmp_path):
+    """Test that a file still receiving writes is not reported until it has been left alone."""
+    with SubtitleWatcher([str(tmp_path)], debounce=DEBOUNCE) as watcher:
+        with open(tmp_path / "a.srt", "w") as f:
+            for _ in range(5):
+                f.write("partial\n")
+                f.flush()
+                assert watcher.poll(DEBOUNCE / 2) == []
+
+        assert _wait_for_files(watcher) == [str(tmp_path / "a.srt")]
+
+
+def test_watcher_follows_new_directories(tmp_path):
+    """Test that files in a directory moved into the tree are reported, and later files in it too."""
+    root = tmp_path / "library"
+    root.mkdir()
+    download = tmp_path / "download" / "Season 01"
+    download.mkdir(parents=True)
+    (download / "episode_1.srt").write_text("subtitle")
+
+    with SubtitleWatcher([str(root)], debounce=DEBOUNCE) as watcher:
+        os.rename(download, root / "Season 01")
+        assert _wait_for_files(watcher) == [str(root / "Season 01" / "episode_1.srt")]
+
+        (root / "Season 01" / "episode_2.srt").write_text("subtitle")
+        assert _wait_for_files(watcher) == [str(root / "Season 01" / "episode_2.srt")]
+        assert watcher.watched_dirs == 2  # noqa: PLR2004